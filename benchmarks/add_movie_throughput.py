@@ -0,0 +1,171 @@
+"""
+Write-heavy throughput of POST /api/playlists/<id>/add-movie/ on each
+database backend.
+
+Every backend runs in a fresh subprocess with DB_ENGINE set. The child creates
+a throwaway test database, the way the test runner would. For SQLite that is a
+temporary file, so threads contend on real file locks. For PostgreSQL it is
+test_<DB_NAME>, which needs a local server, the DB_* settings and a role
+allowed to CREATE DATABASE. Worker threads then add distinct movies to a
+shared set of playlists through the full request stack, each with its own
+pooled (or SQLite) connection.
+
+    python -m benchmarks.add_movie_throughput [--backends sqlite,postgres] [--threads 8]
+        [--ops 200] [--playlists 20] [--json results.json]
+
+The other settings are loaded like manage.py does, so the .env it reads must
+be present.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+
+def run_child(threads, ops, playlist_count):
+    """Entry point for the measuring subprocess; prints one JSON result"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'moviememo_backend.settings')
+    import django
+    django.setup()
+    from django.conf import settings
+    from django.db import connection, connections
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+
+    settings.DEBUG = False  # Don't keep every query in connection.queries
+    setup_test_environment()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if connection.vendor == 'sqlite':
+            connection.settings_dict['TEST']['NAME'] = os.path.join(tmp, 'benchmark.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            result = run_workload(threads, ops, playlist_count, Client, connections)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    result['vendor'] = connection.vendor
+    print(json.dumps(result))
+
+
+def run_workload(threads, ops, playlist_count, client_class, connections):
+    from django.db.models import Sum
+    from playlists.models import Playlists
+    from users.models import CustomUser
+
+    user = CustomUser.objects.create(email='bench@example.com', uid='bench', username='bench')
+    playlist_ids = [
+        Playlists.objects.create(name=f'Playlist {i}', user=user).id
+        for i in range(playlist_count)
+    ]
+
+    latencies = []
+    errors = {}
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(threads + 1)
+
+    def worker(worker_id):
+        client = client_class(raise_request_exception=False)
+        own_latencies = []
+        own_errors = {}
+        start_barrier.wait()
+        for i in range(ops):
+            playlist_id = playlist_ids[(worker_id + i) % len(playlist_ids)]
+            started = time.perf_counter()
+            try:
+                response = client.post(
+                    f'/api/playlists/{playlist_id}/add-movie/',
+                    {'imdb_id': f'{worker_id + 1:03d}{i:05d}'},
+                    content_type='application/json'
+                )
+                outcome = None if response.status_code == 200 else f'HTTP {response.status_code}'
+            except Exception as e:
+                outcome = type(e).__name__
+            own_latencies.append(time.perf_counter() - started)
+            if outcome:
+                own_errors[outcome] = own_errors.get(outcome, 0) + 1
+        connections.close_all()
+        with lock:
+            latencies.extend(own_latencies)
+            for outcome, count in own_errors.items():
+                errors[outcome] = errors.get(outcome, 0) + count
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    start_barrier.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    succeeded = len(latencies) - sum(errors.values())
+    stored = Playlists.objects.aggregate(total=Sum('movie_count'))['total'] or 0
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': elapsed,
+        'requests_per_second': len(latencies) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000,
+        'mean_ms': statistics.mean(latencies) * 1000,
+        # Every successful add must be reflected in the denormalized counts
+        'counts_consistent': stored == succeeded,
+    }
+
+
+def measure(backend, threads, ops, playlists):
+    env = dict(os.environ, DB_ENGINE=backend)
+    completed = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.add_movie_throughput', '--child',
+         '--threads', str(threads), '--ops', str(ops), '--playlists', str(playlists)],
+        capture_output=True, text=True, env=env
+    )
+    if completed.returncode != 0:
+        return {'failed': completed.stderr.strip().splitlines()[-1] if completed.stderr else 'unknown error'}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', default='sqlite,postgres', help='Comma-separated DB_ENGINE values')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--ops', type=int, default=200, help='Requests per thread')
+    parser.add_argument('--playlists', type=int, default=20)
+    parser.add_argument('--json', help='Write results to this file')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.threads, args.ops, args.playlists)
+        return
+
+    results = {
+        backend: measure(backend, args.threads, args.ops, args.playlists)
+        for backend in args.backends.split(',')
+    }
+
+    print(f"{'backend':<10} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7} {'counts ok':>10}")
+    for backend, stats in results.items():
+        if 'failed' in stats:
+            print(f"{backend:<10} failed: {stats['failed']}")
+            continue
+        print(f"{backend:<10} {stats['requests_per_second']:>8.0f} {stats['p50_ms']:>8.1f} "
+              f"{stats['p95_ms']:>8.1f} {sum(stats['errors'].values()):>7} {str(stats['counts_consistent']):>10}")
+        for outcome, count in stats['errors'].items():
+            print(f"{'':<10} {count} x {outcome}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""
+Sustained concurrent connections against the read endpoints, served three
+ways by the same server (uvicorn, one worker):
+
+    wsgi        moviememo_backend.wsgi under uvicorn's WSGI interface
+    asgi        moviememo_backend.asgi with the sync DRF views (ASYNC_VIEWS off)
+    asgi-async  moviememo_backend.asgi with the async views (ASYNC_VIEWS on)
+
+For each deployment and each --connections level, that many keep-alive
+connections send requests back to back for --duration seconds. The requests
+rotate through get_playlist, get_user_playlists, get_public_user,
+get_username_user, check_user_exists and check_user_username_exists over a
+sample of the dataset (see manage.py generate_dataset). The response cache
+is replaced with a dummy one, so every request reaches the database, unless
+--response-cache is given.
+
+    python -m benchmarks.async_views [--deployments wsgi,asgi,asgi-async]
+        [--connections 16,64,256] [--duration 10] [--server-env KEY=VALUE]
+        [--json results.json]
+
+The servers load the settings like manage.py does, so the .env it reads must
+be present. SQLite serializes writers, not readers, but still opens a
+connection per request thread; DB_ENGINE=postgres with the pool is closer
+to production.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+from benchmarks.load import free_port, git_commit, percentile
+
+DEPLOYMENTS = {
+    'wsgi': (['moviememo_backend.wsgi:application', '--interface', 'wsgi'], {}),
+    'asgi': (['moviememo_backend.asgi:application'], {'ASYNC_VIEWS': 'False'}),
+    'asgi-async': (['moviememo_backend.asgi:application'], {'ASYNC_VIEWS': 'True'}),
+}
+
+
+def start_server(deployment, server_env):
+    arguments, env = DEPLOYMENTS[deployment]
+    port = free_port()
+    env = dict(os.environ, DEBUG='False', ALLOWED_HOSTS='127.0.0.1,localhost', **env, **server_env)
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', *arguments, '--host', '127.0.0.1', '--port', str(port),
+         '--no-access-log', '--log-level', 'warning'],
+        env=env
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f'The {deployment} server exited during startup')
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/api/users/check/x/').close()
+            return server, port
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit(f'The {deployment} server did not start within 60s')
+
+
+def read_paths(port, sample):
+    """Request paths for the read endpoints, over the newest playlists and their owners"""
+    paths = []
+    url = f'http://127.0.0.1:{port}/api/playlists/all/?page_size=100'
+    while url and len(paths) < sample * 6:
+        with urllib.request.urlopen(url) as response:
+            page = json.loads(response.read())
+        for playlist in page['playlists']:
+            user = playlist['user']
+            paths += [
+                f"/api/playlists/{playlist['id']}/",
+                f"/api/playlists/user/{user['uid']}/",
+                f"/api/users/{user['uid']}/",
+                f"/api/users/username/{user['username']}/",
+                f"/api/users/check/{user['uid']}/",
+                f"/api/users/check/username/{user['username']}/",
+            ]
+        url = page['next']
+    if not paths:
+        raise SystemExit('The database has no playlists; run manage.py generate_dataset first')
+    return paths
+
+
+async def keep_alive_connection(port, paths, offset, deadline, latencies, errors):
+    """Send requests on one connection until the deadline, reconnecting if it drops"""
+    reader = writer = None
+    i = offset
+    while time.monotonic() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n\r\n'.encode())
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            headers = {}
+            while (line := await reader.readline()) not in (b'\r\n', b''):
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            await reader.readexactly(int(headers.get('content-length', 0)))
+            if headers.get('connection', '').lower() == 'close':
+                writer.close()
+                writer = None
+        except (OSError, IndexError, ValueError, asyncio.IncompleteReadError) as e:
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            if writer is not None:
+                writer.close()
+            writer = None
+            continue
+        latencies.append(time.perf_counter() - started)
+        if status != 200:
+            errors[f'HTTP {status}'] = errors.get(f'HTTP {status}', 0) + 1
+    if writer is not None:
+        writer.close()
+
+
+async def sustain(port, paths, connections, duration):
+    latencies = []
+    errors = {}
+    deadline = time.monotonic() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        keep_alive_connection(port, paths, n * len(paths) // connections, deadline, latencies, errors)
+        for n in range(connections)
+    ))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': elapsed,
+        'requests_per_second': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000 if latencies else None,
+        'p95_ms': percentile(latencies, 0.95) * 1000 if latencies else None,
+        'p99_ms': percentile(latencies, 0.99) * 1000 if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--deployments', default=','.join(DEPLOYMENTS), help=f"Comma-separated: {', '.join(DEPLOYMENTS)}")
+    parser.add_argument('--connections', default='16,64,256', help='Comma-separated concurrent connection counts')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per connection count')
+    parser.add_argument('--sample', type=int, default=200, help='Playlists (and their owners) to spread requests over')
+    parser.add_argument('--response-cache', action='store_true', help='Keep the configured response cache')
+    parser.add_argument('--server-env', action='append', default=[], metavar='KEY=VALUE',
+                        help='Extra environment for the servers')
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    server_env = dict(item.split('=', 1) for item in args.server_env)
+    if not args.response_cache:
+        server_env.setdefault('CACHE_BACKEND', 'django.core.cache.backends.dummy.DummyCache')
+    levels = [int(level) for level in args.connections.split(',')]
+
+    results = {
+        'commit': git_commit(),
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'duration': args.duration,
+        'server_env': server_env,
+        'deployments': {},
+    }
+    for deployment in args.deployments.split(','):
+        server, port = start_server(deployment, server_env)
+        try:
+            paths = read_paths(port, args.sample)
+            asyncio.run(sustain(port, paths, min(levels), 1))  # Warm up connections and imports
+            results['deployments'][deployment] = {
+                str(connections): asyncio.run(sustain(port, paths, connections, args.duration))
+                for connections in levels
+            }
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f"{'deployment':<12} {'conns':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for deployment, by_level in results['deployments'].items():
+        for connections, stats in by_level.items():
+            if not stats['requests']:
+                print(f"{deployment:<12} {connections:>6} no successful requests: {stats['errors']}")
+                continue
+            print(f"{deployment:<12} {connections:>6} {stats['requests_per_second']:>8.0f} {stats['p50_ms']:>8.1f} "
+                  f"{stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f} {sum(stats['errors'].values()):>7}")
+            for outcome, count in sorted(stats['errors'].items()):
+                print(f"{'':<12} {'':>6} {count} x {outcome}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
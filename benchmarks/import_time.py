@@ -0,0 +1,99 @@
+"""
+Measure the cold-start import cost of the WSGI and ASGI entry points with
+python -X importtime.
+
+Each run is a fresh interpreter that imports the entry point and then loads
+the URLconf, which is what the first request of a new worker does. The
+settings are loaded like manage.py does, so the .env it reads must be present.
+
+    python -m benchmarks.import_time [--runs 5] [--top 15] [--json results.json] [--max-ms 400]
+
+With --max-ms the command exits non-zero when either entry point's median
+import time goes over the threshold, so it can run as a regression check.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ENTRY_POINTS = ('moviememo_backend.wsgi', 'moviememo_backend.asgi')
+
+# Libraries that should only be loaded once a request actually needs them
+LAZY_MODULES = ('PIL', 'pillow_heif', 'boto3', 'botocore', 's3transfer')
+
+
+def import_once(entry_point):
+    """
+    Import entry_point in a fresh interpreter.
+    Returns {module: (self us, cumulative us)} for every module imported.
+    """
+    code = f'import {entry_point}\nfrom django.urls import get_resolver\nget_resolver().url_patterns'
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='moviememo_backend.settings')
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        check=True, capture_output=True, text=True, env=env
+    ).stderr
+
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def measure(entry_point, runs):
+    samples = [import_once(entry_point) for _ in range(runs)]
+    # Every module's self time adds up to the whole import, nested or not
+    totals = [sum(self_us for self_us, _ in modules.values()) / 1000 for modules in samples]
+    last = samples[-1]
+    return {
+        'median_ms': statistics.median(totals),
+        'min_ms': min(totals),
+        'modules': len(last),
+        'lazy_modules_loaded': sorted(
+            name for name in last if name.split('.')[0] in LAZY_MODULES and '.' not in name
+        ),
+        'slowest': [
+            {'module': name, 'cumulative_ms': cumulative / 1000}
+            for name, (_, cumulative) in sorted(last.items(), key=lambda item: -item[1][1])
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='Slowest modules to list per entry point')
+    parser.add_argument('--json', help='Write results to this file')
+    parser.add_argument('--max-ms', type=float, help='Fail if a median import time exceeds this')
+    args = parser.parse_args()
+
+    results = {}
+    for entry_point in ENTRY_POINTS:
+        stats = measure(entry_point, args.runs)
+        stats['slowest'] = stats['slowest'][:args.top]
+        results[entry_point] = stats
+
+        print(f"{entry_point}: median {stats['median_ms']:.1f} ms, min {stats['min_ms']:.1f} ms, "
+              f"{stats['modules']} modules")
+        loaded = ', '.join(stats['lazy_modules_loaded']) or 'none'
+        print(f"  lazy libraries loaded at startup: {loaded}")
+        for row in stats['slowest']:
+            print(f"  {row['cumulative_ms']:>8.1f} ms  {row['module']}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.max_ms is not None:
+        over = [name for name, stats in results.items() if stats['median_ms'] > args.max_ms]
+        if over:
+            raise SystemExit(f"Over the {args.max_ms:.0f} ms budget: {', '.join(over)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,479 @@
+"""
+Load test every route in users/urls.py and playlists/urls.py over HTTP.
+
+Unless --url points at a running server, one is started with
+manage.py runserver. It runs with DEBUG off and QUERY_INSTRUMENTATION on, so
+every response carries a Server-Timing header with its query count. Picture
+uploads are stored in a temporary directory (LOCAL_MEDIA_ROOT), not in R2.
+--server-env passes further settings, e.g. DB_ENGINE=postgres or
+CACHE_BACKEND=django.core.cache.backends.dummy.DummyCache.
+
+The database should already hold a dataset, e.g. from
+manage.py generate_dataset. Reads are spread over a sample of its newest
+users and playlists. Writes use users and playlists that the run creates
+itself, and the last phase deletes those playlists again. Each endpoint is
+driven in its own phase at --concurrency, in dependency order. Latency
+percentiles, throughput, errors and the query count per endpoint are
+printed and written to --json. Pass an earlier file as --compare to see
+what changed between commits.
+
+    python -m benchmarks.load [--url http://127.0.0.1:8000] [--concurrency 8]
+        [--requests 200] [--endpoints get_playlist,add_movie_to_playlist]
+        [--server-env KEY=VALUE] [--json results.json] [--compare previous.json]
+
+When the server is started here, the settings are loaded like manage.py
+does, so the .env it reads must be present.
+"""
+import argparse
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from io import BytesIO
+
+# In dependency order: later phases use what earlier ones created
+ENDPOINTS = [
+    'create_user',
+    'get_public_user',
+    'get_username_user',
+    'check_user_exists',
+    'check_user_username_exists',
+    'get_all_users',
+    'export_users',
+    'upload_profile_picture',
+    'get_profile_picture_job',
+    'change_username',
+    'create_playlist',
+    'get_user_playlists',
+    'get_all_playlists',
+    'export_playlists',
+    'get_playlist',
+    'update_playlist',
+    'add_movie_to_playlist',
+    'bulk_update_playlist_movies',
+    'remove_movie_from_playlist',
+    'delete_playlist',
+]
+
+# Fraction of --requests for endpoints that are far heavier than the rest
+SHARES = {
+    'export_users': 0.02,
+    'export_playlists': 0.02,
+    'upload_profile_picture': 0.25,
+    'get_profile_picture_job': 0.25,
+}
+
+QUERY_COUNT = re.compile(r'db;[^,]*desc="(\d+) queries"')
+TIMING = re.compile(r'(\w+);dur=([\d.]+)')
+
+
+class Call:
+    """One request to make, and what to do with its JSON response"""
+
+    def __init__(self, method, path, body=None, files=None, then=None):
+        self.method = method
+        self.path = path
+        self.body = body
+        self.files = files
+        self.then = then
+
+    def request(self, base_url):
+        headers = {}
+        data = None
+        if self.files:
+            boundary = uuid.uuid4().hex
+            data = multipart(boundary, self.files)
+            headers['Content-Type'] = f'multipart/form-data; boundary={boundary}'
+        elif self.body is not None:
+            data = json.dumps(self.body).encode()
+            headers['Content-Type'] = 'application/json'
+        return urllib.request.Request(base_url + self.path, data=data, headers=headers, method=self.method)
+
+
+def multipart(boundary, files):
+    parts = []
+    for field, (filename, content, content_type) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'.encode() + content + b'\r\n'
+        )
+    return b''.join(parts) + f'--{boundary}--\r\n'.encode()
+
+
+def picture_bytes():
+    """A small PNG photo-like enough to go through the whole conversion"""
+    from PIL import Image
+    gradient = Image.linear_gradient('L').resize((640, 480))
+    image = Image.merge('RGB', (gradient, Image.effect_noise((640, 480), 64), gradient))
+    buffer = BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class LoadTest:
+    """Builds the calls for each endpoint and keeps what the run has created"""
+
+    def __init__(self, base_url, requests, sample):
+        self.base_url = base_url
+        self.requests = requests
+        self.tag = uuid.uuid4().hex[:6]
+        self.movie_prefix = f'9{int(self.tag, 16) % 10000:04d}'
+        self.users = []  # (uid, username) from the dataset
+        self.playlists = []  # (id, owner uid, [imdb_id, ...]) from the dataset
+        self.new_users = []
+        self.new_playlists = []
+        self.added_movies = []  # (playlist id, imdb_id)
+        self.jobs = []
+        self.movie_serial = 0
+        self.lock = threading.Lock()
+        self.discover(sample)
+
+    def fetch(self, call):
+        with urllib.request.urlopen(call.request(self.base_url)) as response:
+            payload = json.loads(response.read())
+        if call.then:
+            call.then(payload)
+        return payload
+
+    def discover(self, sample):
+        """Sample the newest users and playlists through the list endpoints"""
+        url = '/api/users/all/?page_size=100'
+        while url and len(self.users) < sample:
+            page = self.fetch(Call('GET', url))
+            self.users += [(user['uid'], user['username']) for user in page['users']]
+            url = page['next'] and page['next'].replace(self.base_url, '')
+        url = '/api/playlists/all/?page_size=100'
+        while url and len(self.playlists) < sample:
+            page = self.fetch(Call('GET', url))
+            self.playlists += [
+                (playlist['id'], playlist['user']['uid'], [movie['imdb_id'] for movie in playlist['movies']])
+                for playlist in page['playlists']
+            ]
+            url = page['next'] and page['next'].replace(self.base_url, '')
+        if not self.users or not self.playlists:
+            raise SystemExit('The database has no users or playlists; run manage.py generate_dataset first')
+
+    def count(self, endpoint):
+        return max(1, int(self.requests * SHARES.get(endpoint, 1)))
+
+    def pick(self, items, i):
+        return items[i * 7919 % len(items)]  # Spread consecutive requests over the sample
+
+    def next_imdb_id(self):
+        with self.lock:
+            self.movie_serial += 1
+            return f'{self.movie_prefix}{self.movie_serial:05d}'
+
+    def need(self, attribute, count, endpoint):
+        """Create what a phase needs, untimed, if earlier phases were skipped"""
+        missing = count - len(getattr(self, attribute))
+        if missing > 0:
+            for call in getattr(self, endpoint)(missing):
+                self.fetch(call)
+
+    # Users
+
+    def create_user(self, count):
+        start = len(self.new_users)
+        return [
+            Call('POST', '/api/users/create/', {
+                'email': f'lt{self.tag}{n}@example.com', 'uid': f'load-{self.tag}-{n}', 'username': f'lt{self.tag}{n}'
+            }, then=lambda payload: self.new_users.append((payload['user']['uid'], payload['user']['username'])))
+            for n in range(start, start + count)
+        ]
+
+    def get_public_user(self, count):
+        return [Call('GET', f'/api/users/{self.pick(self.users, i)[0]}/') for i in range(count)]
+
+    def get_username_user(self, count):
+        return [Call('GET', f'/api/users/username/{self.pick(self.users, i)[1]}/') for i in range(count)]
+
+    def check_user_exists(self, count):
+        return [Call('GET', f'/api/users/check/{self.pick(self.users, i)[0]}/') for i in range(count)]
+
+    def check_user_username_exists(self, count):
+        return [Call('GET', f'/api/users/check/username/{self.pick(self.users, i)[1]}/') for i in range(count)]
+
+    def get_all_users(self, count):
+        return [Call('GET', '/api/users/all/') for _ in range(count)]
+
+    def export_users(self, count):
+        return [Call('GET', '/api/users/export/') for _ in range(count)]
+
+    def upload_profile_picture(self, count):
+        self.need('new_users', 1, 'create_user')
+        picture = picture_bytes()
+        return [
+            Call('PUT', f'/api/users/{self.pick(self.new_users, i)[1]}/profile-picture/',
+                 files={'profile_picture': ('picture.png', picture, 'image/png')},
+                 then=lambda payload: self.jobs.append(payload['job']['id']))
+            for i in range(count)
+        ]
+
+    def get_profile_picture_job(self, count):
+        self.need('jobs', 1, 'upload_profile_picture')
+        return [Call('GET', f'/api/users/profile-picture/jobs/{self.pick(self.jobs, i)}/') for i in range(count)]
+
+    def change_username(self, count):
+        # A username can only change once every 30 days, so every call needs its own user
+        self.need('new_users', count, 'create_user')
+        return [
+            Call('PUT', f'/api/users/{uid}/change_username/', {'new_username': f'lr{self.tag}{n}'})
+            for n, (uid, _) in enumerate(self.new_users[:count])
+        ]
+
+    # Playlists
+
+    def create_playlist(self, count):
+        self.need('new_users', 1, 'create_user')
+        return [
+            Call('POST', f'/api/playlists/create/{self.pick(self.new_users, i)[0]}/', {'name': f'Load {i}'},
+                 then=lambda payload: self.new_playlists.append(payload['playlist']['id']))
+            for i in range(count)
+        ]
+
+    def get_user_playlists(self, count):
+        return [Call('GET', f'/api/playlists/user/{self.pick(self.playlists, i)[1]}/') for i in range(count)]
+
+    def get_all_playlists(self, count):
+        return [Call('GET', '/api/playlists/all/') for _ in range(count)]
+
+    def export_playlists(self, count):
+        return [Call('GET', '/api/playlists/export/') for _ in range(count)]
+
+    def get_playlist(self, count):
+        return [Call('GET', f'/api/playlists/{self.pick(self.playlists, i)[0]}/') for i in range(count)]
+
+    def update_playlist(self, count):
+        self.need('new_playlists', 1, 'create_playlist')
+        return [
+            Call('PUT', f'/api/playlists/{self.pick(self.new_playlists, i)}/update/', {'description': f'Update {i}'})
+            for i in range(count)
+        ]
+
+    def add_movie_to_playlist(self, count):
+        self.need('new_playlists', 1, 'create_playlist')
+        calls = []
+        for i in range(count):
+            playlist_id, imdb_id = self.pick(self.new_playlists, i), self.next_imdb_id()
+            calls.append(Call(
+                'POST', f'/api/playlists/{playlist_id}/add-movie/', {'imdb_id': imdb_id},
+                then=lambda payload, added=(playlist_id, imdb_id): self.added_movies.append(added)
+            ))
+        return calls
+
+    def bulk_update_playlist_movies(self, count):
+        self.need('new_playlists', 1, 'create_playlist')
+        return [
+            Call('POST', f'/api/playlists/{self.pick(self.new_playlists, i)}/movies/bulk/', {
+                'add': [self.next_imdb_id() for _ in range(5)], 'remove': [],
+            })
+            for i in range(count)
+        ]
+
+    def remove_movie_from_playlist(self, count):
+        self.need('added_movies', count, 'add_movie_to_playlist')
+        removable = self.added_movies[:count]
+        del self.added_movies[:count]
+        return [
+            Call('DELETE', f'/api/playlists/{playlist_id}/remove-movie/{imdb_id}/')
+            for playlist_id, imdb_id in removable
+        ]
+
+    def delete_playlist(self, count):
+        self.need('new_playlists', count, 'create_playlist')
+        doomed = self.new_playlists[:count]
+        del self.new_playlists[:count]
+        return [Call('DELETE', f'/api/playlists/{playlist_id}/delete/') for playlist_id in doomed]
+
+
+def timed_call(base_url, call):
+    """Make one request; returns (seconds, HTTP status or error name, Server-Timing)"""
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(call.request(base_url)) as response:
+            body = response.read()
+            outcome, server_timing = response.status, response.headers.get('Server-Timing')
+    except urllib.error.HTTPError as e:
+        e.read()
+        outcome, server_timing = e.code, e.headers.get('Server-Timing')
+        body = None
+    except OSError as e:
+        outcome, server_timing, body = type(e).__name__, None, None
+    elapsed = time.perf_counter() - started
+    if call.then and body is not None:
+        call.then(json.loads(body))
+    return elapsed, outcome, server_timing
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_phase(load_test, endpoint, concurrency):
+    calls = getattr(load_test, endpoint)(load_test.count(endpoint))
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda call: timed_call(load_test.base_url, call), calls))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(seconds for seconds, _, _ in results)
+    errors = {}
+    queries = []
+    durations = {}
+    for _, outcome, server_timing in results:
+        if not (isinstance(outcome, int) and outcome < 400):
+            errors[str(outcome)] = errors.get(str(outcome), 0) + 1
+        if server_timing:
+            match = QUERY_COUNT.search(server_timing)
+            if match:
+                queries.append(int(match.group(1)))
+            for name, duration in TIMING.findall(server_timing):
+                durations.setdefault(name, []).append(float(duration))
+
+    return {
+        'requests': len(results),
+        'errors': errors,
+        'seconds': elapsed,
+        'requests_per_second': len(results) / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'mean_ms': sum(latencies) / len(latencies) * 1000,
+        # None when the server doesn't send Server-Timing
+        'queries_mean': sum(queries) / len(queries) if queries else None,
+        'queries_max': max(queries) if queries else None,
+        **{f'{name}_ms_mean': sum(values) / len(values) for name, values in durations.items()},
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(media_root, server_env, log):
+    port = free_port()
+    env = dict(
+        os.environ,
+        DEBUG='False',
+        ALLOWED_HOSTS='127.0.0.1,localhost',
+        QUERY_INSTRUMENTATION='True',
+        LOCAL_MEDIA_ROOT=media_root,
+        **server_env,
+    )
+    server = subprocess.Popen(
+        [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{port}', '--noreload'],
+        env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit('The server exited during startup')
+        try:
+            urllib.request.urlopen(f'{base_url}/api/users/all/?page_size=1').close()
+            return server, base_url
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit('The server did not start within 60s')
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True)
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit.stdout.strip() + ('-dirty' if dirty.stdout.strip() else '')
+
+
+def print_results(results, baseline=None):
+    print(f"{'endpoint':<28} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'errors':>7}")
+    for endpoint, stats in results['endpoints'].items():
+        queries = '-' if stats['queries_mean'] is None else f"{stats['queries_mean']:.1f}"
+        print(f"{endpoint:<28} {stats['requests_per_second']:>7.0f} {stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} "
+              f"{stats['p99_ms']:>8.1f} {queries:>8} {sum(stats['errors'].values()):>7}")
+        previous = (baseline or {}).get('endpoints', {}).get(endpoint)
+        if previous:
+            changes = []
+            for key in ('requests_per_second', 'p50_ms', 'p95_ms', 'p99_ms'):
+                if previous[key]:
+                    changes.append(f'{key} {(stats[key] - previous[key]) / previous[key] * 100:+.0f}%')
+            if stats['queries_mean'] != previous['queries_mean']:
+                changes.append(f"queries {previous['queries_mean']} -> {stats['queries_mean']}")
+            print(f"{'':<28} vs {baseline.get('commit')}: {', '.join(changes)}")
+        for outcome, count in sorted(stats['errors'].items()):
+            print(f"{'':<28} {count} x {outcome}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Base URL of a running server; by default one is started')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+    parser.add_argument('--sample', type=int, default=500, help='Dataset users and playlists to spread reads over')
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help='Comma-separated URL names')
+    parser.add_argument('--server-env', action='append', default=[], metavar='KEY=VALUE',
+                        help='Extra environment for the started server')
+    parser.add_argument('--server-log', default=os.devnull, help='Where the started server logs')
+    parser.add_argument('--json', help='Write results to this file')
+    parser.add_argument('--compare', help='Results file of an earlier run to compare against')
+    args = parser.parse_args()
+
+    endpoints = args.endpoints.split(',')
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+    server_env = dict(item.split('=', 1) for item in args.server_env)
+
+    with tempfile.TemporaryDirectory() as media_root, open(args.server_log, 'ab') as log:
+        server = None
+        base_url = args.url and args.url.rstrip('/')
+        if not base_url:
+            server, base_url = start_server(media_root, server_env, log)
+        try:
+            load_test = LoadTest(base_url, args.requests, args.sample)
+            results = {
+                'commit': git_commit(),
+                'started_at': datetime.now(timezone.utc).isoformat(),
+                'concurrency': args.concurrency,
+                'requests': args.requests,
+                'server': args.url or 'runserver',
+                'server_env': server_env,
+                'endpoints': {
+                    endpoint: run_phase(load_test, endpoint, args.concurrency)
+                    # Keep the dependency order whatever order they were given in
+                    for endpoint in ENDPOINTS if endpoint in endpoints
+                },
+            }
+        finally:
+            if server:
+                server.terminate()
+                server.wait()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Compare the profile picture pipeline in users/images.py against the
+original full-resolution decode on large JPEG, PNG and HEIC sources.
+
+Every conversion runs in a fresh subprocess so peak RSS (VmHWM, which
+unlike ru_maxrss is reset on exec) is measured per run. Linux only.
+
+    python -m benchmarks.profile_picture [--runs 3] [--json results.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+FIXTURES = {
+    # name: (format, size)
+    'jpeg_48mp': ('JPEG', (8000, 6000)),
+    'png_24mp': ('PNG', (6000, 4000)),
+    'heic_12mp': ('HEIF', (4032, 3024)),
+}
+
+
+def legacy_convert(data):
+    """The conversion upload_profile_picture used to run inline"""
+    from PIL import Image
+    try:
+        from pillow_heif import register_heif_opener
+        register_heif_opener()
+    except ImportError:
+        pass
+
+    image = Image.open(BytesIO(data))
+    if image.mode in ("RGBA", "P"):
+        image = image.convert("RGBA")
+    else:
+        image = image.convert("RGB")
+    image = image.resize((200, 200), Image.Resampling.LANCZOS)
+    buffer = BytesIO()
+    image.save(buffer, format="WEBP", quality=85, optimize=True)
+    return buffer.getvalue()
+
+
+def make_fixture(path, image_format, size):
+    """Write a noisy gradient so encoders can't collapse the image to nothing"""
+    from PIL import Image
+    if image_format == 'HEIF':
+        try:
+            from pillow_heif import register_heif_opener
+            register_heif_opener()
+        except ImportError:
+            return False
+
+    width, height = size
+    gradient = Image.linear_gradient('L').resize(size)
+    noise = Image.effect_noise(size, 64)
+    image = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    image.save(path, format=image_format, quality=90)
+    return True
+
+
+def run_once(pipeline, path):
+    """Entry point for the measuring subprocess"""
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if pipeline == 'legacy':
+        convert = legacy_convert
+    else:
+        from users.images import convert_profile_picture
+
+        def convert(data):
+            # Only the 200px size, to match what the legacy pipeline produced
+            return convert_profile_picture(data, sizes=(200,))
+
+    start = time.perf_counter()
+    convert(data)
+    elapsed = time.perf_counter() - start
+    peak_kb = peak_rss_kb()
+    print(json.dumps({'seconds': elapsed, 'peak_rss_mb': peak_kb / 1024}))
+
+
+def peak_rss_kb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1])
+    return 0
+
+
+def measure(pipeline, path, runs):
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.profile_picture', '--child', pipeline, path],
+            check=True, capture_output=True, text=True
+        ).stdout
+        samples.append(json.loads(output))
+    return {
+        'median_ms': statistics.median(s['seconds'] for s in samples) * 1000,
+        'peak_rss_mb': max(s['peak_rss_mb'] for s in samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--json', help='Write results to this file')
+    parser.add_argument('--child', nargs=2, metavar=('PIPELINE', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_once(*args.child)
+        return
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, (image_format, size) in FIXTURES.items():
+            path = os.path.join(tmp, name)
+            if not make_fixture(path, image_format, size):
+                print(f'{name}: skipped (pillow_heif not installed)')
+                continue
+            results[name] = {
+                pipeline: measure(pipeline, path, args.runs)
+                for pipeline in ('legacy', 'current')
+            }
+
+    print(f"{'fixture':<12} {'pipeline':<8} {'median ms':>10} {'peak RSS MB':>12}")
+    for name, pipelines in results.items():
+        for pipeline, stats in pipelines.items():
+            print(f"{name:<12} {pipeline:<8} {stats['median_ms']:>10.1f} {stats['peak_rss_mb']:>12.1f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Render a get_all_playlists page with each renderer: DRF's JSONRenderer (the
+old default), ORJSONRenderer and MessagePackRenderer (see
+moviememo_backend/renderers.py).
+
+The page is read from the database once, newest playlists first, so run
+manage.py generate_dataset beforehand; only the rendering is timed. The
+settings are loaded like manage.py does, so the .env it reads must be
+present.
+
+    python -m benchmarks.renderers [--playlists 1000] [--runs 20] [--json results.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+
+def playlists_page(count):
+    """get_all_playlists output for one page of count playlists"""
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+    from moviememo_backend.pagination import KeysetPagination
+    from playlists.models import Playlists
+    from playlists.serializers import PlaylistSerializer
+
+    paginator = KeysetPagination()
+    paginator.max_page_size = count
+    request = Request(APIRequestFactory().get('/api/playlists/all/', {'page_size': count}))
+    playlists = paginator.paginate_queryset(Playlists.objects.for_serializer(), request)
+    if not playlists:
+        raise SystemExit('The database has no playlists; run manage.py generate_dataset first')
+    serializer = PlaylistSerializer(playlists, many=True)
+    return paginator.get_paginated_response(serializer.data, 'playlists').data, len(playlists)
+
+
+def measure(renderer, data, runs):
+    samples = []
+    content = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        content = renderer.render(data, renderer.media_type, {})
+        samples.append(time.perf_counter() - start)
+    return content, {
+        'median_ms': statistics.median(samples) * 1000,
+        'min_ms': min(samples) * 1000,
+        'bytes': len(content),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--playlists', type=int, default=1000)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'moviememo_backend.settings')
+    import django
+    django.setup()
+    import msgpack
+    from rest_framework.renderers import JSONRenderer
+    from moviememo_backend.renderers import MessagePackRenderer, ORJSONRenderer
+
+    data, count = playlists_page(args.playlists)
+    renderers = {'drf_json': JSONRenderer(), 'orjson': ORJSONRenderer(), 'msgpack': MessagePackRenderer()}
+    contents = {}
+    results = {'playlists': count}
+    for name, renderer in renderers.items():
+        contents[name], results[name] = measure(renderer, data, args.runs)
+
+    if contents['orjson'] != contents['drf_json']:
+        raise SystemExit('ORJSONRenderer output differs from JSONRenderer')
+    if msgpack.unpackb(contents['msgpack']) != json.loads(contents['drf_json']):
+        raise SystemExit('MessagePackRenderer output decodes to different values than the JSON')
+
+    baseline = results['drf_json']['median_ms']
+    print(f"{'renderer':<10} {'median ms':>10} {'min ms':>10} {'bytes':>10} {'speedup':>8}")
+    for name in renderers:
+        stats = results[name]
+        print(f"{name:<10} {stats['median_ms']:>10.2f} {stats['min_ms']:>10.2f} {stats['bytes']:>10} "
+              f"{baseline / stats['median_ms']:>7.1f}x")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
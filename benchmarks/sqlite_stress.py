@@ -0,0 +1,157 @@
+"""
+Multi-process write stress test for SQLite, with and without the
+concurrent profile (SQLITE_CONCURRENT).
+
+Every profile gets a fresh database file in a temporary directory, migrated
+by a setup subprocess. Worker processes then hammer it through the full
+request stack. Each worker runs a loop of create_playlist,
+add_movie_to_playlist (twice) and get_playlist against its own user.
+Exceptions raised inside views, such as "database is locked", are counted
+per message.
+
+    python -m benchmarks.sqlite_stress [--profiles default,concurrent] [--processes 8]
+        [--ops 200] [--json results.json]
+
+The command exits non-zero if the concurrent profile hit any lock errors.
+The other settings are loaded like manage.py does, so the .env it reads must
+be present.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+PROFILES = {
+    'default': {'SQLITE_CONCURRENT': 'False'},
+    'concurrent': {'SQLITE_CONCURRENT': 'True'},
+}
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'moviememo_backend.settings')
+    import django
+    django.setup()
+    from django.conf import settings
+    from django.test.utils import setup_test_environment
+    settings.DEBUG = False  # Don't keep every query in connection.queries
+    setup_test_environment()
+
+
+def prepare(processes):
+    """Migrate the database and create one user per worker"""
+    setup_django()
+    from django.core.management import call_command
+    from users.models import CustomUser
+
+    call_command('migrate', verbosity=0)
+    CustomUser.objects.bulk_create([
+        CustomUser(email=f'stress{n}@example.com', uid=f'stress{n}', username=f'stress{n}')
+        for n in range(processes)
+    ])
+
+
+def work(worker_id, ops):
+    """Run the request loop for one worker and print a JSON summary"""
+    setup_django()
+    from django.test import Client
+
+    client = Client()
+    uid = f'stress{worker_id}'
+    playlist_ids = []
+    outcomes = {}
+    started = time.perf_counter()
+
+    for i in range(ops):
+        step = i % 4
+        try:
+            if step == 0 or not playlist_ids:
+                response = client.post(
+                    f'/api/playlists/create/{uid}/', {'name': f'Stress {i}'}, content_type='application/json'
+                )
+                if response.status_code == 201:
+                    playlist_ids.append(response.json()['playlist']['id'])
+            elif step in (1, 2):
+                response = client.post(
+                    f'/api/playlists/{playlist_ids[-1]}/add-movie/',
+                    {'imdb_id': f'{worker_id + 1:03d}{i:05d}'},
+                    content_type='application/json'
+                )
+            else:
+                response = client.get(f'/api/playlists/{playlist_ids[-1]}/')
+            outcome = f'HTTP {response.status_code}'
+        except Exception as e:
+            outcome = f'{type(e).__name__}: {e}'
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    print(json.dumps({'seconds': time.perf_counter() - started, 'outcomes': outcomes}))
+
+
+def run_profile(profile, processes, ops):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DB_ENGINE='sqlite', SQLITE_PATH=os.path.join(tmp, 'stress.sqlite3'), **PROFILES[profile])
+        module = [sys.executable, '-m', 'benchmarks.sqlite_stress']
+        subprocess.run([*module, '--prepare', '--processes', str(processes)], check=True, env=env)
+
+        started = time.perf_counter()
+        workers = [
+            subprocess.Popen(
+                [*module, '--worker', str(n), '--ops', str(ops)],
+                stdout=subprocess.PIPE, text=True, env=env
+            )
+            for n in range(processes)
+        ]
+        outcomes = {}
+        for worker in workers:
+            output, _ = worker.communicate()
+            for outcome, count in json.loads(output.strip().splitlines()[-1])['outcomes'].items():
+                outcomes[outcome] = outcomes.get(outcome, 0) + count
+        elapsed = time.perf_counter() - started
+
+    requests = sum(outcomes.values())
+    return {
+        'requests': requests,
+        'seconds': elapsed,
+        'requests_per_second': requests / elapsed,
+        'lock_errors': sum(count for outcome, count in outcomes.items() if 'locked' in outcome),
+        'outcomes': outcomes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profiles', default='default,concurrent', help=f"Comma-separated: {', '.join(PROFILES)}")
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--ops', type=int, default=200, help='Requests per process')
+    parser.add_argument('--json', help='Write results to this file')
+    parser.add_argument('--prepare', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.prepare:
+        prepare(args.processes)
+        return
+    if args.worker is not None:
+        work(args.worker, args.ops)
+        return
+
+    results = {profile: run_profile(profile, args.processes, args.ops) for profile in args.profiles.split(',')}
+
+    print(f"{'profile':<12} {'requests':>9} {'req/s':>8} {'lock errors':>12}")
+    for profile, stats in results.items():
+        print(f"{profile:<12} {stats['requests']:>9} {stats['requests_per_second']:>8.0f} {stats['lock_errors']:>12}")
+        for outcome, count in sorted(stats['outcomes'].items()):
+            print(f"{'':<12} {count:>9} x {outcome}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if results.get('concurrent', {}).get('lock_errors'):
+        raise SystemExit('The concurrent profile hit "database is locked" errors')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Serialize 10k users with PublicUserSerializer, building picture URLs
+through the configured storage backend (the old way) and with the
+MEDIA_URL join in users/storage.py.
+
+Users are built in memory, so no database is needed, but the settings are
+loaded like manage.py does, so the .env it reads must be present.
+
+    python -m benchmarks.user_serialization [--users 10000] [--runs 5] [--json results.json]
+"""
+import argparse
+import hashlib
+import json
+import os
+import statistics
+import time
+
+
+def make_users(count):
+    """Users with a picture and three variants, plus some on the default avatar"""
+    from datetime import datetime, timezone
+    from users.models import CustomUser
+
+    now = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    users = []
+    for i in range(count):
+        user = CustomUser(id=i + 1, uid=f'uid-{i}', username=f'user{i}', email=f'user{i}@example.com', created_at=now)
+        if i % 10:
+            digest = hashlib.sha256(str(i).encode()).hexdigest()
+            user.profile_picture = f'profile_pictures/{digest}.webp'
+            user.profile_picture_variants = {
+                str(size): f'profile_pictures/{digest[:-4]}{size:04d}.webp' for size in (200, 96, 48)
+            }
+        users.append(user)
+    return users
+
+
+def storage_serializer():
+    """PublicUserSerializer as it was, asking the storage backend for every URL"""
+    from users.images import PROFILE_PICTURE_VARIANT_SIZES
+    from users.serializers import PublicUserSerializer
+    from users.storage import DEFAULT_PROFILE_PICTURE_URL
+
+    class StorageUserSerializer(PublicUserSerializer):
+        def get_profile_picture(self, obj):
+            if obj.profile_picture and obj.profile_picture.name:
+                return obj.profile_picture.url
+            return DEFAULT_PROFILE_PICTURE_URL
+
+        def get_profile_picture_variants(self, obj):
+            if not (obj.profile_picture and obj.profile_picture.name):
+                return {str(size): DEFAULT_PROFILE_PICTURE_URL for size in PROFILE_PICTURE_VARIANT_SIZES}
+            if not obj.profile_picture_variants:
+                return {str(max(PROFILE_PICTURE_VARIANT_SIZES)): obj.profile_picture.url}
+            storage = obj.profile_picture.storage
+            return {size: storage.url(name) for size, name in obj.profile_picture_variants.items()}
+
+    return StorageUserSerializer
+
+
+def measure(serializer_class, count, runs):
+    samples = []
+    data = None
+    for _ in range(runs):
+        # Fresh instances each run, so cached FieldFile objects don't carry over
+        users = make_users(count)
+        start = time.perf_counter()
+        data = serializer_class(users, many=True).data
+        samples.append(time.perf_counter() - start)
+    return data, {
+        'median_ms': statistics.median(samples) * 1000,
+        'min_ms': min(samples) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'moviememo_backend.settings')
+    import django
+    django.setup()
+    from users.serializers import PublicUserSerializer
+
+    before, results_before = measure(storage_serializer(), args.users, args.runs)
+    after, results_after = measure(PublicUserSerializer, args.users, args.runs)
+    if json.dumps(before) != json.dumps(after):
+        raise SystemExit('Serializers disagree; the MEDIA_URL join no longer matches storage.url()')
+
+    results = {'users': args.users, 'storage': results_before, 'media_url': results_after}
+    print(f"{'url builder':<12} {'median ms':>10} {'min ms':>10} {'us/user':>8}")
+    for name in ('storage', 'media_url'):
+        stats = results[name]
+        print(f"{name:<12} {stats['median_ms']:>10.1f} {stats['min_ms']:>10.1f} "
+              f"{stats['median_ms'] * 1000 / args.users:>8.1f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Serialize the newest 10k playlists (with their owners and movies) and the
+newest 10k users, once with the ModelSerializers and once with the
+ValuesSerializers the read endpoints use (see moviememo_backend/serializers.py).
+
+Each run times the queries and the serializing together, since skipping
+model instantiation is where the savings are. The rendered JSON of both must
+be byte-identical, so this also checks that the ValuesSerializers still
+match; it exits with an error if they don't.
+
+Reads the database, so run manage.py generate_dataset beforehand. The
+settings are loaded like manage.py does, so the .env it reads must be present.
+
+    python -m benchmarks.values_serializers [--objects 10000] [--runs 5] [--json results.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+
+def cases(count):
+    """{name: (model serializer build, values serializer build)} for each endpoint shape"""
+    from playlists.models import Playlists
+    from playlists.serializers import PlaylistSerializer, PlaylistValuesSerializer
+    from users.models import CustomUser
+    from users.serializers import PublicUserSerializer, PublicUserValuesSerializer
+
+    playlists = Playlists.objects.order_by('-created_at', '-id')
+    users = CustomUser.objects.order_by('-created_at', '-id')
+    return {
+        'playlists': (
+            lambda: PlaylistSerializer(playlists.for_serializer()[:count], many=True).data,
+            lambda: PlaylistValuesSerializer(list(PlaylistValuesSerializer.values(playlists)[:count]), many=True).data,
+        ),
+        'users': (
+            lambda: PublicUserSerializer(users[:count], many=True).data,
+            lambda: PublicUserValuesSerializer(PublicUserValuesSerializer.values(users)[:count], many=True).data,
+        ),
+    }
+
+
+def measure(build, runs):
+    samples = []
+    data = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        data = build()
+        samples.append(time.perf_counter() - start)
+    return data, {
+        'median_ms': statistics.median(samples) * 1000,
+        'min_ms': min(samples) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--objects', type=int, default=10_000)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'moviememo_backend.settings')
+    import django
+    django.setup()
+    from rest_framework.renderers import JSONRenderer
+
+    renderer = JSONRenderer()
+    results = {'objects': args.objects}
+    for name, (model_build, values_build) in cases(args.objects).items():
+        model_data, model_stats = measure(model_build, args.runs)
+        values_data, values_stats = measure(values_build, args.runs)
+        if not model_data:
+            raise SystemExit(f'The database has no {name}; run manage.py generate_dataset first')
+        if renderer.render(model_data) != renderer.render(values_data):
+            raise SystemExit(f'The {name} ValuesSerializer output differs from the ModelSerializer')
+        results[name] = {'count': len(model_data), 'model': model_stats, 'values': values_stats}
+
+    print(f"{'objects':<10} {'count':>6} {'serializer':<11} {'median ms':>10} {'min ms':>10} {'speedup':>8}")
+    for name in ('playlists', 'users'):
+        stats = results[name]
+        for serializer in ('model', 'values'):
+            print(f"{name:<10} {stats['count']:>6} {serializer:<11} {stats[serializer]['median_ms']:>10.1f} "
+                  f"{stats[serializer]['min_ms']:>10.1f} "
+                  f"{stats['model']['median_ms'] / stats[serializer]['median_ms']:>7.1f}x")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
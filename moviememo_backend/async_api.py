@@ -0,0 +1,103 @@
+"""
+Async stand-ins for DRF's @api_view and Response, for the read endpoints
+that run natively under ASGI (ASYNC_VIEWS in settings).
+
+DRF views are synchronous, so under ASGI Django hands each request to a
+thread with sync_to_async. These let a plain async Django view answer
+exactly like its @api_view twin does: the same content negotiation,
+rendered body, Content-Type, Allow and Vary headers and 405 body.
+moviememo_backend/tests.py checks that they do.
+"""
+from functools import wraps
+
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+
+from .instrumentation import timed
+
+
+class ApiResponse(HttpResponse):
+    """A response whose data is rendered once the renderer is known"""
+
+    def __init__(self, data, status=200):
+        super().__init__(status=status)
+        self.data = data
+
+    def render_with(self, renderer, accepted_media_type):
+        with timed('serialize'):
+            self.content = renderer.render(self.data, accepted_media_type, {'response': self})
+        content_type = renderer.media_type
+        if renderer.charset is not None:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        self['Content-Type'] = content_type
+        return self
+
+
+def api_response(data, status=200):
+    """Answer with data, as Response(data) would"""
+    return ApiResponse(data, status=status)
+
+
+def negotiate(request, renderers):
+    """The renderer and media type for the request's Accept header (or ?format=)"""
+    try:
+        return DefaultContentNegotiation().select_renderer(Request(request), renderers)
+    except NotAcceptable:
+        return None
+
+
+def async_api_view(http_method_names):
+    """
+    Decorate an async view that should behave like @api_view(http_method_names).
+    The negotiated renderer is set as request.accepted_renderer before the
+    view runs. OPTIONS is answered with DRF's metadata for the view (its
+    name, docstring, renderers and parsers); CORS preflights never reach
+    the view anyway.
+
+    After negotiating, the user is loaded from the session as DRF's
+    SessionAuthentication does, so SessionMiddleware adds Cookie to Vary
+    on the same responses.
+    """
+    allowed = [method.upper() for method in http_method_names]
+    # Built from a set like @api_view builds it, so the methods come out in the same order
+    allow_header = ', '.join(method.upper() for method in set(http_method_names) | {'options'})
+
+    def decorator(view):
+        # Named and documented like the APIView that @api_view would wrap the view in
+        described = type(view.__name__, (APIView,), {'__doc__': view.__doc__})()
+
+        @csrf_exempt
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            renderers = [renderer() for renderer in api_settings.DEFAULT_RENDERER_CLASSES]
+            negotiated = negotiate(request, renderers)
+            if negotiated is None:
+                request.accepted_renderer, request.accepted_media_type = renderers[0], renderers[0].media_type
+                response = api_response({'detail': NotAcceptable.default_detail}, status=406)
+            else:
+                request.accepted_renderer, request.accepted_media_type = negotiated
+                if hasattr(request, 'auser'):
+                    await request.auser()
+                if request.method in allowed:
+                    response = await view(request, *args, **kwargs)
+                elif request.method == 'OPTIONS':
+                    response = api_response(
+                        api_settings.DEFAULT_METADATA_CLASS().determine_metadata(Request(request), described)
+                    )
+                else:
+                    response = api_response({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+
+            if isinstance(response, ApiResponse):
+                response.render_with(request.accepted_renderer, request.accepted_media_type)
+            response['Allow'] = allow_header
+            if len(renderers) > 1:
+                patch_vary_headers(response, ['Accept'])
+            return response
+        return wrapper
+    return decorator
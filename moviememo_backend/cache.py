@@ -0,0 +1,235 @@
+"""
+Response caching for the playlist and user read endpoints.
+
+Payloads are stored in the configured Django cache (RESPONSE_CACHE_ALIAS),
+under one key per playlist and per user. Each key is versioned: the
+payload is stored under the key plus its current version token, and the
+mutating views replace the tokens of the keys they affect once their
+transaction commits. A rebuild reads the version before the database, so
+one that overlaps a write stores its result under the old version, where
+no reader looks for it any more.
+
+A missed key is rebuilt by a single caller. Other threads in the same
+process wait on a lock. Other processes poll while a short-lived lock key,
+added with cache.add(), is held, and build the payload themselves if it
+is released without one. This stops a hot entry that just expired from
+sending a burst of identical queries to the database.
+
+aget_or_build() does the same for async views. Waiting coroutines yield to
+the event loop instead of blocking a thread. An asyncio lock belongs to one
+event loop, and under WSGI Django runs each async view in a loop of its
+own, so every running loop gets its own pool of locks.
+"""
+import asyncio
+import threading
+import time
+import uuid
+import weakref
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .instrumentation import timed
+
+LOCK_TIMEOUT = 5  # seconds a rebuild may hold the cross-process lock
+LOCK_POLL_INTERVAL = 0.02
+
+# A fixed pool of striped locks keeps the in-process single flight bounded
+_local_locks = [threading.Lock() for _ in range(64)]
+_async_locks = weakref.WeakKeyDictionary()
+_async_locks_guard = threading.Lock()
+
+
+def playlist_key(playlist_id):
+    return f'playlist:{playlist_id}'
+
+
+def user_playlists_key(uid):
+    return f'user-playlists:{uid}'
+
+
+def user_key(uid):
+    return f'user:{uid}'
+
+
+def username_key(username):
+    return f'username:{username}'
+
+
+def get_cache():
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def version_key(key):
+    return f'{key}:version'
+
+
+def new_version():
+    return uuid.uuid4().hex
+
+
+def versioned_key(cache, key):
+    """The key the payload for key is currently stored under"""
+    version = cache.get(version_key(key))
+    if version is None:
+        # Versions never expire; if one is evicted, a fresh token can't match older payloads
+        cache.add(version_key(key), new_version(), None)
+        version = cache.get(version_key(key))
+    return f'{key}:{version}'
+
+
+async def aversioned_key(cache, key):
+    version = await cache.aget(version_key(key))
+    if version is None:
+        await cache.aadd(version_key(key), new_version(), None)
+        version = await cache.aget(version_key(key))
+    return f'{key}:{version}'
+
+
+def get_or_build(key, build):
+    """
+    Return the cached payload for key, calling build() on a miss.
+    build() returns None when there is nothing to cache (e.g. not found).
+    """
+    cache = get_cache()
+    with timed('cache'):
+        key = versioned_key(cache, key)
+        payload = cache.get(key)
+    if payload is not None:
+        return payload
+
+    with _local_locks[hash(key) % len(_local_locks)]:
+        lock_key = f'{key}:lock'
+        with timed('cache'):
+            # Another thread may have filled the key while we waited
+            payload = cache.get(key)
+            owns_lock = payload is None and cache.add(lock_key, 1, LOCK_TIMEOUT)
+        if payload is not None:
+            return payload
+        if owns_lock:
+            try:
+                return _build(cache, key, build)
+            finally:
+                with timed('cache'):
+                    cache.delete(lock_key)
+
+    # Another process is building it. Wait without holding up the other keys on this stripe.
+    with timed('cache'):
+        payload = _wait_for(cache, key)
+    if payload is not None:
+        return payload
+    # Its build found nothing, failed or took too long
+    return _build(cache, key, build)
+
+
+def _build(cache, key, build):
+    payload = build()
+    if payload is not None:
+        with timed('cache'):
+            cache.set(key, payload, getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300))
+    return payload
+
+
+def _wait_for(cache, key):
+    """
+    Poll for a payload another process is building, up to LOCK_TIMEOUT.
+    Gives up as soon as its lock is gone, since a build that returned None
+    or raised writes no payload.
+    """
+    lock_key = f'{key}:lock'
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        found = cache.get_many([key, lock_key])
+        if key in found or lock_key not in found:
+            return found.get(key)
+    return None
+
+
+def _async_lock(key):
+    """The striped lock for key in the running event loop's pool"""
+    loop = asyncio.get_running_loop()
+    with _async_locks_guard:
+        locks = _async_locks.get(loop)
+        if locks is None:
+            locks = _async_locks[loop] = [asyncio.Lock() for _ in range(64)]
+    return locks[hash(key) % len(locks)]
+
+
+async def aget_or_build(key, build):
+    """
+    get_or_build for async views; build() is a coroutine function
+    """
+    cache = get_cache()
+    with timed('cache'):
+        key = await aversioned_key(cache, key)
+        payload = await cache.aget(key)
+    if payload is not None:
+        return payload
+
+    async with _async_lock(key):
+        lock_key = f'{key}:lock'
+        with timed('cache'):
+            payload = await cache.aget(key)
+            owns_lock = payload is None and await cache.aadd(lock_key, 1, LOCK_TIMEOUT)
+        if payload is not None:
+            return payload
+        if owns_lock:
+            try:
+                return await _abuild(cache, key, build)
+            finally:
+                with timed('cache'):
+                    await cache.adelete(lock_key)
+
+    with timed('cache'):
+        payload = await _await_for(cache, key)
+    if payload is not None:
+        return payload
+    return await _abuild(cache, key, build)
+
+
+async def _abuild(cache, key, build):
+    payload = await build()
+    if payload is not None:
+        with timed('cache'):
+            await cache.aset(key, payload, getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300))
+    return payload
+
+
+async def _await_for(cache, key):
+    """_wait_for without blocking the event loop"""
+    lock_key = f'{key}:lock'
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+        found = await cache.aget_many([key, lock_key])
+        if key in found or lock_key not in found:
+            return found.get(key)
+    return None
+
+
+def invalidate(*keys):
+    """
+    Give keys new versions once the current transaction commits. Call it
+    after the writes, inside the same transaction: with autocommit,
+    on_commit() runs the callback straight away, and a reader could then
+    rebuild the keys from data that is about to change.
+    """
+    transaction.on_commit(lambda: get_cache().set_many({version_key(key): new_version() for key in keys}, None))
+
+
+def invalidate_playlist(playlist):
+    """Drop a playlist and its owner's playlist list"""
+    invalidate(playlist_key(playlist.id), user_playlists_key(playlist.user.uid))
+
+
+def invalidate_user(user, *old_usernames):
+    """
+    Drop a user's profile under every name it was cached as, plus every
+    payload that nests the user's public data
+    """
+    keys = [user_key(user.uid), username_key(user.username), user_playlists_key(user.uid)]
+    keys += [username_key(username) for username in old_usernames]
+    keys += [playlist_key(playlist_id) for playlist_id in user.playlists.values_list('id', flat=True)]
+    invalidate(*keys)
@@ -0,0 +1,101 @@
+"""
+ETag / Last-Modified support for the GET endpoints.
+
+Each endpoint supplies a validators function that reads the relevant
+updated_at columns with one cheap query. If-None-Match and
+If-Modified-Since are answered with a 304 before the view runs, so
+nothing gets serialized.
+"""
+from functools import wraps
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    """
+    Build a strong ETag from the updated_at values (and counts) a payload
+    depends on
+    """
+    tokens = []
+    for part in parts:
+        if part is None:
+            part = 0
+        elif hasattr(part, 'timestamp'):
+            part = int(part.timestamp() * 1_000_000)
+        tokens.append(format(part, 'x'))
+    return '"%s"' % '-'.join(tokens)
+
+
+def representation_etag(request, etag):
+    """
+    Strong ETags differ between representations, so responses rendered with
+    anything but JSON (say msgpack) get the format added to theirs
+    """
+    renderer = getattr(request, 'accepted_renderer', None)
+    if renderer is None or renderer.format == 'json':
+        return etag
+    return '%s;%s"' % (etag[:-1], renderer.format)
+
+
+def conditional_get(validators, bypass=None):
+    """
+    Decorate a GET view (below @api_view) with conditional request handling.
+    validators(**kwargs) receives the URL kwargs and returns
+    (etag, last_modified datetime), or None if the object doesn't exist, in
+    which case the view runs as usual and produces its own 404.
+    bypass(request), if given, returns True for requests whose response
+    depends on more than the validators cover; those are served without
+    validators.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if bypass is not None and bypass(request):
+                return view(request, *args, **kwargs)
+            
+            current = validators(**kwargs)
+            if current is None:
+                return view(request, *args, **kwargs)
+
+            etag, last_modified = current
+            etag = representation_etag(request, etag)
+            last_modified = int(last_modified.timestamp())
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            return add_validators(response, etag, last_modified)
+        return wrapper
+    return decorator
+
+
+def aconditional_get(validators, bypass=None):
+    """
+    conditional_get for async views; validators(**kwargs) is awaited
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if bypass is not None and bypass(request):
+                return await view(request, *args, **kwargs)
+            
+            current = await validators(**kwargs)
+            if current is None:
+                return await view(request, *args, **kwargs)
+
+            etag, last_modified = current
+            etag = representation_etag(request, etag)
+            last_modified = int(last_modified.timestamp())
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            return add_validators(response, etag, last_modified)
+        return wrapper
+    return decorator
+
+
+def add_validators(response, etag, last_modified):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+    return response
@@ -0,0 +1,64 @@
+"""
+Read-only connection routing for the concurrent SQLite profile
+(SQLITE_CONCURRENT in settings).
+
+ReadOnlyRoutingMiddleware marks GET and HEAD requests. While a request is
+marked, ReadOnlyRouter sends its reads to the 'readonly' alias, a second
+connection opened with mode=ro. Writes always go to 'default', including
+the occasional write a GET makes, such as caching movie metadata. With WAL,
+readers never wait for the writer, and the writer's BEGIN IMMEDIATE only
+competes with other writers.
+"""
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+READ_ONLY_ALIAS = 'readonly'
+
+_read_only = ContextVar('read_only_request', default=False)
+
+
+class ReadOnlyRouter:
+    def db_for_read(self, model, **hints):
+        if _read_only.get():
+            return READ_ONLY_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same database file
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != READ_ONLY_ALIAS
+
+
+class ReadOnlyRoutingMiddleware:
+    """Route the database reads of safe requests to the read-only connection"""
+    SAFE_METHODS = ('GET', 'HEAD')
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _read_only.set(request.method in self.SAFE_METHODS)
+        try:
+            return self.get_response(request)
+        finally:
+            _read_only.reset(token)
+
+    async def __acall__(self, request):
+        # The async ORM runs queries in a thread with a copy of this context
+        token = _read_only.set(request.method in self.SAFE_METHODS)
+        try:
+            return await self.get_response(request)
+        finally:
+            _read_only.reset(token)
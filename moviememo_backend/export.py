@@ -0,0 +1,46 @@
+"""
+Streaming NDJSON exports for backups and the analytics sync.
+
+Rows are read with QuerySet.iterator(chunk_size=...), so prefetches run once
+per chunk and only one chunk is held in memory at a time.
+"""
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+DEFAULT_CHUNK_SIZE = 500
+MAX_CHUNK_SIZE = 2000
+
+
+def parse_export_params(request):
+    """
+    Read ?after_id= and ?chunk_size= from the request.
+    Returns (after_id, chunk_size) or raises ValueError for bad input.
+    """
+    after_id = int(request.query_params.get('after_id', 0))
+    chunk_size = int(request.query_params.get('chunk_size', DEFAULT_CHUNK_SIZE))
+    if after_id < 0 or chunk_size < 1:
+        raise ValueError('after_id and chunk_size must be positive')
+    return after_id, min(chunk_size, MAX_CHUNK_SIZE)
+
+
+def iter_ndjson(queryset, serializer, chunk_size):
+    """
+    Yield one JSON line per object, serialized with a single reusable serializer
+    """
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        yield encoder.encode(serializer.to_representation(obj)) + '\n'
+
+
+def ndjson_response(queryset, serializer, after_id=0, chunk_size=DEFAULT_CHUNK_SIZE, filename='export.ndjson'):
+    """
+    Stream every object with an id above after_id in id order.
+    Clients resume an interrupted export by passing the last id they received.
+    """
+    queryset = queryset.filter(id__gt=after_id).order_by('id')
+    response = StreamingHttpResponse(
+        iter_ndjson(queryset, serializer, chunk_size),
+        content_type='application/x-ndjson'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
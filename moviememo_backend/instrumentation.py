@@ -0,0 +1,196 @@
+"""
+Per-request SQL instrumentation (QUERY_INSTRUMENTATION in settings).
+
+QueryInstrumentationMiddleware installs an execute wrapper (see
+connection.execute_wrapper) on every database connection as it is opened.
+The wrapper adds each query to the metrics of the request in the current
+context. That includes the async ORM, which runs queries in a thread with
+a copy of the context. The middleware counts the queries and the time
+spent in them, and adds a Server-Timing header:
+
+    Server-Timing: db;dur=4.12;desc="7 queries", cache;dur=0.31, serialize;dur=1.30, total;dur=7.02
+
+cache is the time spent in the response cache (see cache.py), including
+waiting for another worker's rebuild. serialize is the time spent in the
+response serializers (see TimedSerializerMixin) plus rendering. No metric
+includes the time of another: queries a serializer triggers count as db.
+total is the whole request, as seen by the middleware.
+
+Requests slower than SLOW_REQUEST_MS are logged. So is any query shape
+(the SQL with IN lists collapsed) that runs N_PLUS_ONE_THRESHOLD times or
+more in one request, a probable N+1. Both warnings name the view.
+
+Streaming exports send their headers before the rows are read, so only
+the queries made before the first row show up for them.
+"""
+import logging
+import re
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+_metrics = ContextVar('request_metrics', default=None)
+
+# Statements that repeat by design and say nothing about the view
+IGNORED_SHAPES = re.compile(r'^\s*(SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT)\b', re.IGNORECASE)
+PLACEHOLDER_LIST = re.compile(r'\((?:%s, )+%s\)')
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.durations = {'db': 0.0, 'cache': 0.0, 'serialize': 0.0}
+        self.shapes = {}
+        self.active = set()
+
+    def server_timing(self, total):
+        return ', '.join([
+            *(
+                f'{name};dur={seconds * 1000:.2f}' + (f';desc="{self.queries} queries"' if name == 'db' else '')
+                for name, seconds in self.durations.items()
+            ),
+            f'total;dur={total * 1000:.2f}',
+        ])
+
+    def repeated_shapes(self, threshold):
+        return {shape: count for shape, count in self.shapes.items() if count >= threshold}
+
+
+def current_metrics():
+    """The metrics of the request being handled, or None when not instrumented"""
+    return _metrics.get()
+
+
+class timed:
+    """
+    Add the time spent in the block to one of the Server-Timing metrics.
+    Nested blocks for the same metric only count once, and queries made
+    inside are left to db. Does nothing outside an instrumented request.
+    """
+    __slots__ = ('name', 'metrics', 'started', 'db_started')
+
+    def __init__(self, name):
+        self.name = name
+        self.metrics = None
+
+    def __enter__(self):
+        metrics = _metrics.get()
+        if metrics is not None and self.name not in metrics.active:
+            metrics.active.add(self.name)
+            self.metrics = metrics
+            self.db_started = metrics.durations['db']
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        metrics = self.metrics
+        if metrics is not None:
+            elapsed = time.perf_counter() - self.started
+            metrics.durations[self.name] += elapsed - (metrics.durations['db'] - self.db_started)
+            metrics.active.discard(self.name)
+            self.metrics = None
+        return False
+
+
+class TimedSerializerMixin:
+    """Count a serializer's to_representation() as serialize time"""
+
+    def to_representation(self, instance):
+        if _metrics.get() is None:
+            return super().to_representation(instance)
+        with timed('serialize'):
+            return super().to_representation(instance)
+
+
+def record_query(execute, sql, params, many, context):
+    """execute_wrapper that adds each query to the current request's metrics"""
+    metrics = _metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.durations['db'] += time.perf_counter() - started
+        metrics.queries += 1
+        if not IGNORED_SHAPES.match(sql):
+            shape = PLACEHOLDER_LIST.sub('(...)', sql)
+            metrics.shapes[shape] = metrics.shapes.get(shape, 0) + 1
+
+
+def install_query_recorder(sender=None, connection=None, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class QueryInstrumentationMiddleware:
+    """Measure each request's queries and report them in a Server-Timing header"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.slow_request_ms = getattr(settings, 'SLOW_REQUEST_MS', 500)
+        self.n_plus_one_threshold = getattr(settings, 'N_PLUS_ONE_THRESHOLD', 5)
+
+        connection_created.connect(install_query_recorder, dispatch_uid='install_query_recorder')
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection=connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _metrics.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _metrics.reset(token)
+        return self.finish(request, response, metrics, started)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _metrics.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _metrics.reset(token)
+        return self.finish(request, response, metrics, started)
+
+    def finish(self, request, response, metrics, started):
+        elapsed = time.perf_counter() - started
+        elapsed_ms = elapsed * 1000
+        response['Server-Timing'] = metrics.server_timing(elapsed)
+        self.report(request, metrics, elapsed_ms)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF renders the response after the view returns; count that as serializing
+        rendering = timed('serialize').__enter__()
+
+        def rendered(response):
+            rendering.__exit__(None, None, None)
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def report(self, request, metrics, elapsed_ms):
+        view_name = request.resolver_match.view_name if request.resolver_match else request.path
+        if elapsed_ms >= self.slow_request_ms:
+            logger.warning(
+                'Slow request: %s %s (%s) took %.0f ms, %d queries in %.0f ms',
+                request.method, request.path, view_name, elapsed_ms,
+                metrics.queries, metrics.durations['db'] * 1000
+            )
+        for shape, count in metrics.repeated_shapes(self.n_plus_one_threshold).items():
+            logger.warning('Probable N+1 in %s: %d identical queries: %s', view_name, count, shape)
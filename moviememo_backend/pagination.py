@@ -0,0 +1,135 @@
+"""
+Keyset (cursor) pagination shared by the list endpoints.
+
+Pages are seeked on (created_at, id) instead of using OFFSET, so a deep page
+costs the same as the first one, and no COUNT(*) runs unless the client asks
+for the total.
+"""
+from base64 import b64decode, b64encode
+from urllib import parse
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginate newest first on (-created_at, -id) using opaque cursors
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    total_query_param = 'include_total'
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.total = queryset.count() if self.wants_total(request) else None
+
+        cursor = self.decode_cursor(request)
+        queryset = queryset.order_by('-created_at', '-id')
+
+        if cursor is None:
+            reverse = False
+        else:
+            reverse, created_at, pk = cursor
+            if reverse:
+                # Walk back towards newer rows, then flip the page back around
+                queryset = queryset.filter(
+                    Q(created_at__gte=created_at) & (Q(created_at__gt=created_at) | Q(id__gt=pk))
+                ).reverse()
+            else:
+                queryset = queryset.filter(
+                    Q(created_at__lte=created_at) & (Q(created_at__lt=created_at) | Q(id__lt=pk))
+                )
+
+        # Fetch one extra row to find out whether there is another page
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = cursor is not None
+
+        return self.page
+
+    def get_paginated_data(self, data, results_key='results'):
+        paginated = {
+            results_key: data,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+        }
+        if self.total is not None:
+            paginated['count'] = self.total
+        return paginated
+
+    def get_paginated_response(self, data, results_key='results'):
+        return Response(self.get_paginated_data(data, results_key))
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size < 1:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def wants_total(self, request):
+        return request.query_params.get(self.total_query_param, '').lower() in ('1', 'true', 'yes')
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(False, self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            # Past the end of the list, so step back from the start instead
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(True, self.page[0])
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            querystring = b64decode(encoded.encode('ascii')).decode('ascii')
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            reverse = bool(int(tokens['r'][0]))
+            created_at = parse_datetime(tokens['t'][0])
+            pk = int(tokens['i'][0])
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return reverse, created_at, pk
+
+    def encode_cursor(self, reverse, item):
+        # Pages hold model instances or, for a values() queryset, dicts
+        if isinstance(item, dict):
+            created_at, pk = item['created_at'], item['id']
+        else:
+            created_at, pk = item.created_at, item.pk
+        tokens = {
+            'r': int(reverse),
+            't': created_at.isoformat(),
+            'i': pk,
+        }
+        encoded = b64encode(parse.urlencode(tokens).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
@@ -0,0 +1,79 @@
+"""
+Renderers for the API (DEFAULT_RENDERER_CLASSES in settings).
+
+ORJSONRenderer produces the same bytes as DRF's JSONRenderer, just faster:
+datetimes in UTC end in Z, other offsets are kept, and anything orjson has
+no native encoding for goes through DRF's encoder. orjson writes NaN and
+infinities as null, so data holding them is left to JSONRenderer, which
+rejects them under STRICT_JSON.
+
+MessagePackRenderer is picked by clients that send Accept: application/msgpack
+(or ?format=msgpack); the values are the same as in the JSON, so datetimes
+stay ISO 8601 strings.
+"""
+import math
+from decimal import Decimal
+
+import msgpack
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import encoders
+
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer on orjson. Falls back to DRF's rendering for what orjson
+    can't match: indented output (Accept: application/json; indent=4),
+    ASCII-only output (UNICODE_JSON off), integers beyond 64 bits and
+    non-finite numbers.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        if not self.compact or self.ensure_ascii or self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # A non-finite number can only have become a null, so most payloads skip the walk
+        if b'null' in ret and has_non_finite_number(data):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Like JSONRenderer, escape the two line terminators JavaScript doesn't allow in strings
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+def has_non_finite_number(data):
+    """Whether data holds a NaN or infinite float or Decimal anywhere"""
+    pending = [data]
+    while pending:
+        value = pending.pop()
+        if isinstance(value, dict):
+            pending.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            pending.extend(value)
+        elif isinstance(value, float):
+            if not math.isfinite(value):
+                return True
+        elif isinstance(value, Decimal) and not value.is_finite():
+            return True
+    return False
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=encoders.JSONEncoder().default, use_bin_type=True)
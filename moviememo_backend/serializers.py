@@ -0,0 +1,77 @@
+"""
+Read-only serializers for the GET endpoints that work on QuerySet.values()
+rows instead of model instances.
+
+A ModelSerializer instantiates every model and runs each value through its
+field objects, which dominates CPU once thousands of objects are serialized.
+A ValuesSerializer selects just the columns it needs and builds the same
+dicts directly. Each one mirrors a ModelSerializer and must produce
+byte-identical output; moviememo_backend/tests.py checks that.
+benchmarks/values_serializers.py measures the difference.
+"""
+from abc import ABC, abstractmethod
+
+from rest_framework.fields import DateTimeField
+from rest_framework.settings import ISO_8601, api_settings
+
+from .instrumentation import timed
+
+_datetime_field = DateTimeField()
+
+
+def datetime_formatter():
+    """
+    Return a function that renders a datetime as DRF's DateTimeField does.
+    The format and the current time zone are looked up once, here, rather
+    than for every value. Naive datetimes and formats other than ISO 8601
+    are left to DateTimeField itself.
+    """
+    output_format = api_settings.DATETIME_FORMAT
+    field_timezone = _datetime_field.default_timezone()
+    if field_timezone is None or output_format is None or output_format.lower() != ISO_8601:
+        return _datetime_field.to_representation
+
+    def represent(value):
+        if value is None:
+            return None
+        if value.utcoffset() is None:
+            return _datetime_field.to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+
+    return represent
+
+
+class ValuesSerializer(ABC):
+    """
+    Subclasses list the lookups to select in fields and build one item from
+    a row in to_representation(row), rendering datetimes with self.datetime.
+    data is a dict, or a list with many=True.
+    """
+    fields = ()
+
+    def __init__(self, instance=None, many=False):
+        self.instance = instance
+        self.many = many
+        self.datetime = datetime_formatter()
+
+    @classmethod
+    def values(cls, queryset, *extra):
+        """queryset.values() with the fields this serializer reads, plus any extra lookups"""
+        return queryset.values(*cls.fields, *extra)
+
+    def rows(self):
+        """The rows to serialize, as a list even without many=True"""
+        return self.instance if self.many else [self.instance]
+
+    @abstractmethod
+    def to_representation(self, row):
+        """Build one item of data from a values() row"""
+
+    @property
+    def data(self):
+        with timed('serialize'):
+            data = [self.to_representation(row) for row in self.rows()]
+        return data if self.many else data[0]
@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -26,7 +26,7 @@ SECRET_KEY = config('SECRET_KEY')
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = config('DEBUG', default=True, cast=bool)
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = config('ALLOWED_HOSTS', default='', cast=Csv())
 
 
 # Application definition
@@ -75,16 +75,80 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'moviememo_backend.wsgi.application'
 
+# Serve the read endpoints from async views (users/async_views.py, playlists/async_views.py).
+# Only worth it under ASGI, e.g. uvicorn moviememo_backend.asgi:application; under WSGI
+# Django has to run every async view in its own event loop
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=sqlite (default) keeps the local db.sqlite3 file; DB_ENGINE=postgres
+# connects to PostgreSQL through psycopg 3
+DB_ENGINE = config('DB_ENGINE', default='sqlite')
+
+if DB_ENGINE == 'postgres':
+    DB_POOL = config('DB_POOL', default=True, cast=bool)
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NAME', default='moviememo'),
+            'USER': config('DB_USER', default='moviememo'),
+            'PASSWORD': config('DB_PASSWORD', default=''),
+            'HOST': config('DB_HOST', default='localhost'),
+            'PORT': config('DB_PORT', default='5432'),
+            # The pool hands out its own long-lived connections, so Django must
+            # close (return) them after every request
+            'CONN_MAX_AGE': 0 if DB_POOL else config('DB_CONN_MAX_AGE', default=60, cast=int),
+            'CONN_HEALTH_CHECKS': config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
+            'OPTIONS': {},
+        }
+    }
+    if DB_POOL:
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+            'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+            'timeout': config('DB_POOL_TIMEOUT', default=10, cast=int),  # seconds to wait for a free connection
+        }
+else:
+    SQLITE_PATH = config('SQLITE_PATH', default=str(BASE_DIR / 'db.sqlite3'))
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': SQLITE_PATH,
+            # A file, not memory, so tests that write from several threads wait on each other's locks
+            'TEST': {'NAME': str(BASE_DIR / 'test_db.sqlite3')},
+        }
     }
-}
+
+    # Opt-in profile for concurrent writers on a single node (see moviememo_backend/db.py)
+    if config('SQLITE_CONCURRENT', default=False, cast=bool):
+        SQLITE_PRAGMAS = (
+            'PRAGMA journal_mode=WAL;'  # Readers no longer block the writer, or the other way round
+            'PRAGMA synchronous=NORMAL;'  # Safe with WAL; only fsyncs at checkpoints
+            f"PRAGMA busy_timeout={config('SQLITE_BUSY_TIMEOUT', default=20000, cast=int)};"
+            f"PRAGMA mmap_size={config('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024, cast=int)};"
+            f"PRAGMA cache_size={config('SQLITE_CACHE_SIZE', default=-64000, cast=int)};"  # Negative means KiB
+        )
+        DATABASES['default']['OPTIONS'] = {
+            'init_command': SQLITE_PRAGMAS,
+            # Take the write lock when a transaction starts, so it waits on
+            # busy_timeout instead of failing when upgrading a read lock
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': config('SQLITE_BUSY_TIMEOUT', default=20000, cast=int) / 1000,
+        }
+        DATABASES['readonly'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': f'file:{SQLITE_PATH}?mode=ro',
+            'OPTIONS': {
+                # journal_mode is stored in the file, so a reader can't (and needn't) set it
+                'init_command': SQLITE_PRAGMAS.replace('PRAGMA journal_mode=WAL;', ''),
+            },
+            'TEST': {'MIRROR': 'default'},
+        }
+        DATABASE_ROUTERS = ['moviememo_backend.db.ReadOnlyRouter']
+        MIDDLEWARE.append('moviememo_backend.db.ReadOnlyRoutingMiddleware')
 
 
 # Password validation
@@ -128,13 +192,35 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Any backend works, e.g. django.core.cache.backends.redis.RedisCache with
+# CACHE_LOCATION=redis://127.0.0.1:6379
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='moviememo'),
+    }
+}
+
+# Read endpoint response cache (see moviememo_backend/cache.py)
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = config('RESPONSE_CACHE_TIMEOUT', default=300, cast=int)
+
 # Django REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'moviememo_backend.renderers.ORJSONRenderer',
+        'moviememo_backend.renderers.MessagePackRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'moviememo_backend.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20
@@ -154,6 +240,26 @@ CORS_ALLOW_ALL_ORIGINS = True
 # Allow credentials to be included in CORS requests
 CORS_ALLOW_CREDENTIALS = True
 
+# Profile picture processing (see users/jobs.py)
+PROFILE_PICTURE_WORKERS = config('PROFILE_PICTURE_WORKERS', default=2, cast=int)
+PROFILE_PICTURE_MAX_PENDING = config('PROFILE_PICTURE_MAX_PENDING', default=32, cast=int)
+
+# Movie metadata cache (see playlists/metadata.py); an empty provider only serves what is cached
+MOVIE_METADATA_PROVIDER = config('MOVIE_METADATA_PROVIDER', default='')
+MOVIE_METADATA_TTL = config('MOVIE_METADATA_TTL', default=7 * 24 * 60 * 60, cast=int)
+MOVIE_METADATA_MISSING_TTL = config('MOVIE_METADATA_MISSING_TTL', default=24 * 60 * 60, cast=int)
+MOVIE_METADATA_FILE = config('MOVIE_METADATA_FILE', default='')
+OMDB_API_KEY = config('OMDB_API_KEY', default='')
+
+# Opt-in per-request query counts, Server-Timing headers, and slow request and
+# N+1 warnings (see moviememo_backend/instrumentation.py)
+QUERY_INSTRUMENTATION = config('QUERY_INSTRUMENTATION', default=False, cast=bool)
+SLOW_REQUEST_MS = config('SLOW_REQUEST_MS', default=500, cast=int)
+N_PLUS_ONE_THRESHOLD = config('N_PLUS_ONE_THRESHOLD', default=5, cast=int)
+if QUERY_INSTRUMENTATION:
+    # First, so it also measures the queries other middleware make
+    MIDDLEWARE.insert(0, 'moviememo_backend.instrumentation.QueryInstrumentationMiddleware')
+
 # Cloudflare R2 Storage Configuration
 # Use the new STORAGES setting (Django 4.2+)
 STORAGES = {
@@ -169,6 +275,8 @@ STORAGES = {
             'signature_version': 's3v4',
             'custom_domain': config('AWS_S3_CUSTOM_DOMAIN', default='cdn.kyleb.dev'),
             'default_acl': None,
+            # Profile pictures are content-addressed and never change, so the CDN can keep them forever
+            'object_parameters': {'CacheControl': 'public, max-age=31536000, immutable'},
         },
     },
     'staticfiles': {
@@ -176,6 +284,14 @@ STORAGES = {
     },
 }
 
+# Keep uploads on the local disk instead of R2, e.g. for benchmarks (see benchmarks/load.py)
+LOCAL_MEDIA_ROOT = config('LOCAL_MEDIA_ROOT', default='')
+if LOCAL_MEDIA_ROOT:
+    STORAGES['default'] = {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {'location': LOCAL_MEDIA_ROOT},
+    }
+
 # Legacy settings for compatibility (some packages might still use these)
 AWS_ACCESS_KEY_ID = config('AWS_ACCESS_KEY_ID')
 AWS_SECRET_ACCESS_KEY = config('AWS_SECRET_ACCESS_KEY')
@@ -0,0 +1,368 @@
+import asyncio
+import threading
+import time
+from base64 import b64encode
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from uuid import UUID
+from zoneinfo import ZoneInfo
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.http import HttpResponse
+from django.urls import path
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from playlists import async_views as playlist_async_views, views as playlist_views
+from playlists.metadata import store_metadata
+from playlists.models import Movie, Playlists
+from playlists.serializers import PlaylistSerializer, PlaylistValuesSerializer
+from users import async_views as user_async_views, views as user_views
+from users.models import CustomUser
+from users.serializers import PublicUserSerializer, PublicUserValuesSerializer
+from .cache import aget_or_build, get_cache, get_or_build, versioned_key
+from .instrumentation import QueryInstrumentationMiddleware
+from .renderers import ORJSONRenderer
+from .serializers import ValuesSerializer
+
+# Each read endpoint twice, as the DRF view under /sync/ and the async one under /async/
+urlpatterns = [
+    path(f'{prefix}/playlists/user/<str:user_uid>/', module.get_user_playlists)
+    for prefix, module in (('sync', playlist_views), ('async', playlist_async_views))
+] + [
+    path(f'{prefix}/playlists/<int:playlist_id>/', module.get_playlist)
+    for prefix, module in (('sync', playlist_views), ('async', playlist_async_views))
+] + [
+    route
+    for prefix, module in (('sync', user_views), ('async', user_async_views))
+    for route in (
+        path(f'{prefix}/users/check/<str:uid>/', module.check_user_exists),
+        path(f'{prefix}/users/check/username/<str:username>/', module.check_user_username_exists),
+        path(f'{prefix}/users/username/<str:username>/', module.get_username_user),
+        path(f'{prefix}/users/<str:uid>/', module.get_public_user),
+    )
+]
+
+HEADERS = ('Content-Type', 'Allow', 'Vary', 'ETag', 'Last-Modified')
+
+
+@override_settings(
+    ROOT_URLCONF=__name__,
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+)
+class AsyncViewParityTests(TestCase):
+    """
+    The async read views answer every request with the same status, body
+    and headers as their DRF twins
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(uid='uid-1', username='user1', email='user1@example.com')
+        cls.playlist = Playlists.objects.create(user=cls.user, name='Favourites')
+        cls.playlist.movies.add(Movie.objects.create(imdb_id='0111161'), Movie.objects.create(imdb_id='0068646'))
+        store_metadata({'0111161': {'title': 'The Shawshank Redemption', 'year': '1994'}})
+
+    def assert_same_response(self, method, url, **extra):
+        sync = getattr(self.client, method)(f'/sync{url}', **extra)
+        async_ = getattr(self.client, method)(f'/async{url}', **extra)
+        self.assertEqual(async_.status_code, sync.status_code)
+        self.assertEqual(async_.content, sync.content)
+        self.assertEqual(
+            {header: async_.headers.get(header) for header in HEADERS},
+            {header: sync.headers.get(header) for header in HEADERS},
+        )
+        return sync
+
+    def test_responses_match(self):
+        urls = [
+            f'/playlists/user/{self.user.uid}/', '/playlists/user/missing/',
+            f'/playlists/user/{self.user.uid}/?expand=metadata',
+            f'/playlists/{self.playlist.id}/', f'/playlists/{self.playlist.id + 1}/',
+            f'/playlists/{self.playlist.id}/?expand=metadata',
+            f'/users/{self.user.uid}/', '/users/missing/',
+            f'/users/username/{self.user.username}/', '/users/username/missing/',
+            f'/users/check/{self.user.uid}/', '/users/check/missing/',
+            f'/users/check/username/{self.user.username}/',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.assert_same_response('get', url)
+                self.assertIn('Cookie', response.headers['Vary'])
+                self.assert_same_response('get', url, HTTP_ACCEPT='application/msgpack')
+                self.assert_same_response('get', url, HTTP_ACCEPT='text/html')
+                self.assert_same_response('post', url)
+                self.assert_same_response('options', url)
+                if response.headers.get('ETag'):
+                    self.assert_same_response('get', url, HTTP_IF_NONE_MATCH=response.headers['ETag'])
+
+
+class ValuesSerializerContractTests(TestCase):
+    """
+    The ValuesSerializers render to the same bytes as the ModelSerializers
+    they stand in for, under DRF's JSONRenderer and the one the API uses
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.no_picture = CustomUser.objects.create(uid='uid-1', username='nopicture', email='1@example.com')
+        cls.legacy_picture = CustomUser.objects.create(
+            uid='uid-2', username='legacy', email='2@example.com',
+            profile_picture='profile_pictures/legacy.jpg',
+            last_username_change=timezone.now(),
+        )
+        cls.variants = CustomUser.objects.create(
+            uid='uid-3', username='variants', email='3@example.com',
+            profile_picture='profile_pictures/' + 'a' * 64 + '.webp',
+            profile_picture_variants={
+                '48': 'profile_pictures/' + 'b' * 64 + '.webp',
+                '96': 'profile_pictures/' + 'c' * 64 + '.webp',
+                '200': 'profile_pictures/' + 'a' * 64 + '.webp',
+            },
+        )
+        Playlists.objects.create(user=cls.no_picture, name='Empty')
+        for user in (cls.legacy_picture, cls.variants):
+            playlist = Playlists.objects.create(user=user, name='Favourites', description='Best of')
+            playlist.movies.add(*[Movie.objects.create(imdb_id=f'{user.id}{n:06d}') for n in range(3)])
+        Playlists.objects.all().recount_movies()
+
+    def assert_same_bytes(self, model_data, values_data):
+        expected = JSONRenderer().render(model_data)
+        self.assertEqual(JSONRenderer().render(values_data), expected)
+        self.assertEqual(api_settings.DEFAULT_RENDERER_CLASSES[0]().render(values_data), expected)
+
+    def test_playlists(self):
+        playlists = Playlists.objects.order_by('id')
+        for time_zone in ('UTC', 'America/New_York'):
+            with self.subTest(time_zone=time_zone), override_settings(TIME_ZONE=time_zone):
+                self.assert_same_bytes(
+                    PlaylistSerializer(playlists.for_serializer(), many=True).data,
+                    PlaylistValuesSerializer(list(PlaylistValuesSerializer.values(playlists)), many=True).data,
+                )
+                for playlist in playlists:
+                    self.assert_same_bytes(
+                        PlaylistSerializer(playlists.for_serializer().get(id=playlist.id)).data,
+                        PlaylistValuesSerializer(PlaylistValuesSerializer.values(playlists).get(id=playlist.id)).data,
+                    )
+                self.assert_same_bytes(
+                    PlaylistSerializer(playlists.none(), many=True).data,
+                    PlaylistValuesSerializer([], many=True).data,
+                )
+
+    def test_users(self):
+        users = CustomUser.objects.order_by('id')
+        for time_zone in ('UTC', 'America/New_York'):
+            with self.subTest(time_zone=time_zone), override_settings(TIME_ZONE=time_zone):
+                self.assert_same_bytes(
+                    PublicUserSerializer(users, many=True).data,
+                    PublicUserValuesSerializer(PublicUserValuesSerializer.values(users), many=True).data,
+                )
+                for user in users:
+                    self.assert_same_bytes(
+                        PublicUserSerializer(user).data,
+                        PublicUserValuesSerializer(PublicUserValuesSerializer.values(users).get(id=user.id)).data,
+                    )
+
+    def test_subclass_must_implement_to_representation(self):
+        class Incomplete(ValuesSerializer):
+            fields = ('id',)
+
+        with self.assertRaises(TypeError):
+            Incomplete({'id': 1})
+
+
+class ORJSONRendererTests(SimpleTestCase):
+    """ORJSONRenderer renders the bytes DRF's JSONRenderer does, or fails where it fails"""
+
+    def test_same_bytes(self):
+        moment = datetime(2024, 3, 1, 12, 30, 15, 123456)
+        payload = {
+            'utc': timezone.make_aware(moment, dt_timezone.utc),
+            'offset': timezone.make_aware(moment, ZoneInfo('America/New_York')),
+            'naive': moment,
+            'date': moment.date(),
+            'time': moment.time(),
+            'decimals': [Decimal('1.10'), Decimal('-0.5'), Decimal('3')],
+            'uuid': UUID('12345678-1234-5678-1234-567812345678'),
+            'nested': [[1, 2.5, None], ('a', ['b', {'c': True}]), []],
+            'text': 'line\u2028separator \u00e9',
+            'big': 2 ** 70,
+            'float': 0.1,
+        }
+        for time_zone in ('UTC', 'America/New_York'):
+            with self.subTest(time_zone=time_zone), override_settings(TIME_ZONE=time_zone):
+                self.assertEqual(ORJSONRenderer().render(payload), JSONRenderer().render(payload))
+
+    def test_rejects_non_finite_numbers(self):
+        for value in (float('nan'), float('inf'), float('-inf'), Decimal('NaN'), Decimal('Infinity')):
+            for name, renderer in (('drf', JSONRenderer()), ('orjson', ORJSONRenderer())):
+                with self.subTest(value=value, renderer=name), self.assertRaises(ValueError):
+                    renderer.render({'results': [{'score': value}]})
+
+
+class ResponseCacheTests(SimpleTestCase):
+    def setUp(self):
+        get_cache().clear()
+
+    def run_in_threads(self, function, callers):
+        barrier = threading.Barrier(callers)
+        results = []
+        errors = []
+
+        def call():
+            try:
+                barrier.wait()
+                results.append(function())
+            except Exception as e:
+                errors.append(e)
+
+        # Daemon threads, so a deadlock fails the test instead of hanging the run
+        threads = [threading.Thread(target=call, daemon=True) for _ in range(callers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=30)
+        self.assertFalse(any(thread.is_alive() for thread in threads))
+        self.assertEqual(errors, [])
+        return results
+
+    def test_async_builds_from_several_event_loops(self):
+        # Under WSGI each async view runs in an event loop of its own
+        async def build():
+            await asyncio.sleep(0.05)
+            return {'built': True}
+
+        results = self.run_in_threads(lambda: async_to_sync(aget_or_build)('key', build), 3)
+        self.assertEqual(results, [{'built': True}] * 3)
+
+    def test_waiters_stop_when_the_owner_builds_nothing(self):
+        # Another process holds the rebuild lock, and its build finds nothing
+        cache = get_cache()
+        lock_key = f"{versioned_key(cache, 'user:missing')}:lock"
+        for name, get in (
+            ('sync', lambda: get_or_build('user:missing', lambda: None)),
+            ('async', lambda: async_to_sync(aget_or_build)('user:missing', self.async_none)),
+        ):
+            with self.subTest(name):
+                cache.add(lock_key, 1)
+                release = threading.Timer(0.05, cache.delete, [lock_key])
+                release.start()
+                started = time.monotonic()
+                self.assertIsNone(get())
+                self.assertLess(time.monotonic() - started, 1)
+                release.join()
+
+    async def async_none(self):
+        return None
+
+
+class KeysetPaginationTests(TestCase):
+    """
+    Walks /api/users/all/, newest first on (created_at, id)
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        CustomUser.objects.bulk_create([
+            CustomUser(uid=f'uid-{n}', username=f'user{n}', email=f'user{n}@example.com') for n in range(7)
+        ])
+        # Four users share one created_at, so only the id breaks their ties
+        now = timezone.now()
+        users = list(CustomUser.objects.order_by('id'))
+        for n, user in enumerate(users):
+            user.created_at = now if n < 4 else now + timedelta(minutes=n)
+        CustomUser.objects.bulk_update(users, ['created_at'])
+        cls.newest_first = [user.uid for user in sorted(users, key=lambda user: (user.created_at, user.id), reverse=True)]
+
+    def page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_walk_forwards_and_back(self):
+        pages = []
+        url = '/api/users/all/?page_size=2'
+        while url:
+            page = self.page(url)
+            pages.append([user['uid'] for user in page['users']])
+            url = page['next']
+        self.assertEqual([uid for uids in pages for uid in uids], self.newest_first)
+        self.assertEqual([len(uids) for uids in pages], [2, 2, 2, 1])
+
+        back = []
+        url = page['previous']
+        while url:
+            page = self.page(url)
+            back.append([user['uid'] for user in page['users']])
+            url = page['previous']
+        self.assertEqual(back, pages[-2::-1])
+
+    def test_invalid_cursor(self):
+        for cursor in ('!!!', b64encode(b'r=0&t=never&i=1').decode(), b64encode(b'r=0&i=1').decode()):
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/api/users/all/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(response.json()['detail'], 'Invalid cursor')
+
+    def test_page_size(self):
+        CustomUser.objects.bulk_create([
+            CustomUser(uid=f'more-{n}', username=f'more{n}', email=f'more{n}@example.com') for n in range(120)
+        ])
+        for page_size, expected in (('1000', 100), ('0', 20), ('abc', 20), ('5', 5)):
+            with self.subTest(page_size=page_size):
+                self.assertEqual(len(self.page(f'/api/users/all/?page_size={page_size}')['users']), expected)
+
+    def test_include_total(self):
+        self.assertNotIn('count', self.page('/api/users/all/?page_size=2'))
+        page = self.page('/api/users/all/?page_size=2&include_total=true')
+        self.assertEqual(page['count'], 7)
+        self.assertEqual(self.page(page['next'])['count'], 7)
+
+
+@override_settings(MIDDLEWARE=['moviememo_backend.instrumentation.QueryInstrumentationMiddleware', *settings.MIDDLEWARE])
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+
+    def server_timing(self, response):
+        """{metric: (milliseconds, description)} from the Server-Timing header"""
+        metrics = {}
+        for entry in response.headers['Server-Timing'].split(', '):
+            name, *params = entry.split(';')
+            params = dict(param.split('=', 1) for param in params)
+            metrics[name] = (float(params['dur']), params.get('desc'))
+        return metrics
+
+    def test_server_timing(self):
+        user = CustomUser.objects.create(uid='uid-1', username='user1', email='user1@example.com')
+        playlist = Playlists.objects.create(user=user, name='Favourites')
+
+        cold = self.server_timing(self.client.get(f'/api/playlists/{playlist.id}/'))
+        self.assertEqual(list(cold), ['db', 'cache', 'serialize', 'total'])
+        self.assertEqual(cold['db'][1], '"3 queries"')
+        self.assertGreater(cold['cache'][0], 0)
+        self.assertGreaterEqual(cold['total'][0], cold['db'][0] + cold['cache'][0] + cold['serialize'][0])
+
+        # Served from the response cache after the validators query
+        warm = self.server_timing(self.client.get(f'/api/playlists/{playlist.id}/'))
+        self.assertEqual(warm['db'][1], '"1 queries"')
+        self.assertGreater(warm['cache'][0], 0)
+
+    @override_settings(N_PLUS_ONE_THRESHOLD=3)
+    def test_n_plus_one_warning(self):
+        def view(repeats):
+            def get_response(request):
+                for pk in range(repeats):
+                    CustomUser.objects.filter(pk=pk).exists()
+                return HttpResponse()
+            return get_response
+
+        request = RequestFactory().get('/users/')
+        with self.assertNoLogs('moviememo_backend.instrumentation', 'WARNING'):
+            QueryInstrumentationMiddleware(view(2))(request)
+        with self.assertLogs('moviememo_backend.instrumentation', 'WARNING') as logs:
+            QueryInstrumentationMiddleware(view(3))(request)
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('Probable N+1 in /users/: 3 identical queries', logs.output[0])
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Playlists, Movie
+from .models import Playlists, Movie, MovieMetadata
 
 @admin.register(Movie)
 class MovieAdmin(admin.ModelAdmin):
@@ -8,6 +8,13 @@ class MovieAdmin(admin.ModelAdmin):
     readonly_fields = ['added_at']
     ordering = ['-added_at']
 
+@admin.register(MovieMetadata)
+class MovieMetadataAdmin(admin.ModelAdmin):
+    list_display = ['imdb_id', 'title', 'year', 'found', 'fetched_at']
+    list_filter = ['found']
+    search_fields = ['imdb_id', 'title']
+    ordering = ['-fetched_at']
+
 @admin.register(Playlists)
 class PlaylistsAdmin(admin.ModelAdmin):
     list_display = ['name', 'user', 'movie_count', 'created_at']
@@ -30,6 +37,5 @@ class PlaylistsAdmin(admin.ModelAdmin):
         }),
     )
     
-    def movie_count(self, obj):
-        return obj.movie_count()
-    movie_count.short_description = 'Number of Movies'
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user')
@@ -0,0 +1,89 @@
+"""
+Async versions of the playlist read endpoints, routed instead of the ones in
+views.py when ASYNC_VIEWS is on. They query through the async ORM and
+answer with the same payloads, cache keys and validators.
+"""
+from rest_framework import status
+from .models import Playlists
+from .metadata import aexpand_movie_metadata, wants_metadata
+from .serializers import PlaylistValuesSerializer
+from .views import playlist_versions, user_playlists_etag, user_playlists_versions
+from users.models import CustomUser
+from moviememo_backend.async_api import api_response, async_api_view
+from moviememo_backend.cache import aget_or_build, playlist_key, user_playlists_key
+from moviememo_backend.conditional import aconditional_get, make_etag
+
+
+async def user_playlists_validators(user_uid):
+    rows = [row async for row in user_playlists_versions(user_uid)]
+    if not rows:
+        return None
+    return user_playlists_etag(rows[0])
+
+@async_api_view(['GET'])
+@aconditional_get(user_playlists_validators, bypass=wants_metadata)
+async def get_user_playlists(request, user_uid):
+    """
+    Get all playlists for a specific user.
+    Pass ?expand=metadata to embed each movie's title, year and poster.
+    """
+    async def build():
+        try:
+            user = await CustomUser.objects.aget(uid=user_uid)
+        except CustomUser.DoesNotExist:
+            return None
+        
+        playlists = [
+            playlist async for playlist in PlaylistValuesSerializer.values(Playlists.objects.filter(user=user))
+        ]
+        serializer = PlaylistValuesSerializer(playlists, many=True)
+        return {
+            'playlists': await serializer.adata(),
+            'count': len(playlists)
+        }
+    
+    payload = await aget_or_build(user_playlists_key(user_uid), build)
+    if payload is None:
+        return api_response(
+            {'message': 'User not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    if wants_metadata(request):
+        payload = {**payload, 'playlists': await aexpand_movie_metadata(payload['playlists'])}
+    
+    return api_response(payload)
+
+async def playlist_validators(playlist_id):
+    row = await playlist_versions(playlist_id).afirst()
+    if row is None:
+        return None
+    return make_etag(*row), max(row)
+
+@async_api_view(['GET'])
+@aconditional_get(playlist_validators, bypass=wants_metadata)
+async def get_playlist(request, playlist_id):
+    """
+    Get a specific playlist by ID.
+    Pass ?expand=metadata to embed each movie's title, year and poster.
+    """
+    async def build():
+        try:
+            playlist = await PlaylistValuesSerializer.values(Playlists.objects.all()).aget(id=playlist_id)
+        except Playlists.DoesNotExist:
+            return None
+        return {
+            'playlist': await PlaylistValuesSerializer(playlist).adata()
+        }
+    
+    payload = await aget_or_build(playlist_key(playlist_id), build)
+    if payload is None:
+        return api_response(
+            {'message': 'Playlist not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    if wants_metadata(request):
+        payload = {'playlist': (await aexpand_movie_metadata([payload['playlist']]))[0]}
+    
+    return api_response(payload)
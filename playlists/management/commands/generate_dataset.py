@@ -0,0 +1,123 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from playlists.models import Movie, Playlists
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk-generate a synthetic dataset for benchmarks: users, a pool of movies, and playlists '
+        'holding a skewed sample of them. The same --seed always produces the same dataset.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100_000)
+        parser.add_argument('--playlists', type=int, default=1_000_000)
+        parser.add_argument('--movies-per-playlist', type=int, default=10, help='Through rows per playlist')
+        parser.add_argument('--movies', type=int, default=200_000, help='Distinct movies to draw from')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk_create')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='gen', help='uid, email and username prefix of generated users')
+        parser.add_argument('--clear', action='store_true', help='Delete a previously generated dataset first')
+
+    def handle(self, *args, users, playlists, movies_per_playlist, movies, batch_size, seed, prefix, clear,
+               **options):
+        if len(f'{prefix}{users - 1}') > CustomUser._meta.get_field('username').max_length:
+            raise CommandError('--prefix is too long for that many users')
+        if movies_per_playlist > movies:
+            raise CommandError('--movies-per-playlist cannot exceed --movies')
+
+        existing = CustomUser.objects.filter(uid__startswith=f'{prefix}-')
+        if clear:
+            started = time.perf_counter()
+            deleted, _ = existing.delete()
+            self.stdout.write(f'Deleted {deleted} rows in {time.perf_counter() - started:.1f}s')
+        elif existing.exists():
+            raise CommandError(f'Users prefixed {prefix!r} already exist; pass --clear to replace them')
+
+        rng = random.Random(seed)
+        started = time.perf_counter()
+        user_ids = self.create_users(users, prefix, batch_size)
+        movie_ids = self.create_movies(movies, batch_size)
+        through_rows = self.create_playlists(
+            playlists, movies_per_playlist, user_ids, movie_ids, batch_size, rng
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {len(user_ids)} users, {len(movie_ids)} movies, {playlists} playlists '
+            f'and {through_rows} playlist movies in {time.perf_counter() - started:.1f}s.'
+        ))
+
+    def create_users(self, count, prefix, batch_size):
+        started = time.perf_counter()
+        user_ids = []
+        for start in range(0, count, batch_size):
+            created = CustomUser.objects.bulk_create([
+                CustomUser(email=f'{prefix}{n}@example.com', uid=f'{prefix}-{n}', username=f'{prefix}{n}')
+                for n in range(start, min(start + batch_size, count))
+            ])
+            user_ids.extend(user.id for user in created)
+        self.stdout.write(f'Users: {count} in {time.perf_counter() - started:.1f}s')
+        return user_ids
+
+    def create_movies(self, count, batch_size):
+        """Create IMDb-style IDs 0000001..count, reusing movies that already exist"""
+        started = time.perf_counter()
+        imdb_ids = [f'{n:07d}' for n in range(1, count + 1)]
+        for start in range(0, count, batch_size):
+            Movie.objects.bulk_create(
+                [Movie(imdb_id=imdb_id) for imdb_id in imdb_ids[start:start + batch_size]],
+                ignore_conflicts=True
+            )
+        ids = {}
+        for start in range(0, count, batch_size):
+            ids.update(
+                Movie.objects.filter(imdb_id__in=imdb_ids[start:start + batch_size])
+                .order_by()
+                .values_list('imdb_id', 'id')
+            )
+        self.stdout.write(f'Movies: {count} in {time.perf_counter() - started:.1f}s')
+        return [ids[imdb_id] for imdb_id in imdb_ids]
+
+    def create_playlists(self, count, movies_per_playlist, user_ids, movie_ids, batch_size, rng):
+        """
+        Spread playlists over users and movies with a long tail: a few
+        users own many playlists, and a few movies are in a lot of them
+        """
+        started = time.perf_counter()
+        through = Playlists.movies.through
+        through_rows = 0
+        for start in range(0, count, batch_size):
+            picks = []
+            for n in range(start, min(start + batch_size, count)):
+                chosen = set()
+                while len(chosen) < movies_per_playlist:
+                    chosen.add(movie_ids[int(len(movie_ids) * rng.random() ** 2)])
+                picks.append((n, user_ids[int(len(user_ids) * rng.random() ** 1.5)], chosen))
+
+            with transaction.atomic():
+                created = Playlists.objects.bulk_create([
+                    Playlists(
+                        name=f'Playlist {n}',
+                        description=f'Generated playlist {n}' if n % 3 else '',
+                        user_id=user_id,
+                        movie_count=len(chosen),  # bulk_create skips the signal that maintains it
+                    )
+                    for n, user_id, chosen in picks
+                ])
+                rows = [
+                    through(playlists_id=playlist.id, movie_id=movie_id)
+                    for playlist, (_, _, chosen) in zip(created, picks)
+                    for movie_id in chosen
+                ]
+                through.objects.bulk_create(rows, batch_size=batch_size)
+            through_rows += len(rows)
+
+            done = start + len(picks)
+            if done == count or done // batch_size % 20 == 0:
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'Playlists: {done}/{count} ({done / elapsed:.0f}/s)')
+        return through_rows
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from playlists.models import Playlists
+
+
+class Command(BaseCommand):
+    help = 'Backfill Playlists.movie_count and repair any drift from the movies through table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Playlists checked per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without fixing it')
+
+    def handle(self, *args, batch_size, dry_run, **options):
+        checked = drifted = 0
+        last_id = 0
+        while True:
+            # Walk the table in primary key batches so each transaction stays short
+            batch = list(
+                Playlists.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1]
+            checked += len(batch)
+
+            with transaction.atomic():
+                stale = list(
+                    Playlists.objects.filter(id__in=batch)
+                    .with_actual_movie_count()
+                    .exclude(movie_count=F('actual_movie_count'))
+                    .order_by('id')
+                    .values_list('id', 'movie_count', 'actual_movie_count')
+                )
+                for playlist_id, stored, actual in stale:
+                    self.stdout.write(f'Playlist {playlist_id}: stored {stored}, actual {actual}')
+                if stale and not dry_run:
+                    Playlists.objects.filter(id__in=[row[0] for row in stale]).recount_movies()
+            drifted += len(stale)
+
+        action = 'Found' if dry_run else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} playlists. {action} {drifted} with drift.'))
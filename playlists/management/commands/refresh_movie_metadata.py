@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from playlists.metadata import get_provider, is_stale, store_metadata
+from playlists.models import Movie, MovieMetadata
+
+
+class Command(BaseCommand):
+    help = 'Fetch metadata for movies in playlists that have none cached, or whose cache is past its TTL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='Movies looked up per batch')
+        parser.add_argument('--all', action='store_true', help='Refresh every movie, even if its cache is fresh')
+
+    def handle(self, *args, batch_size, all, **options):
+        provider = get_provider()
+        if provider is None:
+            raise CommandError('MOVIE_METADATA_PROVIDER is not set')
+
+        checked = stored = 0
+        last_id = 0
+        while True:
+            batch = list(
+                Movie.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', 'imdb_id')[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            imdb_ids = [imdb_id for _, imdb_id in batch]
+            checked += len(imdb_ids)
+
+            if not all:
+                cached = MovieMetadata.objects.filter(imdb_id__in=imdb_ids)
+                fresh = {metadata.imdb_id for metadata in cached if not is_stale(metadata)}
+                imdb_ids = [imdb_id for imdb_id in imdb_ids if imdb_id not in fresh]
+
+            fetched = provider.fetch_many(imdb_ids)
+            store_metadata(fetched)
+            stored += len(fetched)
+            for imdb_id in imdb_ids:
+                if imdb_id not in fetched:
+                    self.stderr.write(f'Failed to fetch {imdb_id}')
+
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} movies. Stored metadata for {stored}.'))
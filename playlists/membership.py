@@ -0,0 +1,97 @@
+from django.db import connection, transaction
+from .models import Movie, Playlists
+
+
+def add_movie(playlist_id, imdb_id):
+    """
+    Add one movie with conflict-tolerant inserts, so concurrent adds of the
+    same movie can't race. Returns True if the movie was added, False if it
+    was already in the playlist and None if the playlist doesn't exist.
+    """
+    through = Playlists.movies.through
+    quote = connection.ops.quote_name
+    # INSERT ... SELECT only inserts when the playlist exists, and ON CONFLICT
+    # DO NOTHING turns "already present" into an affected-row count of 0
+    sql = (
+        f"INSERT INTO {quote(through._meta.db_table)} "
+        f"({quote(through._meta.get_field('playlists').column)}, {quote(through._meta.get_field('movie').column)}) "
+        f"SELECT p.{quote('id')}, m.{quote('id')} "
+        f"FROM {quote(Playlists._meta.db_table)} p, {quote(Movie._meta.db_table)} m "
+        f"WHERE p.{quote('id')} = %s AND m.{quote('imdb_id')} = %s "
+        f"ON CONFLICT DO NOTHING"
+    )
+
+    with transaction.atomic():
+        Movie.objects.bulk_create([Movie(imdb_id=imdb_id)], ignore_conflicts=True)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [playlist_id, imdb_id])
+            added = cursor.rowcount == 1
+        if added:
+            Playlists.objects.filter(pk=playlist_id).adjust_movie_count(1)
+            return True
+
+    # Nothing was inserted; only now pay for finding out why
+    if Playlists.objects.filter(pk=playlist_id).exists():
+        return False
+    return None
+
+
+def remove_movie(playlist_id, imdb_id):
+    """
+    Remove one movie with a single DELETE. Returns True if a row was removed.
+    """
+    through = Playlists.movies.through
+    with transaction.atomic():
+        removed, _ = through.objects.filter(playlists_id=playlist_id, movie__imdb_id=imdb_id).delete()
+        if removed:
+            Playlists.objects.filter(pk=playlist_id).adjust_movie_count(-removed)
+    return bool(removed)
+
+
+def update_playlist_movies(playlist_id, add=(), remove=()):
+    """
+    Add and remove many movies in one transaction with bulk statements on
+    the through table. add and remove must be validated, de-duplicated IMDb
+    IDs. Returns {imdb_id: status} for every ID passed in.
+    """
+    through = Playlists.movies.through
+    results = {}
+
+    with transaction.atomic():
+        if add:
+            # Create any movies we haven't seen before; existing rows are left alone
+            Movie.objects.bulk_create([Movie(imdb_id=imdb_id) for imdb_id in add], ignore_conflicts=True)
+
+        movie_ids = dict(
+            Movie.objects.filter(imdb_id__in=[*add, *remove]).order_by().values_list('imdb_id', 'id')
+        )
+        present = set(
+            through.objects.filter(playlists_id=playlist_id, movie_id__in=movie_ids.values())
+            .values_list('movie_id', flat=True)
+        )
+
+        to_add = []
+        for imdb_id in add:
+            if movie_ids[imdb_id] in present:
+                results[imdb_id] = 'already_in_playlist'
+            else:
+                to_add.append(through(playlists_id=playlist_id, movie_id=movie_ids[imdb_id]))
+                results[imdb_id] = 'added'
+
+        to_remove = []
+        for imdb_id in remove:
+            if movie_ids.get(imdb_id) in present:
+                to_remove.append(movie_ids[imdb_id])
+                results[imdb_id] = 'removed'
+            else:
+                results[imdb_id] = 'not_in_playlist'
+
+        if to_add:
+            through.objects.bulk_create(to_add, ignore_conflicts=True)
+        if to_remove:
+            through.objects.filter(playlists_id=playlist_id, movie_id__in=to_remove).delete()
+        if to_add or to_remove:
+            # Bulk statements skip m2m_changed, so recount in a single UPDATE
+            Playlists.objects.filter(pk=playlist_id).recount_movies()
+
+    return results
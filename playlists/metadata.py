@@ -0,0 +1,254 @@
+"""
+Server-side movie metadata.
+
+Titles, years and posters are cached in the MovieMetadata table. The
+refresh_movie_metadata command fetches every IMDb ID that is missing, or
+older than MOVIE_METADATA_TTL, from the provider named by
+MOVIE_METADATA_PROVIDER and writes them back with upserts.
+
+The playlist read endpoints embed it with ?expand=metadata, see
+expand_movie_metadata(). They only read the table: a provider lookup can
+take seconds per ID, far too long to make a request wait for.
+
+Providers subclass MetadataProvider and implement fetch(). fetch_many()
+splits IDs into batches of batch_size. It never has more than
+max_concurrency requests in flight per process, however many requests are
+resolving metadata at once.
+"""
+import json
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import MovieMetadata
+
+METADATA_FIELDS = ('title', 'year', 'poster')
+
+_provider = None
+_provider_lock = threading.Lock()
+
+# Returned by _fetch_one for a lookup that raised, as opposed to None for "not found"
+_FAILED = object()
+
+
+class MetadataProvider(ABC):
+    """
+    Base class for metadata sources.
+
+    fetch(imdb_id) returns a dict with any of METADATA_FIELDS, or None if the
+    provider doesn't know the ID. It raises on errors worth retrying later,
+    such as timeouts or rate limits. Those IDs are left uncached.
+    """
+    batch_size = 20
+    max_concurrency = 4
+
+    def __init__(self):
+        self._in_flight = threading.BoundedSemaphore(self.max_concurrency)
+
+    @abstractmethod
+    def fetch(self, imdb_id):
+        """Look up one ID, as described above"""
+
+    def fetch_many(self, imdb_ids):
+        """Return {imdb_id: details or None} for every ID that didn't fail"""
+        results = {}
+        imdb_ids = list(imdb_ids)
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            for start in range(0, len(imdb_ids), self.batch_size):
+                batch = imdb_ids[start:start + self.batch_size]
+                for imdb_id, details in zip(batch, executor.map(self._fetch_one, batch)):
+                    if details is not _FAILED:
+                        results[imdb_id] = details
+        return results
+
+    def _fetch_one(self, imdb_id):
+        with self._in_flight:
+            try:
+                return self.fetch(imdb_id)
+            except Exception:
+                return _FAILED
+
+
+class FileMetadataProvider(MetadataProvider):
+    """
+    Serve metadata from a JSON file of {imdb_id: {"title", "year", "poster"}}.
+    Meant for tests and local development (MOVIE_METADATA_FILE).
+    """
+    def __init__(self, path=None):
+        super().__init__()
+        path = path or getattr(settings, 'MOVIE_METADATA_FILE', '')
+        if not path:
+            raise ImproperlyConfigured('FileMetadataProvider needs MOVIE_METADATA_FILE')
+        with open(path) as f:
+            self.movies = json.load(f)
+
+    def fetch(self, imdb_id):
+        return self.movies.get(imdb_id)
+
+    def fetch_many(self, imdb_ids):
+        # Everything is already in memory, so there is nothing to batch
+        return {imdb_id: self.fetch(imdb_id) for imdb_id in imdb_ids}
+
+
+class OMDbProvider(MetadataProvider):
+    """
+    Fetch metadata from the OMDb API (https://www.omdbapi.com/) using OMDB_API_KEY.
+    OMDb has no batch endpoint, so batches are fetched as concurrent single lookups.
+    """
+    url = 'https://www.omdbapi.com/'
+    timeout = 5
+
+    def __init__(self, api_key=None):
+        super().__init__()
+        self.api_key = api_key or getattr(settings, 'OMDB_API_KEY', '')
+        if not self.api_key:
+            raise ImproperlyConfigured('OMDbProvider needs OMDB_API_KEY')
+
+    def fetch(self, imdb_id):
+        # IDs are stored as digits, but OMDb only accepts them with the tt prefix
+        query = urlencode({'i': f"tt{imdb_id.removeprefix('tt')}", 'apikey': self.api_key})
+        with urlopen(f'{self.url}?{query}', timeout=self.timeout) as response:
+            data = json.load(response)
+
+        if data.get('Response') != 'True':
+            error = data.get('Error', '')
+            if error == 'Error getting data.':
+                return None
+            # Rate limits, invalid keys, IDs it couldn't parse and the like; try again next time
+            raise RuntimeError(f'OMDb lookup for {imdb_id} failed: {error}')
+
+        poster = data.get('Poster', '')
+        return {
+            'title': data.get('Title', ''),
+            'year': data.get('Year', ''),
+            'poster': '' if poster == 'N/A' else poster,
+        }
+
+
+def get_provider():
+    """Return the configured provider, created on first use, or None if metadata fetching is off"""
+    global _provider
+    path = getattr(settings, 'MOVIE_METADATA_PROVIDER', '')
+    if not path:
+        return None
+    with _provider_lock:
+        if _provider is None:
+            _provider = import_string(path)()
+    return _provider
+
+
+def is_stale(metadata, now=None):
+    """Whether a cached row is past its TTL (shorter for IDs the provider didn't know)"""
+    now = now or timezone.now()
+    if metadata.found:
+        ttl = getattr(settings, 'MOVIE_METADATA_TTL', 7 * 24 * 60 * 60)
+    else:
+        ttl = getattr(settings, 'MOVIE_METADATA_MISSING_TTL', 24 * 60 * 60)
+    return metadata.fetched_at <= now - timedelta(seconds=ttl)
+
+
+def resolve_metadata(imdb_ids, fetch=True):
+    """
+    Return {imdb_id: MovieMetadata} for the given IDs that have metadata.
+
+    Cached rows are read with one query. Missing or stale IDs are fetched from
+    the provider and upserted with store_metadata(), unless fetch is False.
+    A stale row whose refresh fails is still returned.
+    """
+    imdb_ids = set(imdb_ids)
+    if not imdb_ids:
+        return {}
+
+    cached = {metadata.imdb_id: metadata for metadata in MovieMetadata.objects.filter(imdb_id__in=imdb_ids)}
+    now = timezone.now()
+    wanted = [
+        imdb_id for imdb_id in sorted(imdb_ids)
+        if imdb_id not in cached or is_stale(cached[imdb_id], now)
+    ]
+    provider = get_provider() if fetch and wanted else None
+    if provider is not None:
+        cached.update(store_metadata(provider.fetch_many(wanted)))
+
+    return {imdb_id: metadata for imdb_id, metadata in cached.items() if metadata.found}
+
+
+def store_metadata(fetched):
+    """
+    Upsert {imdb_id: details or None} from a provider. Returns the saved rows
+    by imdb_id. SQLite limits the parameters per statement, so there a large
+    batch is written with several statements.
+    """
+    now = timezone.now()
+    rows = [
+        MovieMetadata(
+            imdb_id=imdb_id,
+            found=details is not None,
+            fetched_at=now,
+            **{field: str((details or {}).get(field) or '') for field in METADATA_FIELDS}
+        )
+        for imdb_id, details in fetched.items()
+    ]
+    if rows:
+        MovieMetadata.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['imdb_id'],
+            update_fields=['found', *METADATA_FIELDS, 'fetched_at']
+        )
+    return {row.imdb_id: row for row in rows}
+
+
+def wants_metadata(request):
+    """Whether the request asked for ?expand=metadata"""
+    return 'metadata' in request.GET.get('expand', '').split(',')
+
+
+def metadata_payload(metadata):
+    if metadata is None:
+        return None
+    return {field: getattr(metadata, field) for field in METADATA_FIELDS}
+
+
+def expand_movie_metadata(playlists):
+    """
+    Return copies of serialized playlists with each movie's metadata embedded
+    (None when unknown). Every IMDb ID across all of them is read from the
+    table in one query, so the query count doesn't grow with the playlists.
+    Nothing is fetched from the provider here.
+    """
+    return embed_metadata(playlists, resolve_metadata(movie_imdb_ids(playlists), fetch=False))
+
+
+async def aexpand_movie_metadata(playlists):
+    """expand_movie_metadata() for async views"""
+    imdb_ids = movie_imdb_ids(playlists)
+    found = {
+        metadata.imdb_id: metadata
+        async for metadata in MovieMetadata.objects.filter(imdb_id__in=imdb_ids, found=True)
+    } if imdb_ids else {}
+    return embed_metadata(playlists, found)
+
+
+def movie_imdb_ids(playlists):
+    return {movie['imdb_id'] for playlist in playlists for movie in playlist['movies']}
+
+
+def embed_metadata(playlists, found):
+    return [
+        {
+            **playlist,
+            'movies': [
+                {**movie, 'metadata': metadata_payload(found.get(movie['imdb_id']))}
+                for movie in playlist['movies']
+            ],
+        }
+        for playlist in playlists
+    ]
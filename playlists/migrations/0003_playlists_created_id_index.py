@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('playlists', '0002_movie_playlists_movies'),
+        ('users', '0007_customuser_created_id_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='playlists',
+            index=models.Index(fields=['created_at', 'id'], name='playlists_created_id_idx'),
+        ),
+    ]
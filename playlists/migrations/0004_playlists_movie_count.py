@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:33
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_movie_count(apps, schema_editor):
+    Playlists = apps.get_model('playlists', 'Playlists')
+    through = Playlists.movies.through
+    counts = (
+        through.objects.filter(playlists=OuterRef('pk'))
+        .order_by()
+        .values('playlists')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    Playlists.objects.update(movie_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('playlists', '0003_playlists_created_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playlists',
+            name='movie_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_movie_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('playlists', '0004_playlists_movie_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playlists',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
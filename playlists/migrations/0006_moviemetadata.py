@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('playlists', '0005_playlists_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieMetadata',
+            fields=[
+                ('imdb_id', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('found', models.BooleanField(default=True)),
+                ('title', models.CharField(blank=True, max_length=255)),
+                ('year', models.CharField(blank=True, max_length=16)),
+                ('poster', models.URLField(blank=True, max_length=500)),
+                ('fetched_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name_plural': 'Movie metadata',
+                'db_table': 'movie_metadata',
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('playlists', '0006_moviemetadata'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['-added_at'], name='movie_added_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='playlists',
+            index=models.Index(fields=['user', '-created_at'], name='playlists_user_created_idx'),
+        ),
+    ]
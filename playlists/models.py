@@ -1,10 +1,13 @@
 from django.db import models
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from users.models import CustomUser
 
 class Movie(models.Model):
     """
     Simple movie model that stores just the IMDb ID
-    All other movie data will be fetched from IMDb API when needed
+    Titles, years and posters are cached in MovieMetadata (see playlists/metadata.py)
     """
     imdb_id = models.CharField(max_length=20, unique=True)  # IMDb ID (e.g., "tt0111161")
     added_at = models.DateTimeField(auto_now_add=True)
@@ -12,10 +15,68 @@ class Movie(models.Model):
     class Meta:
         ordering = ['-added_at']
         verbose_name_plural = "Movies"
+        indexes = [
+            models.Index(fields=['-added_at'], name='movie_added_idx'),
+        ]
     
     def __str__(self):
         return f"Movie {self.imdb_id}"
 
+class MovieMetadata(models.Model):
+    """
+    Locally cached movie details from the configured metadata provider,
+    keyed by IMDb ID. Rows are refreshed once they are older than
+    MOVIE_METADATA_TTL. IDs the provider doesn't know are stored with
+    found=False, so they are not looked up again on every request.
+    """
+    imdb_id = models.CharField(max_length=20, primary_key=True)
+    found = models.BooleanField(default=True)
+    title = models.CharField(max_length=255, blank=True)
+    year = models.CharField(max_length=16, blank=True)  # OMDb years can be ranges ("2008–2013")
+    poster = models.URLField(max_length=500, blank=True)
+    fetched_at = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'movie_metadata'
+        verbose_name_plural = "Movie metadata"
+    
+    def __str__(self):
+        return f"{self.title or 'Unknown'} ({self.imdb_id})"
+
+class PlaylistsQuerySet(models.QuerySet):
+    """
+    Query helpers shared by the playlist read endpoints
+    """
+    def for_serializer(self):
+        """
+        Load everything PlaylistSerializer needs up front: the owner is joined
+        and movies are prefetched in one query
+        """
+        return self.select_related('user').prefetch_related('movies')
+    
+    def adjust_movie_count(self, delta):
+        """Shift the stored movie count by delta without reading it first"""
+        return self.update(movie_count=F('movie_count') + delta, updated_at=timezone.now())
+    
+    def _through_movie_count(self):
+        through = self.model.movies.through
+        counts = (
+            through.objects.filter(playlists=OuterRef('pk'))
+            .order_by()
+            .values('playlists')
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        return Coalesce(Subquery(counts), 0)
+    
+    def with_actual_movie_count(self):
+        """Annotate the movie count as counted from the through table"""
+        return self.annotate(actual_movie_count=self._through_movie_count())
+    
+    def recount_movies(self):
+        """Recompute the stored movie count from the through table"""
+        return self.update(movie_count=self._through_movie_count(), updated_at=timezone.now())
+
 class Playlists(models.Model):
     """
     Playlists are made for movies to be added to
@@ -23,16 +84,31 @@ class Playlists(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # Also bumped on movie changes, drives ETags
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='playlists')
     movies = models.ManyToManyField(Movie, blank=True, related_name='playlists')  # Many-to-many relationship
+    movie_count = models.PositiveIntegerField(default=0, editable=False)  # Kept in sync by playlists.signals
+    
+    objects = PlaylistsQuerySet.as_manager()
     
     class Meta:
         ordering = ['-created_at']  # Show newest playlists first
         verbose_name_plural = "Playlists"
+        indexes = [
+            # Keyset pagination seeks on (created_at, id)
+            models.Index(fields=['created_at', 'id'], name='playlists_created_id_idx'),
+            # A user's playlists, newest first, without a sort
+            models.Index(fields=['user', '-created_at'], name='playlists_user_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name} by {self.user.username}"
     
-    def movie_count(self):
-        """Return the number of movies in this playlist"""
-        return self.movies.count()
\ No newline at end of file
+    def save(self, *args, **kwargs):
+        # movie_count is maintained with F() updates, so never write back a stale in-memory copy
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'movie_count'
+            ]
+        super().save(*args, **kwargs)
@@ -0,0 +1,36 @@
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+from .models import Playlists
+
+
+@receiver(m2m_changed, sender=Playlists.movies.through)
+def update_movie_count(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Keep Playlists.movie_count in step with the movies through table.
+    Adds shift the count with an F() expression (pk_set only holds the rows
+    that were actually inserted); removes and clears recount from the table.
+    """
+    if reverse:
+        # instance is a Movie and pk_set holds playlist ids
+        if action == 'pre_clear':
+            instance._cleared_playlist_ids = list(instance.playlists.values_list('pk', flat=True))
+            return
+        if action == 'post_clear':
+            playlists = Playlists.objects.filter(pk__in=instance.__dict__.pop('_cleared_playlist_ids', []))
+        else:
+            playlists = Playlists.objects.filter(pk__in=pk_set or ())
+    else:
+        playlists = Playlists.objects.filter(pk=instance.pk)
+
+    if action == 'post_add':
+        if not pk_set:
+            return
+        playlists.adjust_movie_count(1 if reverse else len(pk_set))
+    elif action in ('post_remove', 'post_clear'):
+        playlists.recount_movies()
+    else:
+        return
+
+    if not reverse:
+        # The caller usually serializes the playlist next, so refresh the in-memory copy
+        instance.refresh_from_db(fields=['movie_count', 'updated_at'])
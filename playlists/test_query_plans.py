@@ -0,0 +1,181 @@
+"""
+Call every API view against a fixture, EXPLAIN each query it makes and fail
+on full table scans or sorts that an index should have avoided.
+"""
+import re
+
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from .metadata import store_metadata
+from .models import Movie, Playlists
+from users.models import CustomUser, ProfilePictureJob
+
+# Statements that have no plan worth checking
+UNPLANNED = re.compile(r'^\s*(SAVEPOINT|RELEASE|ROLLBACK|BEGIN|COMMIT|PRAGMA|SET)\b', re.IGNORECASE)
+
+# Plan lines that mean a missing or unusable index
+SQLITE_PROBLEMS = (
+    (re.compile(r'^SCAN (\S+)$'), 'full table scan'),
+    (re.compile(r'USE TEMP B-TREE'), 'temp B-tree sort'),
+)
+POSTGRES_PROBLEMS = (
+    (re.compile(r'Seq Scan on (\S+)'), 'full table scan'),
+    (re.compile(r'^\s*(->\s*)?(Incremental )?Sort\b'), 'sort'),
+)
+
+# The movies of some playlists, newest first, as the serializers and the
+# playlist movie manager load them
+PLAYLIST_MOVIES = re.compile(
+    r'^SELECT .* FROM "playlists_movie" INNER JOIN "playlists_playlists_movies" '
+    r'ON \("playlists_movie"\."id" = "playlists_playlists_movies"\."movie_id"\) '
+    r'WHERE "playlists_playlists_movies"\."playlists_id" (= %s|IN \(%s(, %s)*\)) '
+    r'ORDER BY (4|"playlists_movie"\."added_at") DESC$'
+)
+SQLITE_SORT = re.compile(r'^USE TEMP B-TREE FOR ORDER BY$')
+
+# Expected findings as (view name, statement pattern, plan line pattern, reason).
+# Each one covers a single query of a single view.
+ALLOWED = [
+    (view_name, PLAYLIST_MOVIES, SQLITE_SORT,
+     'SQLite finds the movies through the join, then sorts them; PostgreSQL walks the added_at index')
+    for view_name in (
+        'get_user_playlists', 'get_all_playlists', 'export_playlists', 'get_playlist', 'create_playlist',
+        'update_playlist', 'add_movie_to_playlist', 'remove_movie_from_playlist', 'bulk_update_playlist_movies',
+    )
+]
+
+PLAYLIST_COUNT = 50
+MOVIES_PER_PLAYLIST = 20
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class QueryPlanTests(TestCase):
+    """
+    Every payload is built from the database, so each view runs all of its
+    queries. On PostgreSQL a small fixture makes sequential scans cheapest,
+    so the planner is told to use an index whenever one exists and missing
+    ones stand out.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        users = CustomUser.objects.bulk_create([
+            CustomUser(email=f'plan{n}@example.com', uid=f'plan{n}', username=f'plan{n}')
+            for n in range(3)
+        ])
+        movies = Movie.objects.bulk_create([
+            Movie(imdb_id=f'9{n:06d}') for n in range(MOVIES_PER_PLAYLIST * 2)
+        ])
+        playlists = Playlists.objects.bulk_create([
+            Playlists(name=f'Plan {n}', user=users[n % len(users)])
+            for n in range(PLAYLIST_COUNT)
+        ])
+        through = Playlists.movies.through
+        through.objects.bulk_create([
+            through(playlists_id=playlist.id, movie_id=movie.id)
+            for n, playlist in enumerate(playlists)
+            for movie in movies[n % MOVIES_PER_PLAYLIST:n % MOVIES_PER_PLAYLIST + MOVIES_PER_PLAYLIST]
+        ])
+        Playlists.objects.all().recount_movies()
+        store_metadata({movie.imdb_id: {'title': movie.imdb_id} for movie in movies[::2]})
+        cls.user, cls.other_user = users[0], users[1]
+        cls.playlist, cls.doomed_playlist = playlists[0], playlists[-1]
+        cls.movie = movies[0]
+        cls.new_imdb_id = '8000000'
+        cls.job = ProfilePictureJob.objects.create(user=users[0])
+
+    def setUp(self):
+        self.client = Client()
+        if connection.vendor == 'postgresql':
+            # Undone when the test's transaction rolls back
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('SET LOCAL enable_sort = off')
+
+    def test_reads(self):
+        user, playlist = self.user, self.playlist
+        self.check_view('get_user_playlists', 'get', f'/api/playlists/user/{user.uid}/')
+        self.check_view('get_user_playlists', 'get', f'/api/playlists/user/{user.uid}/?expand=metadata')
+        self.check_view('get_all_playlists', 'get', '/api/playlists/all/?page_size=10&include_total=true')
+        self.check_view('get_all_playlists', 'get', self.next_page('/api/playlists/all/?page_size=10'))
+        self.check_view('export_playlists', 'get', '/api/playlists/export/')
+        self.check_view('get_playlist', 'get', f'/api/playlists/{playlist.id}/')
+        self.check_view('get_playlist', 'get', f'/api/playlists/{playlist.id}/?expand=metadata')
+        self.check_view('get_public_user', 'get', f'/api/users/{user.uid}/')
+        self.check_view('get_username_user', 'get', f'/api/users/username/{user.username}/')
+        self.check_view('get_all_users', 'get', '/api/users/all/?page_size=2')
+        self.check_view('get_all_users', 'get', self.next_page('/api/users/all/?page_size=2'))
+        self.check_view('export_users', 'get', '/api/users/export/')
+        self.check_view('check_user_exists', 'get', f'/api/users/check/{user.uid}/')
+        self.check_view('check_user_username_exists', 'get', f'/api/users/check/username/{user.username}/')
+        self.check_view('get_profile_picture_job', 'get', f'/api/users/profile-picture/jobs/{self.job.id}/')
+
+    def test_writes(self):
+        playlist = self.playlist
+        self.check_view('create_playlist', 'post', f'/api/playlists/create/{self.user.uid}/', {'name': 'Plan check'})
+        self.check_view('update_playlist', 'put', f'/api/playlists/{playlist.id}/update/', {'name': 'Renamed'})
+        self.check_view('add_movie_to_playlist', 'post', f'/api/playlists/{playlist.id}/add-movie/', {
+            'imdb_id': self.new_imdb_id
+        })
+        self.check_view(
+            'remove_movie_from_playlist', 'delete',
+            f'/api/playlists/{playlist.id}/remove-movie/{self.new_imdb_id}/'
+        )
+        self.check_view('bulk_update_playlist_movies', 'post', f'/api/playlists/{playlist.id}/movies/bulk/', {
+            'add': [self.new_imdb_id], 'remove': [self.movie.imdb_id]
+        })
+        self.check_view('change_username', 'put', f'/api/users/{self.other_user.uid}/change_username/', {
+            'new_username': f'r{self.other_user.username}'
+        })
+        self.check_view('delete_playlist', 'delete', f'/api/playlists/{self.doomed_playlist.id}/delete/')
+
+    def next_page(self, url):
+        return self.client.get(url).json()['next']
+
+    def check_view(self, view_name, method, url, body=None):
+        """Call one view, then check the plan of every statement it ran"""
+        statements = []
+
+        def capture(execute, sql, params, many, context):
+            statements.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(capture):
+            if body is None:
+                response = getattr(self.client, method)(url)
+            else:
+                response = getattr(self.client, method)(url, body, content_type='application/json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 400, f'{view_name} {url}')
+
+        problems = []
+        for sql, params in statements:
+            if UNPLANNED.match(sql) or not params and sql.lstrip().upper().startswith('INSERT'):
+                continue
+            for detail in self.explain(sql, params):
+                problem = self.problem(detail)
+                if problem and not self.allowed(view_name, sql, detail):
+                    problems.append(f'{problem}: {detail}\n    {sql[:300]}')
+        self.assertEqual(problems, [], f'{view_name} {url}')
+
+    def explain(self, sql, params):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                return [row[-1] for row in cursor.fetchall()]
+            cursor.execute(f'EXPLAIN {sql}', params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def problem(self, detail):
+        patterns = SQLITE_PROBLEMS if connection.vendor == 'sqlite' else POSTGRES_PROBLEMS
+        for pattern, problem in patterns:
+            if pattern.search(detail):
+                return problem
+        return None
+
+    def allowed(self, view_name, sql, detail):
+        return any(
+            view == view_name and sql_pattern.match(sql) and detail_pattern.search(detail)
+            for view, sql_pattern, detail_pattern, _reason in ALLOWED
+        )
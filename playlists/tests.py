@@ -0,0 +1,439 @@
+import io
+import json
+import threading
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, TransactionTestCase
+from rest_framework.test import APIClient
+from . import metadata
+from .membership import add_movie, remove_movie, update_playlist_movies
+from .models import Movie, Playlists
+from .serializers import PlaylistSerializer
+from users.models import CustomUser
+from moviememo_backend.cache import get_cache, get_or_build, invalidate
+
+
+def make_user(n):
+    return CustomUser.objects.create(uid=f'uid-{n}', username=f'user{n}', email=f'user{n}@example.com')
+
+
+def make_playlist(user, name='Playlist', imdb_ids=()):
+    playlist = Playlists.objects.create(user=user, name=name)
+    if imdb_ids:
+        playlist.movies.add(*[Movie.objects.get_or_create(imdb_id=imdb_id)[0] for imdb_id in imdb_ids])
+    return playlist
+
+
+class PlaylistReadQueryCountTests(TestCase):
+    """
+    The read endpoints load owners, movies and counts in bulk, so the
+    number of queries doesn't grow with the number of playlists
+    """
+
+    def setUp(self):
+        get_cache().clear()
+        self.client = APIClient()
+        self.user = make_user(1)
+
+    def make_playlists(self, count):
+        for i in range(count):
+            owner = make_user(f'{count}-{i}') if i % 2 else self.user
+            make_playlist(owner, f'Playlist {i}', [f'{i:07d}', f'{i + 1000:07d}'])
+
+    def assert_constant_queries(self, url, queries):
+        for count in (1, 10):
+            with self.subTest(playlists=count):
+                Playlists.objects.all().delete()
+                CustomUser.objects.exclude(pk=self.user.pk).delete()
+                self.make_playlists(count)
+                get_cache().clear()
+                with self.assertNumQueries(queries):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_get_all_playlists(self):
+        self.assert_constant_queries('/api/playlists/all/', 2)
+
+    def test_get_user_playlists(self):
+        # Validators, the user, the playlists with their owner, and the movies
+        self.assert_constant_queries(f'/api/playlists/user/{self.user.uid}/', 4)
+
+    def test_get_playlist(self):
+        playlist = make_playlist(self.user, 'Favourites', ['0111161', '0068646', '0071562'])
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/playlists/{playlist.id}/')
+        self.assertEqual(len(response.json()['playlist']['movies']), 3)
+        self.assertEqual(response.json()['playlist']['movie_count'], 3)
+
+    def test_cached_playlist_only_checks_validators(self):
+        playlist = make_playlist(self.user, 'Favourites', ['0111161'])
+        self.client.get(f'/api/playlists/{playlist.id}/')
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/playlists/{playlist.id}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_serializer_on_shared_queryset(self):
+        self.make_playlists(10)
+        with self.assertNumQueries(2):
+            data = PlaylistSerializer(Playlists.objects.for_serializer(), many=True).data
+        self.assertEqual(len(data), 10)
+        self.assertTrue(all(playlist['movie_count'] == 2 for playlist in data))
+
+
+class PlaylistCacheTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.client = APIClient()
+        self.user = make_user(1)
+
+    def test_deleted_playlist_is_not_served_from_cache(self):
+        playlist = make_playlist(self.user, 'Favourites', ['0111161'])
+        self.assertEqual(self.client.get(f'/api/playlists/{playlist.id}/').status_code, 200)
+        self.assertEqual(len(self.client.get(f'/api/playlists/user/{self.user.uid}/').json()['playlists']), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f'/api/playlists/{playlist.id}/delete/').status_code, 200)
+
+        self.assertEqual(self.client.get(f'/api/playlists/{playlist.id}/').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/playlists/user/{self.user.uid}/').json()['playlists'], [])
+
+    def test_build_overlapping_a_write_is_not_served(self):
+        def stale_build():
+            # A write commits while this build is reading the old data
+            with self.captureOnCommitCallbacks(execute=True):
+                invalidate('key')
+            return {'version': 'stale'}
+
+        self.assertEqual(get_or_build('key', stale_build), {'version': 'stale'})
+        self.assertEqual(get_or_build('key', lambda: {'version': 'fresh'}), {'version': 'fresh'})
+        self.assertEqual(get_or_build('key', lambda: {'version': 'unused'}), {'version': 'fresh'})
+
+
+class MembershipTests(TestCase):
+    """
+    Query counts include the SAVEPOINT and RELEASE of the atomic() block
+    in add_movie() and remove_movie()
+    """
+
+    def setUp(self):
+        self.user = make_user(1)
+        self.playlist = make_playlist(self.user, 'Favourites')
+
+    def test_add_query_counts(self):
+        # Insert the movie, link it and bump the count
+        with self.assertNumQueries(5):
+            self.assertIs(add_movie(self.playlist.id, '0111161'), True)
+        # Nothing is linked, so check whether the playlist exists
+        with self.assertNumQueries(5):
+            self.assertIs(add_movie(self.playlist.id, '0111161'), False)
+        with self.assertNumQueries(5):
+            self.assertIsNone(add_movie(self.playlist.id + 1, '0111161'))
+        self.playlist.refresh_from_db()
+        self.assertEqual(self.playlist.movie_count, 1)
+
+    def test_add_to_a_playlist_deleted_meanwhile(self):
+        def add_then_delete(playlist_id, imdb_id):
+            added = add_movie(playlist_id, imdb_id)
+            Playlists.objects.filter(id=playlist_id).delete()
+            return added
+
+        with mock.patch('playlists.views.add_movie', add_then_delete):
+            response = APIClient().post(
+                f'/api/playlists/{self.playlist.id}/add-movie/', {'imdb_id': '0111161'}, format='json'
+            )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'message': 'Playlist not found'})
+
+    def test_remove(self):
+        add_movie(self.playlist.id, '0111161')
+        # Unlink and lower the count
+        with self.assertNumQueries(4):
+            self.assertIs(remove_movie(self.playlist.id, '0111161'), True)
+        self.playlist.refresh_from_db()
+        self.assertEqual(self.playlist.movie_count, 0)
+        self.assertTrue(Movie.objects.filter(imdb_id='0111161').exists())
+
+    def test_remove_missing_movie(self):
+        add_movie(self.playlist.id, '0111161')
+        Movie.objects.create(imdb_id='0068646')
+        # Neither a movie outside the playlist nor an unknown one gets past the DELETE
+        for imdb_id in ('0068646', '9999999'):
+            with self.subTest(imdb_id=imdb_id), self.assertNumQueries(3):
+                self.assertIs(remove_movie(self.playlist.id, imdb_id), False)
+        self.playlist.refresh_from_db()
+        self.assertEqual(self.playlist.movie_count, 1)
+
+    def test_remove_movie_endpoint_errors(self):
+        client = APIClient()
+        add_movie(self.playlist.id, '0111161')
+        Movie.objects.create(imdb_id='0068646')
+        cases = [
+            (self.playlist.id + 1, '0111161', 404, 'Playlist not found'),
+            (self.playlist.id, '9999999', 404, 'Movie not found'),
+            (self.playlist.id, '0068646', 400, 'Movie 0068646 is not in this playlist'),
+        ]
+        for playlist_id, imdb_id, status_code, message in cases:
+            with self.subTest(imdb_id=imdb_id):
+                response = client.delete(f'/api/playlists/{playlist_id}/remove-movie/{imdb_id}/')
+                self.assertEqual(response.status_code, status_code)
+                self.assertEqual(response.json()['message'], message)
+
+
+class ConcurrentMembershipTests(TransactionTestCase):
+    """
+    Callers in separate threads, outside a test transaction, so concurrent
+    adds really commit against each other
+    """
+
+    def setUp(self):
+        self.user = make_user(1)
+        self.playlist = make_playlist(self.user, 'Favourites')
+
+    def run_concurrently(self, function, callers):
+        barrier = threading.Barrier(callers)
+        results = []
+        errors = []
+
+        def call():
+            try:
+                barrier.wait()
+                results.append(function())
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=call) for _ in range(callers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return results
+
+    def test_concurrent_adds_of_the_same_movie(self):
+        results = self.run_concurrently(lambda: add_movie(self.playlist.id, '0111161'), 4)
+
+        self.assertEqual(sorted(results), [False, False, False, True])
+        self.assertEqual(Movie.objects.filter(imdb_id='0111161').count(), 1)
+        self.assertEqual(Playlists.movies.through.objects.filter(playlists=self.playlist).count(), 1)
+        self.playlist.refresh_from_db()
+        self.assertEqual(self.playlist.movie_count, 1)
+
+    def test_concurrent_removes_of_the_same_movie(self):
+        add_movie(self.playlist.id, '0111161')
+        results = self.run_concurrently(lambda: remove_movie(self.playlist.id, '0111161'), 4)
+
+        self.assertEqual(sorted(results), [False, False, False, True])
+        self.playlist.refresh_from_db()
+        self.assertEqual(self.playlist.movie_count, 0)
+
+
+class OMDbProviderTests(TestCase):
+    def test_provider_must_implement_fetch(self):
+        class Incomplete(metadata.MetadataProvider):
+            batch_size = 5
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+    def fetch(self, imdb_id, answer):
+        requested = []
+
+        def urlopen(url, timeout):
+            requested.append(parse_qs(urlparse(url).query)['i'][0])
+            return io.BytesIO(json.dumps(answer).encode())
+
+        with mock.patch.object(metadata, 'urlopen', urlopen):
+            try:
+                return metadata.OMDbProvider(api_key='key').fetch(imdb_id)
+            finally:
+                self.assertEqual(requested, ['tt0111161'])
+
+    def test_sends_ids_with_the_tt_prefix(self):
+        answer = {'Response': 'True', 'Title': 'The Shawshank Redemption', 'Year': '1994', 'Poster': 'N/A'}
+        for imdb_id in ('0111161', 'tt0111161'):
+            with self.subTest(imdb_id=imdb_id):
+                self.assertEqual(
+                    self.fetch(imdb_id, answer),
+                    {'title': 'The Shawshank Redemption', 'year': '1994', 'poster': ''}
+                )
+
+    def test_unknown_id_is_not_found(self):
+        self.assertIsNone(self.fetch('0111161', {'Response': 'False', 'Error': 'Error getting data.'}))
+
+    def test_rejected_id_is_retried_later(self):
+        # Raising leaves the ID out of fetch_many(), so it isn't cached as not found
+        with self.assertRaises(RuntimeError):
+            self.fetch('0111161', {'Response': 'False', 'Error': 'Incorrect IMDb ID.'})
+
+
+class MetadataExpansionTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.client = APIClient()
+        self.user = make_user(1)
+
+    def test_expansion_reads_only_the_table(self):
+        counts = []
+        for size in (1, 200):
+            with self.subTest(movies=size):
+                imdb_ids = [f'{size}{n:06d}' for n in range(size)]
+                playlist = make_playlist(self.user, f'Playlist {size}', imdb_ids)
+                # Only the first movie is known; the rest must come back as null, not be fetched
+                metadata.store_metadata({imdb_ids[0]: {'title': 'Known', 'year': '1994'}})
+                with mock.patch.object(metadata, 'get_provider') as get_provider, \
+                        CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(f'/api/playlists/{playlist.id}/?expand=metadata')
+                get_provider.assert_not_called()
+                counts.append(len(queries))
+
+                movies = {movie['imdb_id']: movie['metadata'] for movie in response.json()['playlist']['movies']}
+                self.assertEqual(movies.pop(imdb_ids[0]), {'title': 'Known', 'year': '1994', 'poster': ''})
+                self.assertTrue(all(value is None for value in movies.values()))
+        self.assertEqual(counts[0], counts[1])
+
+
+class BulkPlaylistMoviesTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = make_user(1)
+        self.playlist = make_playlist(self.user, 'Favourites', ['0111161', '0068646'])
+        self.playlist.refresh_from_db()
+        self.url = f'/api/playlists/{self.playlist.id}/movies/bulk/'
+
+    def post(self, body):
+        return self.client.post(self.url, body, format='json')
+
+    def statuses(self, response):
+        return [(result['imdb_id'], result['action'], result['status']) for result in response.json()['results']]
+
+    def test_playlist_deleted_meanwhile(self):
+        def update_then_delete(playlist_id, **changes):
+            statuses = update_playlist_movies(playlist_id, **changes)
+            Playlists.objects.filter(id=playlist_id).delete()
+            return statuses
+
+        with mock.patch('playlists.views.update_playlist_movies', update_then_delete):
+            response = self.post({'add': ['0071562']})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'message': 'Playlist not found'})
+
+    def test_statuses(self):
+        response = self.post({
+            'add': ['0071562', '0111161', 'abc'],
+            'remove': ['0068646', '0050083'],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.statuses(response), [
+            ('0071562', 'add', 'added'),
+            ('0111161', 'add', 'already_in_playlist'),
+            ('abc', 'add', 'invalid'),
+            ('0068646', 'remove', 'removed'),
+            ('0050083', 'remove', 'not_in_playlist'),
+        ])
+        self.assertEqual(response.json()['playlist']['movie_count'], 2)
+        self.assertEqual(
+            {movie['imdb_id'] for movie in response.json()['playlist']['movies']},
+            {'0111161', '0071562'}
+        )
+        self.playlist.refresh_from_db()
+        self.assertEqual(self.playlist.movie_count, 2)
+
+    def test_duplicate_ids(self):
+        response = self.post({'add': ['0071562', '0071562'], 'remove': [' 0071562', '0111161']})
+        self.assertEqual(self.statuses(response), [
+            ('0071562', 'add', 'added'),
+            ('0071562', 'add', 'invalid'),
+            ('0071562', 'remove', 'invalid'),
+            ('0111161', 'remove', 'removed'),
+        ])
+        self.assertEqual(
+            response.json()['results'][1]['errors'],
+            ['IMDb ID appears more than once in this request']
+        )
+        self.playlist.refresh_from_db()
+        self.assertEqual(self.playlist.movie_count, 2)
+
+    def test_size_limits(self):
+        self.assertEqual(self.post({'add': [], 'remove': []}).status_code, 400)
+        self.assertEqual(self.post({'add': [f'{n:07d}' for n in range(501)]}).status_code, 400)
+
+        response = self.post({
+            'add': [f'1{n:06d}' for n in range(500)],
+            'remove': [f'2{n:06d}' for n in range(499)] + ['0111161'],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 1000)
+        self.playlist.refresh_from_db()
+        self.assertEqual(self.playlist.movie_count, 501)
+
+    def test_missing_playlist(self):
+        response = self.client.post(
+            f'/api/playlists/{self.playlist.id + 1}/movies/bulk/', {'add': ['0071562']}, format='json'
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['message'], 'Playlist not found')
+
+
+class MovieCountTests(TestCase):
+    def setUp(self):
+        self.user = make_user(1)
+        self.playlist = make_playlist(self.user, 'Favourites')
+        self.other = make_playlist(self.user, 'Watch later')
+        self.movies = [Movie.objects.create(imdb_id=f'{n:07d}') for n in range(1, 4)]
+
+    def assert_counts(self, *counts):
+        stored = [Playlists.objects.get(pk=playlist.pk).movie_count for playlist in (self.playlist, self.other)]
+        self.assertEqual(stored, list(counts))
+
+    def test_forward_changes(self):
+        first, second, third = self.movies
+        self.playlist.movies.add(first, second)
+        self.assertEqual(self.playlist.movie_count, 2)
+        # Re-adding a movie already in the playlist leaves the count alone
+        self.playlist.movies.add(first, third)
+        self.assert_counts(3, 0)
+        self.playlist.movies.remove(second)
+        self.assert_counts(2, 0)
+        self.playlist.movies.set([second])
+        self.assert_counts(1, 0)
+        self.playlist.movies.clear()
+        self.assert_counts(0, 0)
+        self.assertEqual(self.playlist.movie_count, 0)
+
+    def test_reverse_changes(self):
+        movie = self.movies[0]
+        movie.playlists.add(self.playlist, self.other)
+        self.assert_counts(1, 1)
+        movie.playlists.add(self.playlist)
+        self.assert_counts(1, 1)
+        movie.playlists.remove(self.other)
+        self.assert_counts(1, 0)
+        movie.playlists.set([self.other])
+        self.assert_counts(0, 1)
+        movie.playlists.add(self.playlist)
+        movie.playlists.clear()
+        self.assert_counts(0, 0)
+
+    def test_reconcile_repairs_drift_from_deleted_movies(self):
+        self.playlist.movies.add(*self.movies)
+        self.other.movies.add(self.movies[0])
+        # The cascade deletes the through rows without sending m2m_changed
+        self.movies[0].delete()
+        self.assert_counts(3, 1)
+
+        out = io.StringIO()
+        call_command('reconcile_movie_counts', '--dry-run', stdout=out)
+        self.assertIn(f'Playlist {self.playlist.pk}: stored 3, actual 2', out.getvalue())
+        self.assertIn('Found 2 with drift', out.getvalue())
+        self.assert_counts(3, 1)
+
+        out = io.StringIO()
+        call_command('reconcile_movie_counts', stdout=out)
+        self.assertIn('Fixed 2 with drift', out.getvalue())
+        self.assert_counts(2, 0)
@@ -1,6 +1,13 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+# ASYNC_VIEWS serves the read endpoints from async_views.py, for ASGI deployments
+if getattr(settings, 'ASYNC_VIEWS', False):
+    from . import async_views as read_views
+else:
+    read_views = views
+
 urlpatterns = [
     # POST /api/playlists/create/<user_uid>/
     # Create a new playlist for a user
@@ -8,15 +15,19 @@ urlpatterns = [
     
     # GET /api/playlists/user/<user_uid>/
     # Get all playlists for a specific user
-    path('user/<str:user_uid>/', views.get_user_playlists, name='get_user_playlists'),
+    path('user/<str:user_uid>/', read_views.get_user_playlists, name='get_user_playlists'),
     
     # GET /api/playlists/all/
     # Get all playlists (public view)
     path('all/', views.get_all_playlists, name='get_all_playlists'),
     
+    # GET /api/playlists/export/
+    # Stream all playlists as NDJSON (resumable with ?after_id=)
+    path('export/', views.export_playlists, name='export_playlists'),
+    
     # GET /api/playlists/<playlist_id>/
     # Get a specific playlist
-    path('<int:playlist_id>/', views.get_playlist, name='get_playlist'),
+    path('<int:playlist_id>/', read_views.get_playlist, name='get_playlist'),
     
     # PUT /api/playlists/<playlist_id>/update/
     # Update a playlist
@@ -33,4 +44,8 @@ urlpatterns = [
     # DELETE /api/playlists/<playlist_id>/remove-movie/<imdb_id>/
     # Remove a movie from a playlist by IMDb ID
     path('<int:playlist_id>/remove-movie/<str:imdb_id>/', views.remove_movie_from_playlist, name='remove_movie_from_playlist'),
+    
+    # POST /api/playlists/<playlist_id>/movies/bulk/
+    # Add and/or remove many movies by IMDb ID in one request
+    path('<int:playlist_id>/movies/bulk/', views.bulk_update_playlist_movies, name='bulk_update_playlist_movies'),
 ]
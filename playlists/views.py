@@ -1,9 +1,23 @@
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
 from .models import Playlists, Movie
-from .serializers import PlaylistSerializer, CreatePlaylistSerializer, AddMovieToPlaylistSerializer
+from .membership import add_movie, remove_movie, update_playlist_movies
+from .metadata import expand_movie_metadata, wants_metadata
+from .serializers import (
+    PlaylistSerializer, PlaylistValuesSerializer, CreatePlaylistSerializer, AddMovieToPlaylistSerializer,
+    BulkPlaylistMoviesSerializer
+)
 from users.models import CustomUser
+from moviememo_backend.cache import (
+    get_or_build, invalidate, invalidate_playlist, playlist_key, user_playlists_key
+)
+from moviememo_backend.conditional import conditional_get, make_etag
+from moviememo_backend.export import ndjson_response, parse_export_params
+from moviememo_backend.pagination import KeysetPagination
 
 @api_view(['POST'])
 def create_playlist(request, user_uid):
@@ -22,6 +36,7 @@ def create_playlist(request, user_uid):
     
     if serializer.is_valid():
         playlist = serializer.save(user=user)
+        invalidate(user_playlists_key(user.uid))
         
         # Return full playlist data with public user info
         response_serializer = PlaylistSerializer(playlist)
@@ -41,56 +56,130 @@ def create_playlist(request, user_uid):
         status=status.HTTP_400_BAD_REQUEST
     )
 
+def user_playlists_versions(user_uid):
+    """(user updated_at, latest playlist updated_at, playlist count) as a query of at most one row"""
+    # Playlist count catches deletions, which leave the latest updated_at alone
+    # uid is unique, so skip the ORDER BY first() would add on top of the GROUP BY
+    return (
+        CustomUser.objects.filter(uid=user_uid)
+        .annotate(latest=Max('playlists__updated_at'), total=Count('playlists'))
+        .order_by()
+        .values_list('updated_at', 'latest', 'total')[:1]
+    )
+
+def user_playlists_etag(row):
+    user_updated_at, latest, total = row
+    return make_etag(user_updated_at, latest, total), max(filter(None, (user_updated_at, latest)))
+
+def user_playlists_validators(user_uid):
+    rows = list(user_playlists_versions(user_uid))
+    if not rows:
+        return None
+    return user_playlists_etag(rows[0])
+
 @api_view(['GET'])
+@conditional_get(user_playlists_validators, bypass=wants_metadata)
 def get_user_playlists(request, user_uid):
     """
-    Get all playlists for a specific user
+    Get all playlists for a specific user.
+    Pass ?expand=metadata to embed each movie's title, year and poster.
     """
-    try:
-        user = CustomUser.objects.get(uid=user_uid)
-    except CustomUser.DoesNotExist:
+    def build():
+        try:
+            user = CustomUser.objects.get(uid=user_uid)
+        except CustomUser.DoesNotExist:
+            return None
+        
+        playlists = list(PlaylistValuesSerializer.values(Playlists.objects.filter(user=user)))
+        serializer = PlaylistValuesSerializer(playlists, many=True)
+        return {
+            'playlists': serializer.data,
+            'count': len(playlists)
+        }
+    
+    payload = get_or_build(user_playlists_key(user_uid), build)
+    if payload is None:
         return Response(
             {'message': 'User not found'},
             status=status.HTTP_404_NOT_FOUND
         )
     
-    playlists = Playlists.objects.filter(user=user)
-    serializer = PlaylistSerializer(playlists, many=True)
+    # Metadata is layered on top of the cached payload, which never contains it
+    if wants_metadata(request):
+        payload = {**payload, 'playlists': expand_movie_metadata(payload['playlists'])}
     
-    return Response({
-        'playlists': serializer.data,
-        'count': playlists.count()
-    })
+    return Response(payload)
 
 @api_view(['GET'])
 def get_all_playlists(request):
     """
-    Get all playlists (public view)
+    Get all playlists (public view), newest first.
+    Paginated with keyset cursors; pass ?include_total=true for the total count.
     """
-    playlists = Playlists.objects.all()
-    serializer = PlaylistSerializer(playlists, many=True)
+    paginator = KeysetPagination()
+    playlists = paginator.paginate_queryset(PlaylistValuesSerializer.values(Playlists.objects.all()), request)
+    serializer = PlaylistValuesSerializer(playlists, many=True)
     
-    return Response({
-        'playlists': serializer.data,
-        'count': playlists.count()
-    })
+    return paginator.get_paginated_response(serializer.data, 'playlists')
 
 @api_view(['GET'])
-def get_playlist(request, playlist_id):
+def export_playlists(request):
     """
-    Get a specific playlist by ID
+    Stream every playlist with its movies as NDJSON, one playlist per line.
+    Resume an interrupted export with ?after_id=<last exported id>.
     """
     try:
-        playlist = Playlists.objects.get(id=playlist_id)
-        serializer = PlaylistSerializer(playlist)
-        return Response({
-            'playlist': serializer.data
-        })
-    except Playlists.DoesNotExist:
+        after_id, chunk_size = parse_export_params(request)
+    except ValueError:
+        return Response(
+            {'message': 'after_id and chunk_size must be positive integers'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    return ndjson_response(
+        Playlists.objects.for_serializer(),
+        PlaylistSerializer(),
+        after_id=after_id,
+        chunk_size=chunk_size,
+        filename='playlists.ndjson'
+    )
+
+def playlist_versions(playlist_id):
+    return Playlists.objects.filter(id=playlist_id).values_list('updated_at', 'user__updated_at')
+
+def playlist_validators(playlist_id):
+    row = playlist_versions(playlist_id).first()
+    if row is None:
+        return None
+    return make_etag(*row), max(row)
+
+@api_view(['GET'])
+@conditional_get(playlist_validators, bypass=wants_metadata)
+def get_playlist(request, playlist_id):
+    """
+    Get a specific playlist by ID.
+    Pass ?expand=metadata to embed each movie's title, year and poster.
+    """
+    def build():
+        try:
+            playlist = PlaylistValuesSerializer.values(Playlists.objects.all()).get(id=playlist_id)
+        except Playlists.DoesNotExist:
+            return None
+        return {
+            'playlist': PlaylistValuesSerializer(playlist).data
+        }
+    
+    payload = get_or_build(playlist_key(playlist_id), build)
+    if payload is None:
         return Response(
             {'message': 'Playlist not found'},
             status=status.HTTP_404_NOT_FOUND
         )
+    
+    if wants_metadata(request):
+        payload = {'playlist': expand_movie_metadata([payload['playlist']])[0]}
+    
+    return Response(payload)
 
 @api_view(['PUT'])
 def update_playlist(request, playlist_id):
@@ -98,7 +187,7 @@ def update_playlist(request, playlist_id):
     Update a playlist (name and/or description)
     """
     try:
-        playlist = Playlists.objects.get(id=playlist_id)
+        playlist = Playlists.objects.select_related('user').get(id=playlist_id)
     except Playlists.DoesNotExist:
         return Response(
             {'message': 'Playlist not found'},
@@ -109,6 +198,7 @@ def update_playlist(request, playlist_id):
     
     if serializer.is_valid():
         playlist = serializer.save()
+        invalidate_playlist(playlist)
         
         # Return updated playlist with public user info
         response_serializer = PlaylistSerializer(playlist)
@@ -134,9 +224,13 @@ def delete_playlist(request, playlist_id):
     Delete a playlist
     """
     try:
-        playlist = Playlists.objects.get(id=playlist_id)
+        playlist = Playlists.objects.select_related('user').get(id=playlist_id)
         playlist_name = playlist.name
-        playlist.delete()
+        with transaction.atomic():
+            playlist.delete()
+            # Deleting leaves no newer row behind, so touch the owner for Last-Modified
+            CustomUser.objects.filter(pk=playlist.user_id).update(updated_at=timezone.now())
+            invalidate(playlist_key(playlist_id), user_playlists_key(playlist.user.uid))
         
         return Response(
             {
@@ -155,33 +249,32 @@ def add_movie_to_playlist(request, playlist_id):
     """
     Add a movie to a playlist by IMDb ID
     """
-    try:
-        playlist = Playlists.objects.get(id=playlist_id)
-    except Playlists.DoesNotExist:
-        return Response(
-            {'message': 'Playlist not found'},
-            status=status.HTTP_404_NOT_FOUND
-        )
-    
     serializer = AddMovieToPlaylistSerializer(data=request.data)
     
     if serializer.is_valid():
         imdb_id = serializer.validated_data['imdb_id']
         
-        # Get or create the movie
-        movie, created = Movie.objects.get_or_create(imdb_id=imdb_id)
-        
-        # Check if movie is already in playlist
-        if playlist.movies.filter(id=movie.id).exists():
+        # Insert the movie and the playlist link, tolerating concurrent adds
+        added = add_movie(playlist_id, imdb_id)
+        if added is None:
+            return Response(
+                {'message': 'Playlist not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        if not added:
             return Response(
                 {'message': f'Movie {imdb_id} is already in this playlist'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Add movie to playlist
-        playlist.movies.add(movie)
-        
-        # Return updated playlist
+        # Return updated playlist, unless it was deleted in the meantime
+        playlist = Playlists.objects.for_serializer().filter(id=playlist_id).first()
+        if playlist is None:
+            return Response(
+                {'message': 'Playlist not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        invalidate_playlist(playlist)
         response_serializer = PlaylistSerializer(playlist)
         return Response(
             {
@@ -204,38 +297,109 @@ def remove_movie_from_playlist(request, playlist_id, imdb_id):
     """
     Remove a movie from a playlist by IMDb ID
     """
-    try:
-        playlist = Playlists.objects.get(id=playlist_id)
-    except Playlists.DoesNotExist:
+    if not remove_movie(playlist_id, imdb_id):
+        # Nothing was deleted; work out which error to report
+        if not Playlists.objects.filter(id=playlist_id).exists():
+            return Response(
+                {'message': 'Playlist not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        if not Movie.objects.filter(imdb_id=imdb_id).exists():
+            return Response(
+                {'message': 'Movie not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
         return Response(
-            {'message': 'Playlist not found'},
-            status=status.HTTP_404_NOT_FOUND
+            {'message': f'Movie {imdb_id} is not in this playlist'},
+            status=status.HTTP_400_BAD_REQUEST
         )
     
+    # Return updated playlist
+    playlist = Playlists.objects.for_serializer().get(id=playlist_id)
+    invalidate_playlist(playlist)
+    response_serializer = PlaylistSerializer(playlist)
+    return Response(
+        {
+            'message': f'Movie {imdb_id} removed from playlist successfully',
+            'playlist': response_serializer.data
+        },
+        status=status.HTTP_200_OK
+    )
+
+@api_view(['POST'])
+def bulk_update_playlist_movies(request, playlist_id):
+    """
+    Add and/or remove many movies in one request.
+    Body: {"add": ["1234567", ...], "remove": ["7654321", ...]}
+    Returns a result for every IMDb ID and the updated playlist.
+    """
     try:
-        movie = Movie.objects.get(imdb_id=imdb_id)
-    except Movie.DoesNotExist:
+        playlist = Playlists.objects.select_related('user').get(id=playlist_id)
+    except Playlists.DoesNotExist:
         return Response(
-            {'message': 'Movie not found'},
+            {'message': 'Playlist not found'},
             status=status.HTTP_404_NOT_FOUND
         )
     
-    # Check if movie is in playlist
-    if not playlist.movies.filter(id=movie.id).exists():
+    serializer = BulkPlaylistMoviesSerializer(data=request.data)
+    
+    if not serializer.is_valid():
         return Response(
-            {'message': f'Movie {imdb_id} is not in this playlist'},
+            {
+                'message': 'Failed to update playlist movies',
+                'errors': serializer.errors
+            },
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    # Remove movie from playlist
-    playlist.movies.remove(movie)
+    # Check each ID with the single-movie rules so one bad ID doesn't sink the batch
+    results = []
+    valid = {'add': [], 'remove': []}
+    seen = set()
+    for action in ('add', 'remove'):
+        for raw_id in serializer.validated_data[action]:
+            id_serializer = AddMovieToPlaylistSerializer(data={'imdb_id': raw_id})
+            if not id_serializer.is_valid():
+                results.append({
+                    'imdb_id': raw_id,
+                    'action': action,
+                    'status': 'invalid',
+                    'errors': id_serializer.errors['imdb_id']
+                })
+                continue
+            imdb_id = id_serializer.validated_data['imdb_id']
+            if imdb_id in seen:
+                results.append({
+                    'imdb_id': imdb_id,
+                    'action': action,
+                    'status': 'invalid',
+                    'errors': ['IMDb ID appears more than once in this request']
+                })
+                continue
+            seen.add(imdb_id)
+            valid[action].append(imdb_id)
+            results.append({'imdb_id': imdb_id, 'action': action})
     
-    # Return updated playlist
-    response_serializer = PlaylistSerializer(playlist)
+    if valid['add'] or valid['remove']:
+        statuses = update_playlist_movies(playlist.id, add=valid['add'], remove=valid['remove'])
+        invalidate_playlist(playlist)
+    else:
+        statuses = {}
+    for result in results:
+        result.setdefault('status', statuses.get(result['imdb_id']))
+    
+    # Render the playlist once, after every change, unless it was deleted in the meantime
+    playlist = Playlists.objects.for_serializer().filter(id=playlist.id).first()
+    if playlist is None:
+        return Response(
+            {'message': 'Playlist not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
     return Response(
         {
-            'message': f'Movie {imdb_id} removed from playlist successfully',
-            'playlist': response_serializer.data
+            'message': 'Playlist movies updated',
+            'results': results,
+            'playlist': PlaylistSerializer(playlist).data
         },
         status=status.HTTP_200_OK
     )
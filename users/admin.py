@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import CustomUser
+from .models import CustomUser, PendingPictureDeletion, ProfilePictureJob
 
 
 @admin.register(CustomUser)
@@ -9,3 +9,20 @@ class CustomUserAdmin(admin.ModelAdmin):
     search_fields = ['username', 'email', 'uid']
     readonly_fields = ['id', 'created_at']
     ordering = ['-created_at']
+
+
+@admin.register(ProfilePictureJob)
+class ProfilePictureJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'status', 'created_at', 'finished_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['user__username', 'user__uid']
+    readonly_fields = ['id', 'user', 'status', 'error', 'created_at', 'finished_at']
+    ordering = ['-created_at']
+
+
+@admin.register(PendingPictureDeletion)
+class PendingPictureDeletionAdmin(admin.ModelAdmin):
+    list_display = ['name', 'attempts', 'created_at']
+    search_fields = ['name']
+    readonly_fields = ['name', 'attempts', 'last_error', 'created_at']
+    ordering = ['id']
@@ -0,0 +1,99 @@
+"""
+Async versions of the user read endpoints, routed instead of the ones in
+views.py when ASYNC_VIEWS is on. They query through the async ORM and
+answer with the same payloads, cache keys and validators.
+"""
+from rest_framework import status
+from .models import CustomUser
+from .serializers import PublicUserValuesSerializer
+from .views import user_versions
+from moviememo_backend.async_api import api_response, async_api_view
+from moviememo_backend.cache import aget_or_build, user_key, username_key
+from moviememo_backend.conditional import aconditional_get, make_etag
+
+
+async def user_validators(**lookup):
+    updated_at = await user_versions(**lookup).afirst()
+    if updated_at is None:
+        return None
+    return make_etag(updated_at), updated_at
+
+
+@async_api_view(['GET'])
+@aconditional_get(user_validators)
+async def get_public_user(request, uid):
+    """
+    Get a specific user's public information by ID.
+    Returns only public data (no email).
+    """
+    async def build():
+        try:
+            user = await PublicUserValuesSerializer.values(CustomUser.objects.all()).aget(uid=uid)
+        except CustomUser.DoesNotExist:
+            return None
+        return {
+            'user': PublicUserValuesSerializer(user).data
+        }
+    
+    payload = await aget_or_build(user_key(uid), build)
+    if payload is None:
+        return api_response(
+            {
+                'message': 'User not found'
+            },
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    return api_response(payload)
+
+
+@async_api_view(['GET'])
+@aconditional_get(user_validators)
+async def get_username_user(request, username):
+    """
+    Get a specific user publicly based off there username
+    """
+    async def build():
+        try:
+            user = await PublicUserValuesSerializer.values(CustomUser.objects.all()).aget(username=username)
+        except CustomUser.DoesNotExist:
+            return None
+        return {
+            'user': PublicUserValuesSerializer(user).data
+        }
+    
+    payload = await aget_or_build(username_key(username), build)
+    if payload is None:
+        return api_response(
+            {
+                'message': 'User not found'
+            },
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    return api_response(payload)
+
+
+@async_api_view(['GET'])
+async def check_user_exists(request, uid):
+    """
+    Check if a user exists by UID.
+    Returns true or false.
+    """
+    exists = await CustomUser.objects.filter(uid=uid).aexists()
+    return api_response({
+        'exists': exists,
+        'uid': uid
+    })
+
+@async_api_view(['GET'])
+async def check_user_username_exists(request, username):
+    """
+    Check if a user exists by username
+    Returns true or false.
+    """
+    exists = await CustomUser.objects.filter(username=username).aexists()
+    return api_response({
+        'exists': exists,
+        'username': username
+    })
@@ -0,0 +1,158 @@
+"""
+Profile picture conversion.
+
+Kept free of Django imports so it can run inside the profile picture
+process pool (see users/jobs.py).
+
+Images are shrunk as early as possible.
+- JPEGs are decoded straight at a reduced scale with draft().
+- Other formats are cut down with reduce() before the final LANCZOS resize.
+- EXIF orientation is applied to the small result.
+- The pixel count is checked from the header before anything is decoded.
+
+Failures are raised as UnreadableImage or ImageTooLarge, which pickle back
+from the pool without needing Pillow's exception types on the other side.
+
+Pillow and pillow_heif are imported on the first conversion rather than at
+import time, so web workers and management commands that never touch an
+image don't pay for loading them.
+"""
+import struct
+import threading
+from io import BytesIO
+
+# Define standard profile picture size
+PROFILE_PICTURE_SIZE = (200, 200)
+
+# Square edge lengths produced for every upload; the largest is PROFILE_PICTURE_SIZE
+PROFILE_PICTURE_VARIANT_SIZES = (200, 96, 48)
+
+# Largest source we will decode (about a 64 MP photo); checked before decoding
+MAX_SOURCE_PIXELS = 64_000_000
+
+ALLOWED_FORMATS = ('JPEG', 'PNG', 'GIF', 'BMP', 'WEBP', 'HEIF')
+
+# EXIF orientation tag values mapped to the Image.Transpose member that undoes them
+EXIF_ORIENTATION = 0x0112
+ORIENTATION_TRANSPOSE = {
+    2: 'FLIP_LEFT_RIGHT',
+    3: 'ROTATE_180',
+    4: 'FLIP_TOP_BOTTOM',
+    5: 'TRANSPOSE',
+    6: 'ROTATE_270',
+    7: 'TRANSVERSE',
+    8: 'ROTATE_90',
+}
+
+_image_module = None
+_image_module_lock = threading.Lock()
+
+
+class ImageTooLarge(ValueError):
+    """Raised when a source image exceeds MAX_SOURCE_PIXELS"""
+
+
+class UnreadableImage(ValueError):
+    """Raised when the data isn't an image in an allowed format, or fails to decode"""
+
+
+def load_pillow():
+    """Import and configure Pillow on first use. Returns the PIL.Image module."""
+    global _image_module
+    with _image_module_lock:
+        if _image_module is None:
+            from PIL import Image
+
+            # Register HEIF support for PIL
+            try:
+                from pillow_heif import register_heif_opener
+                register_heif_opener()
+            except ImportError:
+                pass  # HEIF support not available
+
+            # Pillow refuses anything over twice this as a decompression bomb
+            Image.MAX_IMAGE_PIXELS = MAX_SOURCE_PIXELS
+
+            # Load every plugin up front so the allowed formats can be checked against them
+            Image.init()
+            _image_module = Image
+    return _image_module
+
+
+def open_reduced(data, size):
+    """
+    Open image bytes and decode them no larger than needed for a LANCZOS
+    resize to size. Returns (image, exif orientation).
+    """
+    Image = load_pillow()
+    # Only let the allowed (and installed) decoders try the data
+    formats = [image_format for image_format in ALLOWED_FORMATS if image_format in Image.OPEN]
+    image = Image.open(BytesIO(data), formats=formats)
+
+    width, height = image.size
+    if width * height > MAX_SOURCE_PIXELS:
+        raise ImageTooLarge(
+            f'Image is {width}x{height}; the limit is {MAX_SOURCE_PIXELS // 1_000_000} megapixels'
+        )
+
+    orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+
+    # Keep at least twice the target size so LANCZOS still has detail to work with
+    floor = (size[0] * 2, size[1] * 2)
+
+    # JPEGs are decoded at 1/2, 1/4 or 1/8 scale by libjpeg; other formats ignore this
+    image.draft(None, floor)
+
+    # Shrink before converting when reduce() supports the mode, so the
+    # full-size image is never copied
+    if image.mode in ('RGB', 'RGBA', 'L', 'LA'):
+        image = reduce_to(image, floor)
+
+    # Convert to RGB if necessary (WebP works best with RGB)
+    if image.mode in ("RGBA", "P", "LA", "PA"):
+        image = image.convert("RGBA")
+    else:
+        image = image.convert("RGB")
+
+    return reduce_to(image, floor), orientation
+
+
+def reduce_to(image, floor):
+    """Shrink by the largest integer factor that keeps the image above floor"""
+    factor = min(image.width // floor[0], image.height // floor[1])
+    if factor > 1:
+        return image.reduce(factor)
+    return image
+
+
+def convert_profile_picture(data, sizes=PROFILE_PICTURE_VARIANT_SIZES):
+    """
+    Convert raw image bytes to square WebPs, one per edge length in sizes,
+    from a single decode. Returns {size: webp bytes}.
+    """
+    Image = load_pillow()
+    largest = max(sizes)
+    try:
+        source, orientation = open_reduced(data, (largest, largest))
+    except ImageTooLarge:
+        raise
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e)) from e
+    # Pillow's decoders report bad data with any of these
+    except (OSError, EOFError, SyntaxError, ValueError, struct.error) as e:
+        raise UnreadableImage(str(e)) from e
+
+    variants = {}
+    for size in sizes:
+        # Each variant is resized from the reduced source rather than from another variant
+        image = source.resize((size, size), Image.Resampling.LANCZOS)
+
+        # The target is square, so rotating after the resize gives the same pixels for far less work
+        if orientation in ORIENTATION_TRANSPOSE:
+            image = image.transpose(Image.Transpose[ORIENTATION_TRANSPOSE[orientation]])
+
+        # Save the WebP image to a buffer
+        buffer = BytesIO()
+        image.save(buffer, format="WEBP", quality=85, optimize=True)
+        variants[size] = buffer.getvalue()
+    return variants
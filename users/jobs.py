@@ -0,0 +1,272 @@
+"""
+Background profile picture processing.
+
+Uploads are queued as ProfilePictureJob rows. The CPU-heavy decode, resize
+and encode runs in a bounded process pool. A small thread pool in the web
+process drives each job: it waits for the conversion, stores the WebP
+variants and swaps them onto the user in a transaction. Everything runs in-process, with
+no external broker.
+
+Jobs live in memory until they finish. If the web process restarts, a job
+that hasn't finished stays pending and the client can simply upload again.
+
+A failed job stores one of the fixed FAILURE_MESSAGES for the client to
+see; the exception itself only goes to the log.
+
+Replaced pictures are never deleted here. Their names are queued as
+PendingPictureDeletion rows and removed in batches by the
+purge_profile_pictures management command.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from moviememo_backend.cache import invalidate_user
+from .images import ImageTooLarge, UnreadableImage, convert_profile_picture
+from .models import CustomUser, PendingPictureDeletion, ProfilePictureJob, content_addressed_name
+
+_pools = None
+_pools_lock = threading.Lock()
+_slots = None
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """Raised when too many profile picture jobs are already in flight"""
+
+
+class StorageFailed(Exception):
+    """Raised when a picture can't be checked for or written to storage"""
+
+
+# What a failed job reports, by exception type; anything else gets JOB_FAILED
+FAILURE_MESSAGES = (
+    (UnreadableImage, 'The file is not a readable image'),
+    (ImageTooLarge, 'The image is too large'),
+    (StorageFailed, 'The picture could not be stored'),
+)
+JOB_FAILED = 'The picture could not be processed'
+
+
+def new_process_pool():
+    # spawn keeps forked copies of the web worker's threads and sockets out of the pool
+    return ProcessPoolExecutor(
+        max_workers=getattr(settings, 'PROFILE_PICTURE_WORKERS', 2),
+        mp_context=multiprocessing.get_context('spawn')
+    )
+
+
+def get_pools():
+    """Create the process and thread pools on first use"""
+    global _pools, _slots
+    with _pools_lock:
+        if _pools is None:
+            _pools = (
+                new_process_pool(),
+                ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'PROFILE_PICTURE_WORKERS', 2),
+                    thread_name_prefix='profile-picture'
+                ),
+            )
+            _slots = threading.BoundedSemaphore(getattr(settings, 'PROFILE_PICTURE_MAX_PENDING', 32))
+    return _pools
+
+
+def replace_broken_process_pool(broken):
+    """
+    Swap in a new process pool after a worker died (OOM, a crashing decoder),
+    which leaves the pool unusable. Jobs that saw the same broken pool only
+    replace it once.
+    """
+    global _pools
+    with _pools_lock:
+        if _pools is not None and _pools[0] is broken:
+            _pools = (new_process_pool(), _pools[1])
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def enqueue_profile_picture_job(job, data):
+    """
+    Start processing a job once the surrounding transaction commits, or
+    right away under autocommit. The pending-job permit is only taken then,
+    so a transaction that rolls back never holds one. Raises QueueFull when
+    the pending limit is reached; a job deferred to a commit is marked
+    failed instead, as the caller has already moved on.
+    """
+    _, threads = get_pools()
+    deferred = transaction.get_connection().in_atomic_block
+
+    def start():
+        if not _slots.acquire(blocking=False):
+            if not deferred:
+                raise QueueFull('Too many profile picture uploads in progress')
+            ProfilePictureJob.objects.filter(pk=job.pk).update(
+                status=ProfilePictureJob.STATUS_FAILED,
+                error='Too many profile picture uploads in progress',
+                finished_at=timezone.now()
+            )
+            return
+        try:
+            threads.submit(run_profile_picture_job, job.pk, data)
+        except BaseException:
+            _slots.release()
+            raise
+
+    transaction.on_commit(start)
+
+
+def run_profile_picture_job(job_id, data):
+    """
+    Convert, store and swap in a new profile picture and its resized
+    variants. The old pictures are left untouched unless every step succeeds.
+    """
+    processes, _ = get_pools()
+    close_old_connections()
+    uploaded = []
+    try:
+        job = ProfilePictureJob.objects.select_related('user').get(pk=job_id)
+        ProfilePictureJob.objects.filter(pk=job_id).update(status=ProfilePictureJob.STATUS_PROCESSING)
+
+        try:
+            variants = processes.submit(convert_profile_picture, data).result()
+        except BrokenProcessPool:
+            replace_broken_process_pool(processes)
+            raise
+
+        field = CustomUser._meta.get_field('profile_picture')
+        current_names = set(job.user.profile_picture_variants.values())
+        new_names = {}
+        for size, webp_data in variants.items():
+            name = field.generate_filename(job.user, content_addressed_name(webp_data))
+            # Objects are immutable and named by content, so an existing key already holds these bytes
+            if name not in current_names:
+                stored = save_missing(field.storage, name, webp_data)
+                if stored:
+                    name = stored
+                    uploaded.append(name)
+            new_names[str(size)] = name
+
+        with transaction.atomic():
+            user = CustomUser.objects.select_for_update().get(pk=job.user_id)
+            old_names = set(user.profile_picture_variants.values())
+            if user.profile_picture:
+                old_names.add(user.profile_picture.name)
+            stored = claim_pictures(field.storage, {
+                new_names[str(size)]: webp_data for size, webp_data in variants.items()
+            })
+            uploaded += stored.values()
+            new_names = {size: stored.get(name, name) for size, name in new_names.items()}
+            user.profile_picture.name = new_names[str(max(variants))]
+            user.profile_picture_variants = new_names
+            user.save(update_fields=['profile_picture', 'profile_picture_variants', 'updated_at'])
+            queue_picture_deletion(old_names - set(new_names.values()))
+            ProfilePictureJob.objects.filter(pk=job_id).update(
+                status=ProfilePictureJob.STATUS_SUCCEEDED,
+                finished_at=timezone.now()
+            )
+            invalidate_user(user)
+    except Exception as e:
+        logger.exception('Profile picture job %s failed', job_id)
+        # The swap never happened, so anything this job uploaded is unreferenced
+        queue_picture_deletion(uploaded)
+        ProfilePictureJob.objects.filter(pk=job_id).update(
+            status=ProfilePictureJob.STATUS_FAILED,
+            error=failure_message(e),
+            finished_at=timezone.now()
+        )
+    finally:
+        _slots.release()
+        connection.close()
+
+
+def failure_message(error):
+    """The fixed message a job failed with error reports to the client"""
+    for exception_type, message in FAILURE_MESSAGES:
+        if isinstance(error, exception_type):
+            return message
+    return JOB_FAILED
+
+
+def save_missing(storage, name, data):
+    """
+    Store data under name unless the object already exists. Returns the
+    name stored, or None. Storage errors are raised as StorageFailed.
+    """
+    try:
+        if storage.exists(name):
+            return None
+        return storage.save(name, ContentFile(data))
+    except Exception as e:
+        raise StorageFailed(f'Could not store {name}') from e
+
+
+def queue_picture_deletion(names):
+    """Record stored pictures for purge_profile_pictures to delete later"""
+    PendingPictureDeletion.objects.bulk_create(
+        [PendingPictureDeletion(name=name) for name in names if name],
+        ignore_conflicts=True
+    )
+
+
+def claim_pictures(storage, contents):
+    """
+    Take the pictures {name: bytes} a user is about to point at out of the
+    pending deletion queue. A reused object may have been queued when someone
+    else replaced it. Anything missing is stored again, and an object that
+    purge_profile_pictures has started deleting is left to it: the bytes are
+    stored again under a name of their own. Call it inside the transaction
+    that swaps the names in. Returns {name: name stored} for every picture
+    stored again.
+
+    The row locks order this against the purge marking its batch. SQLite
+    ignores select_for_update, but runs one writing transaction at a time,
+    so a job whose snapshot predates the mark fails to write instead of
+    missing it.
+    """
+    rows = list(PendingPictureDeletion.objects.select_for_update().filter(name__in=contents))
+    purging = {row.name for row in rows if row.purge_started_at}
+    PendingPictureDeletion.objects.filter(id__in=[row.id for row in rows if row.name not in purging]).delete()
+    stored = {}
+    for name, data in contents.items():
+        target = name
+        if name in purging:
+            root, extension = os.path.splitext(name)
+            target = f'{root}-{uuid.uuid4().hex[:12]}{extension}'
+        stored_name = save_missing(storage, target, data)
+        if stored_name:
+            stored[name] = stored_name
+    return stored
+
+
+def pictures_in_use(names):
+    """
+    Return the subset of names that some user still points at, as their main
+    picture or a variant. Content-addressed objects can be shared between users.
+    """
+    names = set(names)
+    in_use = set()
+    pending = list(names)
+    # Small chunks keep the OR'd LIKE clauses well under SQLite's expression depth limit
+    for start in range(0, len(pending), 100):
+        part = pending[start:start + 100]
+        # Variant keys look like array indexes to JSON key lookups, so match the names as text
+        condition = Q(profile_picture__in=part)
+        for name in part:
+            condition |= Q(profile_picture_variants__icontains=name)
+        for main, variants in CustomUser.objects.filter(condition).values_list(
+            'profile_picture', 'profile_picture_variants'
+        ):
+            in_use.add(main)
+            in_use.update((variants or {}).values())
+    return in_use & names
@@ -0,0 +1,135 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from users.jobs import pictures_in_use
+from users.models import CustomUser, PendingPictureDeletion
+
+MAX_KEYS_PER_REQUEST = 1000  # S3 DeleteObjects limit
+
+
+class Command(BaseCommand):
+    """
+    Each batch is claimed by marking its rows in a short transaction, then
+    deleted from storage, then removed. A job that reuses a marked object
+    stores a copy under a new name, so nothing waits on this command's
+    storage requests. On SQLite select_for_update does nothing, but only one
+    transaction writes at a time, which orders the marking against a job's
+    swap all the same.
+    """
+    help = 'Delete replaced profile pictures queued in the pending deletion table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=MAX_KEYS_PER_REQUEST,
+                            help=f'Keys deleted per request (at most {MAX_KEYS_PER_REQUEST})')
+        parser.add_argument('--retries', type=int, default=3, help='Retries per batch before giving up for this run')
+        parser.add_argument('--max-attempts', type=int, default=5,
+                            help='Skip keys that have already failed this many runs')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be deleted without deleting')
+
+    def handle(self, *args, batch_size, retries, max_attempts, dry_run, **options):
+        storage = CustomUser._meta.get_field('profile_picture').storage
+        batch_size = max(1, min(batch_size, MAX_KEYS_PER_REQUEST))
+        deleted = kept = failed = 0
+        last_id = 0
+
+        while True:
+            # Only the bookkeeping runs in a transaction. Rows another purge
+            # or a job swapping pictures holds are skipped.
+            with transaction.atomic():
+                rows = list(
+                    PendingPictureDeletion.objects.select_for_update(skip_locked=True)
+                    .filter(id__gt=last_id, attempts__lt=max_attempts)
+                    .order_by('id')[:batch_size]
+                )
+                if not rows:
+                    break
+                last_id = rows[-1].id
+                names = {row.name for row in rows}
+
+                # Another user may have uploaded identical bytes since the key was queued
+                in_use = pictures_in_use(names)
+                names -= in_use
+                kept += len(in_use)
+
+                if not dry_run:
+                    PendingPictureDeletion.objects.filter(name__in=in_use).delete()
+                    # From the commit on, a job reusing one of these stores a copy instead (see claim_pictures)
+                    PendingPictureDeletion.objects.filter(name__in=names).update(purge_started_at=timezone.now())
+
+            if dry_run:
+                for name in sorted(names):
+                    self.stdout.write(f'Would delete {name}')
+                deleted += len(names)
+                continue
+
+            # Requests and backoff sleeps happen with no transaction or lock held
+            errors = self.delete_with_retry(storage, names, retries)
+
+            with transaction.atomic():
+                PendingPictureDeletion.objects.filter(name__in=names - set(errors)).delete()
+                for name, error in errors.items():
+                    PendingPictureDeletion.objects.filter(name=name).update(
+                        attempts=F('attempts') + 1,
+                        last_error=error,
+                        purge_started_at=None
+                    )
+                    self.stderr.write(f'Failed to delete {name}: {error}')
+            deleted += len(names) - len(errors)
+            failed += len(errors)
+
+        action = 'Would delete' if dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} {deleted} pictures. {kept} still in use, {failed} failed.'
+        ))
+
+    def delete_with_retry(self, storage, names, retries):
+        """
+        Delete names, retrying the ones that fail with exponential backoff.
+        Returns {name: error} for whatever still failed.
+        """
+        errors = {}
+        remaining = sorted(names)
+        for attempt in range(retries + 1):
+            if attempt:
+                time.sleep(min(2 ** attempt, 30))
+            errors = self.delete_objects(storage, remaining)
+            remaining = sorted(errors)
+            if not remaining:
+                break
+        return errors
+
+    def delete_objects(self, storage, names):
+        """Delete up to MAX_KEYS_PER_REQUEST names in one request where the storage allows it"""
+        if not names:
+            return {}
+
+        # Imported on first use so loading the command (e.g. for --help) does not pull in boto3
+        from storages.backends.s3 import S3Storage
+        from storages.utils import clean_name
+
+        if isinstance(storage, S3Storage):
+            keys = {storage._normalize_name(clean_name(name)): name for name in names}
+            try:
+                response = storage.bucket.meta.client.delete_objects(
+                    Bucket=storage.bucket_name,
+                    Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True}
+                )
+            except Exception as e:
+                return {name: str(e) for name in names}
+            # Missing keys count as deleted; only real failures are listed
+            return {
+                keys[error['Key']]: f"{error.get('Code')}: {error.get('Message')}"
+                for error in response.get('Errors', [])
+            }
+
+        # Other storages have no batch delete
+        errors = {}
+        for name in names:
+            try:
+                storage.delete(name)
+            except Exception as e:
+                errors[name] = str(e)
+        return errors
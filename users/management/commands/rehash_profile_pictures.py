@@ -0,0 +1,92 @@
+import re
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from moviememo_backend.cache import invalidate_user
+from users.jobs import claim_pictures, queue_picture_deletion
+from users.models import CustomUser, content_addressed_name
+
+CONTENT_ADDRESSED = re.compile(r'^profile_pictures/[0-9a-f]{64}\.webp$')
+
+
+class Command(BaseCommand):
+    help = 'Move existing profile pictures to content-addressed keys'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='Users loaded per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would move without copying anything')
+
+    def handle(self, *args, batch_size, dry_run, **options):
+        field = CustomUser._meta.get_field('profile_picture')
+        storage = field.storage
+        moved = skipped = failed = 0
+        last_id = 0
+
+        while True:
+            users = list(
+                CustomUser.objects.filter(id__gt=last_id)
+                .exclude(profile_picture='')
+                .exclude(profile_picture__isnull=True)
+                .order_by('id')[:batch_size]
+            )
+            if not users:
+                break
+            last_id = users[-1].id
+
+            for user in users:
+                old_main = user.profile_picture.name
+                old_variants = user.profile_picture_variants or {}
+                names = dict(old_variants) or {'200': old_main}
+                if all(CONTENT_ADDRESSED.match(name) for name in [old_main, *names.values()]):
+                    skipped += 1
+                    continue
+                if dry_run:
+                    self.stdout.write(f'Would rehash {user.username}: {old_main}')
+                    moved += 1
+                    continue
+
+                try:
+                    new_names = {}
+                    contents = {}
+                    for size, name in names.items():
+                        if CONTENT_ADDRESSED.match(name):
+                            new_names[size] = name
+                            continue
+                        with storage.open(name, 'rb') as f:
+                            data = f.read()
+                        new_name = field.generate_filename(user, content_addressed_name(data))
+                        if not storage.exists(new_name):
+                            new_name = storage.save(new_name, ContentFile(data))
+                        new_names[size] = new_name
+                        contents[new_name] = data
+                    new_main = new_names.get('200', new_names[max(new_names, key=int)])
+                except Exception as e:
+                    self.stderr.write(f'Failed to rehash {user.username}: {e}')
+                    failed += 1
+                    continue
+
+                with transaction.atomic():
+                    # Only swap if nothing changed the picture while we were copying
+                    updated = CustomUser.objects.filter(
+                        pk=user.pk, profile_picture=old_main
+                    ).update(
+                        profile_picture=new_main,
+                        profile_picture_variants=new_names,
+                        updated_at=timezone.now()
+                    )
+                    if updated:
+                        queue_picture_deletion({old_main, *old_variants.values()} - set(new_names.values()))
+                        claim_pictures(storage, contents)
+                        invalidate_user(user)
+                if not updated:
+                    self.stdout.write(f'Skipped {user.username}: picture changed during rehash')
+                    continue
+                moved += 1
+                self.stdout.write(f'Rehashed {user.username}: {old_main} -> {new_main}')
+
+        action = 'Would rehash' if dry_run else 'Rehashed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} {moved} users. {skipped} already content-addressed, {failed} failed.'
+        ))
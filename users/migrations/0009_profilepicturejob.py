@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:37
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_customuser_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfilePictureJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='profile_picture_jobs', to='users.customuser')),
+            ],
+            options={
+                'db_table': 'profile_picture_jobs',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
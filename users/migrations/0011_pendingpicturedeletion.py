@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_customuser_profile_picture_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingPictureDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+            options={
+                'db_table': 'pending_picture_deletions',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 08:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_pendingpicturedeletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pendingpicturedeletion',
+            name='purge_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
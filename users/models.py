@@ -1,8 +1,9 @@
 from django.db import models
 from django.utils import timezone
 from django.core.exceptions import ValidationError
+import hashlib
 import os
-import time
+import uuid
 
 
 def validate_image_file_extension(value):
@@ -27,14 +28,19 @@ def validate_file_size(value):
 
 def profile_picture_upload_path(instance, filename):
     """
-    Generate upload path using the user's username with webp extension
-    All profile pictures are converted to webp format
-    Includes timestamp for cache busting
+    Generate upload path for a profile picture
+    All profile pictures are converted to webp format and named by
+    content_addressed_name(), so the key only changes when the bytes do
     """
-    # Add timestamp to force cache busting
-    timestamp = int(time.time())
-    new_filename = f"{instance.username}_{timestamp}.webp"
-    return f"profile_pictures/{new_filename}"
+    return f"profile_pictures/{filename}"
+
+
+def content_addressed_name(data):
+    """
+    Name a WebP after the SHA-256 of its bytes. Identical uploads share one
+    immutable object that the CDN can cache forever.
+    """
+    return f"{hashlib.sha256(data).hexdigest()}.webp"
 
 
 class CustomUser(models.Model):
@@ -46,6 +52,7 @@ class CustomUser(models.Model):
     uid = models.CharField(max_length=255, unique=True)
     username = models.CharField(max_length=16, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # Drives ETags on public user endpoints
     last_username_change = models.DateTimeField(null=True, blank=True)
     profile_picture = models.ImageField(
         upload_to=profile_picture_upload_path,
@@ -53,11 +60,69 @@ class CustomUser(models.Model):
         blank=True,
         null=True
     )
+    # Stored name of each resized copy, keyed by edge length ({"48": ..., "96": ..., "200": ...})
+    profile_picture_variants = models.JSONField(default=dict, blank=True)
     
     class Meta:
         db_table = 'custom_users'
         verbose_name = 'Custom User'
         verbose_name_plural = 'Custom Users'
+        indexes = [
+            # Keyset pagination seeks on (created_at, id)
+            models.Index(fields=['created_at', 'id'], name='users_created_id_idx'),
+        ]
     
     def __str__(self):
         return f"{self.email} ({self.uid})"
+
+
+class ProfilePictureJob(models.Model):
+    """
+    A profile picture upload being converted off the request thread.
+    The user's picture is only swapped once the conversion and upload succeed.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='profile_picture_jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'profile_picture_jobs'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Profile picture job {self.id} ({self.status})"
+
+
+class PendingPictureDeletion(models.Model):
+    """
+    A stored picture that no user points at any more. Rows are removed,
+    together with their objects, by the purge_profile_pictures command, so
+    no request ever waits on a storage DELETE. purge_started_at is set while
+    a purge may be deleting the object.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    purge_started_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'pending_picture_deletions'
+        ordering = ['id']
+    
+    def __str__(self):
+        return self.name
@@ -1,8 +1,12 @@
 from rest_framework import serializers
-from .models import CustomUser
+from moviememo_backend.instrumentation import TimedSerializerMixin
+from moviememo_backend.serializers import ValuesSerializer
+from .images import PROFILE_PICTURE_VARIANT_SIZES
+from .models import CustomUser, ProfilePictureJob
+from .storage import DEFAULT_PROFILE_PICTURE_URL, media_url, profile_picture_url
 
 
-class CustomUserSerializer(serializers.ModelSerializer):
+class CustomUserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     profile_picture = serializers.SerializerMethodField()
     
     class Meta:
@@ -12,9 +16,7 @@ class CustomUserSerializer(serializers.ModelSerializer):
     
     def get_profile_picture(self, obj):
         """Return the profile picture URL or default if none uploaded"""
-        if obj.profile_picture and obj.profile_picture.name:
-            return obj.profile_picture.url
-        return "https://cdn.kyleb.dev/pfp/defaultpfp.png"
+        return profile_picture_url(obj.profile_picture.name)
     
     def validate_email(self, value):
         """
@@ -41,19 +43,81 @@ class CustomUserSerializer(serializers.ModelSerializer):
         return value
 
 
-class PublicUserSerializer(serializers.ModelSerializer):
+class PublicUserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for public user data - excludes email for privacy
     """
     profile_picture = serializers.SerializerMethodField()
+    profile_picture_variants = serializers.SerializerMethodField()
     
     class Meta:
         model = CustomUser
-        fields = ['uid', 'username', 'created_at', 'profile_picture', 'last_username_change']
+        fields = ['uid', 'username', 'created_at', 'profile_picture', 'profile_picture_variants', 'last_username_change']
         read_only_fields = ['id', 'created_at']
     
     def get_profile_picture(self, obj):
         """Return the profile picture URL or default if none uploaded"""
-        if obj.profile_picture and obj.profile_picture.name:
-            return obj.profile_picture.url
-        return "https://cdn.kyleb.dev/pfp/defaultpfp.png"
+        return profile_picture_url(obj.profile_picture.name)
+    
+    def get_profile_picture_variants(self, obj):
+        """
+        Return {edge length: URL} for every stored size so clients can pick
+        the smallest adequate image. Pictures uploaded before variants
+        existed only have their full size.
+        """
+        name = obj.profile_picture.name
+        if not name:
+            return {str(size): DEFAULT_PROFILE_PICTURE_URL for size in PROFILE_PICTURE_VARIANT_SIZES}
+        if not obj.profile_picture_variants:
+            return {str(max(PROFILE_PICTURE_VARIANT_SIZES)): media_url(name)}
+        return {size: media_url(variant) for size, variant in obj.profile_picture_variants.items()}
+
+
+class PublicUserValuesSerializer(ValuesSerializer):
+    """
+    PublicUserSerializer for .values() rows, used by the read endpoints.
+    With a prefix (e.g. 'user__') it reads a user nested in another row,
+    whose lookups start with it.
+    """
+    fields = ('uid', 'username', 'created_at', 'profile_picture', 'profile_picture_variants', 'last_username_change')
+    
+    def __init__(self, instance=None, many=False, prefix=''):
+        super().__init__(instance, many)
+        self.prefix = prefix
+    
+    def to_representation(self, row):
+        prefix = self.prefix
+        name = row[prefix + 'profile_picture']
+        variants = row[prefix + 'profile_picture_variants']
+        if not name:
+            variant_urls = {str(size): DEFAULT_PROFILE_PICTURE_URL for size in PROFILE_PICTURE_VARIANT_SIZES}
+        elif not variants:
+            variant_urls = {str(max(PROFILE_PICTURE_VARIANT_SIZES)): media_url(name)}
+        else:
+            variant_urls = {size: media_url(variant) for size, variant in variants.items()}
+        return {
+            'uid': row[prefix + 'uid'],
+            'username': row[prefix + 'username'],
+            'created_at': self.datetime(row[prefix + 'created_at']),
+            'profile_picture': profile_picture_url(name),
+            'profile_picture_variants': variant_urls,
+            'last_username_change': self.datetime(row[prefix + 'last_username_change']),
+        }
+
+
+class ExportUserSerializer(PublicUserSerializer):
+    """
+    Public user data plus the row id, used as the resume point for exports
+    """
+    class Meta(PublicUserSerializer.Meta):
+        fields = ['id'] + PublicUserSerializer.Meta.fields
+
+
+class ProfilePictureJobSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    Serializer for the status of a background profile picture upload
+    """
+    class Meta:
+        model = ProfilePictureJob
+        fields = ['id', 'status', 'error', 'created_at', 'finished_at']
+        read_only_fields = fields
@@ -0,0 +1,24 @@
+"""
+Public URLs for stored profile pictures.
+
+Pictures are served unsigned from the CDN at MEDIA_URL (the R2 custom
+domain), so a URL is just MEDIA_URL plus the quoted key. Building it here
+skips the per-row trip through the storage backend that FieldFile.url takes,
+which adds up when thousands of users are serialized at once.
+"""
+from django.conf import settings
+from django.utils.encoding import filepath_to_uri
+
+DEFAULT_PROFILE_PICTURE_URL = "https://cdn.kyleb.dev/pfp/defaultpfp.png"
+
+
+def media_url(name):
+    """Return the public URL of a stored key, as storage.url(name) would"""
+    return settings.MEDIA_URL + filepath_to_uri(name)
+
+
+def profile_picture_url(name):
+    """Return the URL for a stored profile picture, or the default avatar"""
+    if name:
+        return media_url(name)
+    return DEFAULT_PROFILE_PICTURE_URL
@@ -0,0 +1,262 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from . import images, jobs
+from .management.commands.purge_profile_pictures import Command
+from .models import CustomUser, PendingPictureDeletion, ProfilePictureJob, content_addressed_name
+from moviememo_backend.cache import get_cache
+
+
+def make_user(n):
+    return CustomUser.objects.create(uid=f'uid-{n}', username=f'user{n}', email=f'user{n}@example.com')
+
+
+class UserReadQueryCountTests(TestCase):
+    """
+    The user read endpoints answer in a fixed number of queries
+    """
+
+    def setUp(self):
+        get_cache().clear()
+        self.client = APIClient()
+
+    def test_get_all_users(self):
+        for count in (1, 10):
+            with self.subTest(users=count):
+                CustomUser.objects.all().delete()
+                for i in range(count):
+                    make_user(i)
+                with self.assertNumQueries(1):
+                    response = self.client.get('/api/users/all/')
+                self.assertEqual(len(response.json()['users']), count)
+
+    def test_get_public_user(self):
+        user = make_user(1)
+        # Validators, then the user
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/users/{user.uid}/')
+        self.assertEqual(response.json()['user']['username'], user.username)
+
+        with self.assertNumQueries(1):
+            self.client.get(f'/api/users/{user.uid}/')
+
+    def test_get_username_user(self):
+        user = make_user(1)
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/users/username/{user.username}/')
+        self.assertEqual(response.json()['user']['uid'], user.uid)
+
+
+class PictureDeletionTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        storages = override_settings(STORAGES={
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': media.name}},
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        })
+        storages.enable()
+        self.addCleanup(storages.disable)
+        self.storage = CustomUser._meta.get_field('profile_picture').storage
+
+    def test_claim_stores_a_purged_picture_again(self):
+        # The purge deleted the object, then failed to remove the row
+        name = self.storage.save('profile_pictures/shared.webp', ContentFile(b'shared'))
+        PendingPictureDeletion.objects.create(name=name)
+        self.storage.delete(name)
+
+        self.assertEqual(jobs.claim_pictures(self.storage, {name: b'shared'}), {name: name})
+        self.assertFalse(PendingPictureDeletion.objects.filter(name=name).exists())
+        with self.storage.open(name) as f:
+            self.assertEqual(f.read(), b'shared')
+
+    def test_purge_keeps_pictures_in_use(self):
+        shared = self.storage.save('profile_pictures/shared.webp', ContentFile(b'shared'))
+        unused = self.storage.save('profile_pictures/unused.webp', ContentFile(b'unused'))
+        user = make_user(1)
+        user.profile_picture_variants = {'48': shared}
+        user.save()
+        jobs.queue_picture_deletion([shared, unused])
+
+        call_command('purge_profile_pictures', stdout=StringIO())
+
+        self.assertTrue(self.storage.exists(shared))
+        self.assertFalse(self.storage.exists(unused))
+        self.assertFalse(PendingPictureDeletion.objects.exists())
+
+    def test_claim_copies_a_picture_being_purged(self):
+        name = self.storage.save('profile_pictures/shared.webp', ContentFile(b'shared'))
+        PendingPictureDeletion.objects.create(name=name, purge_started_at=timezone.now())
+
+        copy = jobs.claim_pictures(self.storage, {name: b'shared'})[name]
+        self.assertNotEqual(copy, name)
+        # The purge still owns the row and deletes the original
+        self.assertTrue(PendingPictureDeletion.objects.filter(name=name).exists())
+        with self.storage.open(copy) as f:
+            self.assertEqual(f.read(), b'shared')
+
+    def test_purge_deletes_outside_a_transaction(self):
+        names = [self.storage.save(f'profile_pictures/{n}.webp', ContentFile(b'old')) for n in range(3)]
+        jobs.queue_picture_deletion(names)
+        depth = len(connection.atomic_blocks)
+        seen = []
+
+        def delete_objects(command, storage, batch):
+            seen.append((len(connection.atomic_blocks), set(
+                PendingPictureDeletion.objects.filter(purge_started_at__isnull=False).values_list('name', flat=True)
+            )))
+            return {name: 'Slow down' for name in batch[:1]}
+
+        with mock.patch.object(Command, 'delete_objects', delete_objects):
+            call_command('purge_profile_pictures', retries=0, stdout=StringIO(), stderr=StringIO())
+
+        self.assertEqual(seen, [(depth, set(names))])
+        failed = PendingPictureDeletion.objects.get()
+        self.assertEqual((failed.name, failed.attempts, failed.purge_started_at), (sorted(names)[0], 1, None))
+
+
+class ProfilePictureJobTests(TransactionTestCase):
+    """
+    Jobs run outside a test transaction, since they commit and close their
+    own connection
+    """
+
+    def setUp(self):
+        self.user = make_user(1)
+        jobs.get_pools()
+
+    def test_rolled_back_enqueue_holds_no_permit(self):
+        with mock.patch.object(jobs, '_slots', threading.BoundedSemaphore(1)):
+            for _ in range(3):
+                with transaction.atomic():
+                    job = ProfilePictureJob.objects.create(user=self.user)
+                    jobs.enqueue_profile_picture_job(job, b'')
+                    transaction.set_rollback(True)
+            self.assertTrue(jobs._slots.acquire(blocking=False))
+
+    def test_queue_full_under_autocommit(self):
+        with mock.patch.object(jobs, '_slots', threading.BoundedSemaphore(1)):
+            jobs._slots.acquire()
+            job = ProfilePictureJob.objects.create(user=self.user)
+            with self.assertRaises(jobs.QueueFull):
+                jobs.enqueue_profile_picture_job(job, b'')
+
+    def test_queue_full_at_commit_fails_the_job(self):
+        with mock.patch.object(jobs, '_slots', threading.BoundedSemaphore(1)):
+            jobs._slots.acquire()
+            with transaction.atomic():
+                job = ProfilePictureJob.objects.create(user=self.user)
+                jobs.enqueue_profile_picture_job(job, b'')
+        job.refresh_from_db()
+        self.assertEqual(job.status, ProfilePictureJob.STATUS_FAILED)
+
+    def test_broken_process_pool_is_replaced(self):
+        broken = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+        with self.assertRaises(BrokenProcessPool):
+            broken.submit(os._exit, 1).result()
+
+        threads = ThreadPoolExecutor(max_workers=1)
+        with mock.patch.object(jobs, '_pools', (broken, threads)), \
+                mock.patch.object(jobs, '_slots', threading.BoundedSemaphore(1)):
+            jobs._slots.acquire()
+            job = ProfilePictureJob.objects.create(user=self.user)
+            with self.assertLogs('users.jobs', 'ERROR'):
+                jobs.run_profile_picture_job(job.pk, b'')
+
+            job.refresh_from_db()
+            self.assertEqual(job.status, ProfilePictureJob.STATUS_FAILED)
+            processes, _ = jobs.get_pools()
+            self.assertIsNot(processes, broken)
+            # The permit came back, and the new pool takes work
+            self.assertTrue(jobs._slots.acquire(blocking=False))
+            self.assertEqual(processes.submit(abs, -1).result(), 1)
+            processes.shutdown()
+        threads.shutdown()
+
+    def run_in_threads(self, data):
+        """Run a job with the conversion on a thread, so it can be patched"""
+        converter = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(converter.shutdown)
+        with mock.patch.object(jobs, '_pools', (converter, converter)), \
+                mock.patch.object(jobs, '_slots', threading.BoundedSemaphore(1)):
+            jobs._slots.acquire()
+            job = ProfilePictureJob.objects.create(user=self.user)
+            with self.assertLogs('users.jobs', 'ERROR') as logs:
+                jobs.run_profile_picture_job(job.pk, data)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ProfilePictureJob.STATUS_FAILED)
+        self.assertIn('Traceback', logs.output[0])
+        return job
+
+    def test_job_copies_a_picture_being_purged(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        png = BytesIO()
+        Image.new('RGB', (40, 30)).save(png, format='PNG')
+        largest = images.convert_profile_picture(png.getvalue())[200]
+        field = CustomUser._meta.get_field('profile_picture')
+        converter = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(converter.shutdown)
+
+        with override_settings(STORAGES={
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': media.name}},
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        }), mock.patch.object(jobs, '_pools', (converter, converter)), \
+                mock.patch.object(jobs, '_slots', threading.BoundedSemaphore(1)):
+            # Someone else's identical picture, which a purge has started deleting
+            shared = field.storage.save(
+                field.generate_filename(self.user, content_addressed_name(largest)), ContentFile(largest)
+            )
+            PendingPictureDeletion.objects.create(name=shared, purge_started_at=timezone.now())
+            jobs._slots.acquire()
+            job = ProfilePictureJob.objects.create(user=self.user)
+            jobs.run_profile_picture_job(job.pk, png.getvalue())
+
+            job.refresh_from_db()
+            self.assertEqual(job.status, ProfilePictureJob.STATUS_SUCCEEDED)
+            self.user.refresh_from_db()
+            copy = self.user.profile_picture.name
+            self.assertNotEqual(copy, shared)
+            self.assertEqual(self.user.profile_picture_variants['200'], copy)
+            field.storage.delete(shared)
+            with field.storage.open(copy) as f:
+                self.assertEqual(f.read(), largest)
+
+    def test_failures_report_fixed_messages(self):
+        png = BytesIO()
+        Image.new('RGB', (40, 30)).save(png, format='PNG')
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+
+        job = self.run_in_threads(b'<?php system($_GET["c"]); ?>')
+        self.assertEqual(job.error, 'The file is not a readable image')
+
+        with mock.patch.object(images, 'MAX_SOURCE_PIXELS', 100):
+            job = self.run_in_threads(png.getvalue())
+        self.assertEqual(job.error, 'The image is too large')
+
+        with override_settings(STORAGES={
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': media.name}},
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        }), mock.patch.object(FileSystemStorage, 'exists', side_effect=OSError(f'{media.name} is read-only')):
+            job = self.run_in_threads(png.getvalue())
+        self.assertEqual(job.error, 'The picture could not be stored')
+        self.assertNotIn(media.name, job.error)
+
+        with mock.patch.object(jobs, 'convert_profile_picture', side_effect=RuntimeError('secret internals')):
+            job = self.run_in_threads(png.getvalue())
+        self.assertEqual(job.error, 'The picture could not be processed')
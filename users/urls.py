@@ -1,6 +1,13 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+# ASYNC_VIEWS serves the read endpoints from async_views.py, for ASGI deployments
+if getattr(settings, 'ASYNC_VIEWS', False):
+    from . import async_views as read_views
+else:
+    read_views = views
+
 urlpatterns = [
     # POST /api/users/create/
     # Create a new user
@@ -10,13 +17,21 @@ urlpatterns = [
     # Get all users (public data only)
     path('all/', views.get_all_users, name='get_all_users'),
     
+    # GET /api/users/export/
+    # Stream all public user profiles as NDJSON (resumable with ?after_id=)
+    path('export/', views.export_users, name='export_users'),
+    
     # GET /api/users/check/<uid>/
     # Check if a user exists by UID (returns true/false)
-    path('check/<str:uid>/', views.check_user_exists, name='check_user_exists'),
+    path('check/<str:uid>/', read_views.check_user_exists, name='check_user_exists'),
     
     # GET /api/users/check/username/<username>/
     # Check if a user exists by username (returns true/false)
-    path('check/username/<str:username>/', views.check_user_username_exists, name='check_user_username_exists'),
+    path('check/username/<str:username>/', read_views.check_user_username_exists, name='check_user_username_exists'),
+    
+    # GET /api/users/profile-picture/jobs/<job_id>/
+    # Check the status of a profile picture upload
+    path('profile-picture/jobs/<uuid:job_id>/', views.get_profile_picture_job, name='get_profile_picture_job'),
     
     # PUT /api/users/<uid>/profile-picture/
     # Upload or update user's profile picture
@@ -24,11 +39,11 @@ urlpatterns = [
     
     # GET /api/users/username/<username>/
     # Get a user by username
-    path('username/<str:username>/', views.get_username_user, name='get_username_user'),
+    path('username/<str:username>/', read_views.get_username_user, name='get_username_user'),
     
     # GET /api/users/<uid>/
     # Get a user by UID
-    path('<str:uid>/', views.get_public_user, name='get_public_user'),
+    path('<str:uid>/', read_views.get_public_user, name='get_public_user'),
     
     # PUT /api/users/<uid>/change-username/
     # Change current username
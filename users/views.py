@@ -1,21 +1,19 @@
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from .models import CustomUser
-from .serializers import CustomUserSerializer, PublicUserSerializer
-from PIL import Image
-from io import BytesIO
-from django.core.files.base import ContentFile
+from .models import CustomUser, ProfilePictureJob
+from .serializers import (
+    CustomUserSerializer, PublicUserSerializer, PublicUserValuesSerializer, ExportUserSerializer,
+    ProfilePictureJobSerializer
+)
+from moviememo_backend.cache import get_or_build, invalidate_user, user_key, username_key
+from moviememo_backend.conditional import conditional_get, make_etag
+from moviememo_backend.export import ndjson_response, parse_export_params
+from moviememo_backend.pagination import KeysetPagination
+from .jobs import QueueFull, enqueue_profile_picture_job
 from django.utils import timezone
 from datetime import timedelta
 
-# Register HEIF support for PIL
-try:
-    from pillow_heif import register_heif_opener
-    register_heif_opener()
-except ImportError:
-    pass  # HEIF support not available
-
 
 @api_view(['POST'])
 def create_user(request):
@@ -44,44 +42,69 @@ def create_user(request):
     )
 
 
+def user_versions(**lookup):
+    return CustomUser.objects.filter(**lookup).values_list('updated_at', flat=True)
+
+
+def user_validators(**lookup):
+    updated_at = user_versions(**lookup).first()
+    if updated_at is None:
+        return None
+    return make_etag(updated_at), updated_at
+
+
 @api_view(['GET'])
+@conditional_get(user_validators)
 def get_public_user(request, uid):
     """
     Get a specific user's public information by ID.
     Returns only public data (no email).
     """
-    try:
-        user = CustomUser.objects.get(uid=uid)
-        serializer = PublicUserSerializer(user)
-        return Response({
-            'user': serializer.data
-        })
-    except CustomUser.DoesNotExist:
+    def build():
+        try:
+            user = PublicUserValuesSerializer.values(CustomUser.objects.all()).get(uid=uid)
+        except CustomUser.DoesNotExist:
+            return None
+        return {
+            'user': PublicUserValuesSerializer(user).data
+        }
+    
+    payload = get_or_build(user_key(uid), build)
+    if payload is None:
         return Response(
             {
                 'message': 'User not found'
             },
             status=status.HTTP_404_NOT_FOUND
         )
+    
+    return Response(payload)
 
 @api_view(['GET'])
+@conditional_get(user_validators)
 def get_username_user(request, username):
     """
     Get a specific user publicly based off there username
     """
-    try:
-        user = CustomUser.objects.get(username=username)
-        serializer = PublicUserSerializer(user)
-        return Response({
-            'user': serializer.data
-        })
-    except CustomUser.DoesNotExist:
+    def build():
+        try:
+            user = PublicUserValuesSerializer.values(CustomUser.objects.all()).get(username=username)
+        except CustomUser.DoesNotExist:
+            return None
+        return {
+            'user': PublicUserValuesSerializer(user).data
+        }
+    
+    payload = get_or_build(username_key(username), build)
+    if payload is None:
         return Response(
             {
                 'message': 'User not found'
             },
             status=status.HTTP_404_NOT_FOUND
         )
+    
+    return Response(payload)
 
 
 @api_view(['GET'])
@@ -112,14 +135,36 @@ def check_user_username_exists(request, username):
 @api_view(['GET'])
 def get_all_users(request):
     """
-    Get all users (public data only - no emails)
+    Get all users (public data only - no emails), newest first.
+    Paginated with keyset cursors; pass ?include_total=true for the total count.
     """
-    users = CustomUser.objects.all()
-    serializer = PublicUserSerializer(users, many=True)
-    return Response({
-        'users': serializer.data,
-        'count': users.count()
-    })
+    paginator = KeysetPagination()
+    users = paginator.paginate_queryset(PublicUserValuesSerializer.values(CustomUser.objects.all(), 'id'), request)
+    serializer = PublicUserValuesSerializer(users, many=True)
+    return paginator.get_paginated_response(serializer.data, 'users')
+
+
+@api_view(['GET'])
+def export_users(request):
+    """
+    Stream every public user profile as NDJSON, one user per line.
+    Resume an interrupted export with ?after_id=<last exported id>.
+    """
+    try:
+        after_id, chunk_size = parse_export_params(request)
+    except ValueError:
+        return Response(
+            {'message': 'after_id and chunk_size must be positive integers'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    return ndjson_response(
+        CustomUser.objects.all(),
+        ExportUserSerializer(),
+        after_id=after_id,
+        chunk_size=chunk_size,
+        filename='users.ndjson'
+    )
     
 @api_view(['PUT'])
 def change_username(request, uid):
@@ -154,9 +199,11 @@ def change_username(request, uid):
                 }
             }, status=status.HTTP_400_BAD_REQUEST)
 
+    old_username = user.username
     user.username = new_username
     user.last_username_change = timezone.now()
     user.save()
+    invalidate_user(user, old_username)
 
     return Response({
         'message': 'Username changed successfully.',
@@ -167,8 +214,9 @@ def change_username(request, uid):
 def upload_profile_picture(request, username):
     """
     Upload or update a user's profile picture.
-    Automatically converts any uploaded image to WebP format.
+    Automatically converts any uploaded image to WebP format in the background.
     Accepts multipart/form-data with 'profile_picture' field.
+    Returns 202 with a job to poll at /api/users/profile-picture/jobs/<job_id>/
     """
     try:
         user = CustomUser.objects.get(username=username)
@@ -216,62 +264,41 @@ def upload_profile_picture(request, username):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    # Convert image to WebP format with consistent sizing
+    # Hand the image off to the background worker; conversion and storage happen there
+    job = ProfilePictureJob.objects.create(user=user)
     try:
-        # Open and process the image
-        image = Image.open(temp_file)
-        
-        # Define standard profile picture size
-        PROFILE_PICTURE_SIZE = (200, 200)  # 400x400 pixels
-        
-        # Convert to RGB if necessary (WebP works best with RGB)
-        if image.mode in ("RGBA", "P"):
-            image = image.convert("RGBA")
-        else:
-            image = image.convert("RGB")
-        
-        # Resize image to standard size (400x400)
-        image = image.resize(PROFILE_PICTURE_SIZE, Image.Resampling.LANCZOS)
-            
-        # Create a BytesIO buffer to save the WebP image
-        buffer = BytesIO()
-        image.save(buffer, format="WEBP", quality=85, optimize=True)
-        buffer.seek(0)
-        
-        # Create a ContentFile with the WebP data
-        webp_file = ContentFile(buffer.read(), name=f"{user.username}.webp")
-        
-    except Exception as e:
+        enqueue_profile_picture_job(job, temp_file.read())
+    except QueueFull:
+        job.delete()
         return Response(
-            {
-                'message': 'Failed to convert image to WebP',
-                'error': str(e)
-            },
-            status=status.HTTP_400_BAD_REQUEST
+            {'message': 'Too many profile picture uploads in progress, please retry shortly'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
         )
     
-    # Delete old profile picture if it exists
-    if user.profile_picture:
-        user.profile_picture.delete(save=False)
-    
-    # Save the WebP converted image
-    user.profile_picture = webp_file
-    
+    return Response(
+        {
+            'message': 'Profile picture upload accepted and is being converted to WebP',
+            'job': ProfilePictureJobSerializer(job).data
+        },
+        status=status.HTTP_202_ACCEPTED
+    )
+
+
+@api_view(['GET'])
+def get_profile_picture_job(request, job_id):
+    """
+    Report the status of a profile picture upload.
+    Once it has succeeded the user's updated public data is included.
+    """
     try:
-        user.save()
-        
-        return Response(
-            {
-                'message': 'Profile picture uploaded and converted to WebP successfully',
-                'user': PublicUserSerializer(user).data
-            },
-            status=status.HTTP_200_OK
-        )
-    except Exception as e:
+        job = ProfilePictureJob.objects.select_related('user').get(id=job_id)
+    except ProfilePictureJob.DoesNotExist:
         return Response(
-            {
-                'message': 'Failed to save profile picture',
-                'error': str(e)
-            },
-            status=status.HTTP_400_BAD_REQUEST
+            {'message': 'Profile picture job not found'},
+            status=status.HTTP_404_NOT_FOUND
         )
+    
+    response = {'job': ProfilePictureJobSerializer(job).data}
+    if job.status == ProfilePictureJob.STATUS_SUCCEEDED:
+        response['user'] = PublicUserSerializer(job.user).data
+    return Response(response)